@@ -0,0 +1,139 @@
+"""
+回答の保存形式
+回答を「質問ごとに1バイトの選択肢インデックス」を並べた固定長のバイト列にして保存し、
+質問文・カテゴリー名などは読み出し時に現在の質問データ（modules/questions.py）から復元する
+
+バイト列の並びは質問バンクのバージョンごとに決まる。質問を追加・削除・並べ替えても、
+古いバージョンの並びを登録しておけば以前に保存した回答をそのまま読める。
+"""
+
+import hashlib
+
+from modules.questions import CATEGORIES, QUESTIONS
+from modules.scoring import answers_to_dict, as_choice_index
+
+# 未回答を表すバイト値
+UNANSWERED_BYTE = 0xFF
+
+# 保存済みの answers で未回答を表す値
+_UNANSWERED_VALUES = (None, "選択されていません")
+
+# 診断結果ページが保存する answers の並び（カテゴリー, カテゴリー名, 番号, 質問ID, 質問文）
+ANSWER_LAYOUT = []
+for _category_key, _category_name in CATEGORIES.items():
+    for _question in QUESTIONS.get(_category_key, []):
+        ANSWER_LAYOUT.append((
+            _category_key, _category_name, len(ANSWER_LAYOUT) + 1,
+            _question["id"], _question["text"]
+        ))
+
+# 現在の質問バンクでのバイト列の並び
+QUESTION_BANK_IDS = tuple(question_id for _, _, _, question_id, _ in ANSWER_LAYOUT)
+
+# 質問バンクのバージョン（質問の並び・質問文・選択肢が変わると変わる）
+QUESTION_BANK_VERSION = hashlib.sha1(repr([
+    (category_key, question["id"], question["text"], [choice["text"] for choice in question["choices"]])
+    for category_key in CATEGORIES
+    for question in QUESTIONS.get(category_key, [])
+]).encode("utf-8")).hexdigest()[:12]
+
+# 質問バンクのバージョン -> バイト列の並び
+_LAYOUTS = {QUESTION_BANK_VERSION: QUESTION_BANK_IDS}
+
+
+def register_question_bank(version, question_ids):
+    """
+    過去の質問バンクのバイト列の並びを登録
+
+    Args:
+        version (str): 質問バンクのバージョン
+        question_ids (list): バイト列の並び（質問IDのリスト）
+    """
+    _LAYOUTS[version] = tuple(question_ids)
+
+
+def encode_answers(answers):
+    """
+    回答を現在の質問バンクの並びのバイト列に変換
+
+    Args:
+        answers: 回答辞書、または診断データの answers
+
+    Returns:
+        bytes: 質問ごとに1バイトの選択肢インデックス（未回答は UNANSWERED_BYTE）
+    """
+    answers = answers_to_dict(answers)
+    encoded = bytearray(len(QUESTION_BANK_IDS))
+    for position, question_id in enumerate(QUESTION_BANK_IDS):
+        choice = as_choice_index(answers.get(question_id))
+        encoded[position] = choice if choice is not None and 0 <= choice < UNANSWERED_BYTE else UNANSWERED_BYTE
+    return bytes(encoded)
+
+
+def encode_answers_exact(answers):
+    """
+    回答をバイト列に変換し、バイト列から元の回答をすべて復元できる場合だけ返す
+
+    現在の質問バンクにない質問への回答や、選択肢番号として保存できない回答が
+    含まれる場合は None を返す（回答JSONを消すと失われるため）。
+
+    Args:
+        answers: 回答辞書、または診断データの answers
+
+    Returns:
+        bytes: encode_answers と同じバイト列（復元できない場合はNone）
+    """
+    answers = answers_to_dict(answers)
+    blob = encode_answers(answers)
+    answered = {
+        question_id: choice
+        for question_id, choice in answers.items()
+        if choice not in _UNANSWERED_VALUES
+    }
+    if decode_answers(blob) != answered:
+        return None
+    return blob
+
+
+def decode_answers(blob, version=QUESTION_BANK_VERSION):
+    """
+    バイト列を回答辞書に変換
+
+    Args:
+        blob (bytes): encode_answers で作ったバイト列
+        version (str): 保存時の質問バンクのバージョン
+
+    Returns:
+        dict: 質問IDをキー、選択肢インデックスを値とする辞書
+
+    Raises:
+        KeyError: 質問バンクのバージョンが登録されていない場合
+    """
+    return {
+        question_id: choice
+        for question_id, choice in zip(_LAYOUTS[version], blob)
+        if choice != UNANSWERED_BYTE
+    }
+
+
+def rehydrate_answers(answers):
+    """
+    回答辞書を診断結果ページが保存していた answers の形式に戻す
+
+    Args:
+        answers (dict): 質問IDをキー、選択肢インデックスを値とする辞書
+
+    Returns:
+        list: 質問ごとの辞書（category, category_name, number, question_id, question, answer）
+    """
+    return [
+        {
+            "category": category_key,
+            "category_name": category_name,
+            "number": number,
+            "question_id": question_id,
+            "question": text,
+            "answer": answers.get(question_id, "選択されていません")
+        }
+        for category_key, category_name, number, question_id, text in ANSWER_LAYOUT
+    ]
@@ -0,0 +1,36 @@
+"""
+古い診断のアーカイブ
+指定した日数より前の診断を月別のアーカイブファイル（data/archive/diagnoses_YYYY-MM.db）に移し、
+ホットDBを VACUUM して小さく保つ。アーカイブ済みの診断も履歴の問い合わせから引き続き読める。
+
+使い方:
+    python -m modules.archive --db data/diagnoses.db --older-than-days 365
+"""
+
+import argparse
+import time
+
+from modules.database import ARCHIVE_AFTER_DAYS, DiagnosisDatabase
+
+
+def main(argv=None):
+    """コマンドラインからアーカイブを実行"""
+    parser = argparse.ArgumentParser(description="古い診断を月別のアーカイブファイルに移します")
+    parser.add_argument("--db", default="data/diagnoses.db", help="データベースファイルのパス")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="この日数より前の診断をアーカイブする")
+    parser.add_argument("--no-vacuum", action="store_true", help="移動後に VACUUM しない")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    count = DiagnosisDatabase(args.db).archive_diagnoses(
+        older_than_days=args.older_than_days,
+        vacuum=not args.no_vacuum,
+        progress=lambda month, n: print(f"  {month}: {n}件", flush=True)
+    )
+    elapsed = time.perf_counter() - started
+    print(f"完了: {count}件をアーカイブしました（{elapsed:.1f}秒）")
+
+
+if __name__ == "__main__":
+    main()
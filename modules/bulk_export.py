@@ -0,0 +1,189 @@
+"""
+診断履歴の一括エクスポート
+データベース全体（アーカイブ済みの診断を含む）を NDJSON または CSV で1行ずつ書き出す。
+DiagnosisDatabase.iter_diagnoses で fetchmany しながら読むので、件数によらずメモリ使用量は一定
+
+NDJSON の各行は ReportExporter.export_to_json と同じ項目の診断1件で、modules.importer でそのまま取り込める。
+CSV は1行1診断で、カテゴリー別スコアと質問ごとの選択肢インデックスを列に展開する（未回答は空欄）。
+
+使い方:
+    python -m modules.bulk_export --db data/diagnoses.db --format ndjson -o exports/diagnoses.ndjson
+    python -m modules.bulk_export --db data/diagnoses.db --format csv > diagnoses.csv
+"""
+
+import argparse
+import codecs
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime
+
+from modules.answer_codec import QUESTION_BANK_IDS
+from modules.database import DiagnosisDatabase
+from modules.questions import CATEGORIES
+from modules.scoring import CATEGORY_KEYS
+
+# 出力形式 -> MIMEタイプ
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+# CSV の見出し行
+CSV_HEADER = (
+    ['ID', '診断日', '施設名', '総合スコア', '満点', '達成率', 'ランク', 'セッションID', 'ユーザーID']
+    + [CATEGORIES.get(category, category) for category in CATEGORY_KEYS]
+    + list(QUESTION_BANK_IDS)
+)
+
+
+def _json_default(obj):
+    """json.dumps で変換できない値（datetime）をISO形式の文字列にする"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"JSONに変換できない値です: {type(obj).__name__}")
+
+
+def iter_ndjson_lines(db, batch_size=1000, include_archives=True):
+    """
+    全ての診断を NDJSON の行として1行ずつ返す
+
+    Args:
+        db (DiagnosisDatabase): 対象データベース
+        batch_size (int): 1回の fetchmany で読む件数
+        include_archives (bool): アーカイブ済みの診断も含めるかどうか
+
+    Yields:
+        str: 診断1件のJSON（末尾に改行）
+    """
+    for record in db.iter_diagnoses(batch_size=batch_size, include_archives=include_archives):
+        yield json.dumps(dict(record), ensure_ascii=False, default=_json_default) + '\n'
+
+
+def iter_csv_lines(db, batch_size=1000, include_archives=True):
+    """
+    全ての診断を CSV の行として1行ずつ返す（最初の行は見出し）
+
+    Args:
+        db (DiagnosisDatabase): 対象データベース
+        batch_size (int): 1回の fetchmany で読む件数
+        include_archives (bool): アーカイブ済みの診断も含めるかどうか
+
+    Yields:
+        str: CSV の1行（末尾に改行）
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def to_line(row):
+        writer.writerow(row)
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    yield to_line(CSV_HEADER)
+
+    for record in db.iter_diagnoses(batch_size=batch_size, include_archives=include_archives):
+        scores = record.category_scores
+        choices = record.choices
+        diagnosis_date = record.diagnosis_date
+        yield to_line(
+            [
+                record.id,
+                diagnosis_date.strftime('%Y-%m-%d %H:%M:%S') if diagnosis_date else '',
+                record.facility_name or '',
+                record.total_score,
+                record.max_score,
+                record.percentage,
+                record.rank,
+                record.session_id or '',
+                record.user_id or ''
+            ]
+            + [scores.get(category, '') for category in CATEGORY_KEYS]
+            + [choices.get(question_id, '') for question_id in QUESTION_BANK_IDS]
+        )
+
+
+def iter_export_lines(db, export_format, batch_size=1000, include_archives=True):
+    """
+    指定した形式の行を1行ずつ返す
+
+    Args:
+        db (DiagnosisDatabase): 対象データベース
+        export_format (str): 'ndjson' または 'csv'
+        batch_size (int): 1回の fetchmany で読む件数
+        include_archives (bool): アーカイブ済みの診断も含めるかどうか
+
+    Yields:
+        str: 1行分の文字列
+    """
+    if export_format == 'ndjson':
+        return iter_ndjson_lines(db, batch_size, include_archives)
+    if export_format == 'csv':
+        return iter_csv_lines(db, batch_size, include_archives)
+    raise ValueError(f"対応していない出力形式です: {export_format}")
+
+
+def write_export(db, fp, export_format, batch_size=1000, include_archives=True, progress=None):
+    """
+    全ての診断をバイナリファイルに書き出す
+
+    CSV は Excel で文字化けしないように BOM 付きの UTF-8 で書く。
+
+    Args:
+        db (DiagnosisDatabase): 対象データベース
+        fp: バイナリモードで開いたファイル
+        export_format (str): 'ndjson' または 'csv'
+        batch_size (int): 1回の fetchmany で読む件数
+        include_archives (bool): アーカイブ済みの診断も含めるかどうか
+        progress (callable): batch_size 件ごとに累計件数を渡されるコールバック（オプション）
+
+    Returns:
+        int: 書き出した診断の件数
+    """
+    lines = iter_export_lines(db, export_format, batch_size, include_archives)
+    if export_format == 'csv':
+        fp.write(codecs.BOM_UTF8)
+        fp.write(next(lines).encode('utf-8'))
+
+    count = 0
+    for line in lines:
+        fp.write(line.encode('utf-8'))
+        count += 1
+        if progress and count % batch_size == 0:
+            progress(count)
+    return count
+
+
+def main(argv=None):
+    """コマンドラインから一括エクスポートを実行"""
+    parser = argparse.ArgumentParser(description="全ての診断を NDJSON / CSV で書き出します")
+    parser.add_argument("--db", default="data/diagnoses.db", help="データベースファイルのパス")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson", help="出力形式")
+    parser.add_argument("-o", "--output", default="-", help="出力ファイル（省略時は標準出力）")
+    parser.add_argument("--batch-size", type=int, default=1000, help="1回の fetchmany で読む件数")
+    parser.add_argument("--no-archives", action="store_true", help="アーカイブ済みの診断を含めない")
+    args = parser.parse_args(argv)
+
+    db = DiagnosisDatabase(args.db)
+    # 標準出力にデータを書く場合があるので、進捗は標準エラーに出す
+    progress = lambda n: print(f"  {n}件 書き出し済み", file=sys.stderr, flush=True)
+
+    started = time.perf_counter()
+    if args.output == "-":
+        count = write_export(db, sys.stdout.buffer, args.format, args.batch_size,
+                             not args.no_archives, progress)
+        sys.stdout.buffer.flush()
+    else:
+        with open(args.output, "wb") as fp:
+            count = write_export(db, fp, args.format, args.batch_size,
+                                 not args.no_archives, progress)
+    elapsed = time.perf_counter() - started
+    print(f"完了: {count}件を書き出しました（{elapsed:.1f}秒）", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
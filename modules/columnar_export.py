@@ -0,0 +1,290 @@
+"""
+診断履歴の列指向エクスポート
+全ての診断を Parquet（または Arrow IPC）のデータセットとして月ごとに分けて書き出す。
+カテゴリー別スコア（score_<カテゴリー>）と質問ごとの選択肢インデックス（質問ID、未回答はnull）を
+型付きの列に展開するので、分析側でJSONを解析せずに pandas へ読み込める。
+
+書き出し先の構成:
+    exports/diagnoses/month=2024-03/part-0.parquet
+    exports/diagnoses/month=2024-04/part-0.parquet
+    ...
+
+使い方:
+    python -m modules.columnar_export --db data/diagnoses.db --output exports/diagnoses
+    python -m modules.columnar_export --format arrow --output exports/diagnoses_arrow
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from modules.database import DiagnosisDatabase
+from modules.scoring import CATEGORY_KEYS, QUESTION_IDS, UNANSWERED, answers_to_choice_matrix
+
+# 出力形式 -> pyarrow.dataset の形式名
+DATASET_FORMATS = {
+    'parquet': 'parquet',
+    'arrow': 'ipc'
+}
+
+# パーティションの列（'YYYY-MM'）
+PARTITIONING = ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+
+# エクスポートするデータセットのスキーマ
+DIAGNOSIS_SCHEMA = pa.schema(
+    [
+        ('id', pa.int64()),
+        ('diagnosis_date', pa.timestamp('s')),
+        ('facility_name', pa.string()),
+        ('total_score', pa.int16()),
+        ('max_score', pa.int16()),
+        ('percentage', pa.float64()),
+        ('rank', pa.string()),
+        ('session_id', pa.string()),
+        ('user_id', pa.string()),
+        ('created_at', pa.timestamp('s')),
+        ('scoring_version', pa.string()),
+    ]
+    + [(f'score_{category}', pa.int16()) for category in CATEGORY_KEYS]
+    + [(question_id, pa.int8()) for question_id in QUESTION_IDS]
+    + [('month', pa.string())]
+)
+
+# 履歴一覧（DiagnosisSummary）のスキーマ
+SUMMARY_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('diagnosis_date', pa.timestamp('s')),
+    ('facility_name', pa.string()),
+    ('total_score', pa.int16()),
+    ('max_score', pa.int16()),
+    ('percentage', pa.float64()),
+    ('rank', pa.string()),
+])
+
+
+def records_to_batch(records):
+    """
+    DiagnosisRecord のリストを DIAGNOSIS_SCHEMA の RecordBatch に変換
+
+    Args:
+        records (list): DiagnosisRecord のリスト
+
+    Returns:
+        pyarrow.RecordBatch: 1件1行のバッチ
+    """
+    diagnosis_dates = [record.diagnosis_date for record in records]
+    columns = [
+        [record.id for record in records],
+        diagnosis_dates,
+        [record.facility_name or '' for record in records],
+        [record.total_score for record in records],
+        [record.max_score for record in records],
+        [record.percentage for record in records],
+        [record.rank for record in records],
+        [record.session_id or '' for record in records],
+        [record.user_id or '' for record in records],
+        [record.created_at for record in records],
+        [record.scoring_version for record in records],
+    ]
+
+    # カテゴリー別スコア（診断にないカテゴリーはnull）
+    category_index = {category: i for i, category in enumerate(CATEGORY_KEYS)}
+    scores = np.zeros((len(records), len(CATEGORY_KEYS)), dtype=np.int16)
+    present = np.zeros(scores.shape, dtype=bool)
+    for row, record in enumerate(records):
+        for name, score in record.category_scores.items():
+            column = category_index.get(name)
+            if column is not None:
+                scores[row, column] = score
+                present[row, column] = True
+
+    # 選択肢インデックス（未回答はnull）
+    choices = answers_to_choice_matrix([record.choices for record in records])
+
+    arrays = [pa.array(values, type=field.type) for values, field in zip(columns, DIAGNOSIS_SCHEMA)]
+    arrays += [
+        pa.array(scores[:, i], type=pa.int16(), mask=~present[:, i])
+        for i in range(len(CATEGORY_KEYS))
+    ]
+    arrays += [
+        pa.array(choices[:, i].astype(np.int8), type=pa.int8(), mask=choices[:, i] == UNANSWERED)
+        for i in range(len(QUESTION_IDS))
+    ]
+    arrays.append(pa.array(
+        [date.strftime('%Y-%m') if date else None for date in diagnosis_dates],
+        type=pa.string()
+    ))
+    return pa.RecordBatch.from_arrays(arrays, schema=DIAGNOSIS_SCHEMA)
+
+
+def iter_record_batches(db, batch_size=10000, include_archives=True):
+    """
+    全ての診断を batch_size 件ずつの RecordBatch として返す
+
+    Args:
+        db (DiagnosisDatabase): 対象データベース
+        batch_size (int): 1バッチの件数
+        include_archives (bool): アーカイブ済みの診断も含めるかどうか
+
+    Yields:
+        pyarrow.RecordBatch: DIAGNOSIS_SCHEMA のバッチ
+    """
+    records = []
+    for record in db.iter_diagnoses(batch_size=batch_size, include_archives=include_archives):
+        records.append(record)
+        if len(records) >= batch_size:
+            yield records_to_batch(records)
+            records = []
+    if records:
+        yield records_to_batch(records)
+
+
+def export_dataset(db, output_dir, export_format='parquet', batch_size=10000,
+                   include_archives=True, progress=None):
+    """
+    全ての診断を月ごとに分けたデータセットとして書き出す
+
+    既にある月のディレクトリは書き直す（書き出した月以外のファイルは残す）。
+
+    Args:
+        db (DiagnosisDatabase): 対象データベース
+        output_dir (str): 書き出し先のディレクトリ
+        export_format (str): 'parquet' または 'arrow'
+        batch_size (int): 1バッチの件数
+        include_archives (bool): アーカイブ済みの診断も含めるかどうか
+        progress (callable): バッチごとに累計件数を渡されるコールバック（オプション）
+
+    Returns:
+        int: 書き出した診断の件数
+    """
+    if export_format not in DATASET_FORMATS:
+        raise ValueError(f"対応していない出力形式です: {export_format}")
+
+    count = 0
+
+    def batches():
+        nonlocal count
+        for batch in iter_record_batches(db, batch_size, include_archives):
+            count += batch.num_rows
+            yield batch
+            if progress:
+                progress(count)
+
+    ds.write_dataset(
+        batches(),
+        output_dir,
+        schema=DIAGNOSIS_SCHEMA,
+        format=DATASET_FORMATS[export_format],
+        partitioning=PARTITIONING,
+        basename_template=f"part-{{i}}.{export_format}",
+        existing_data_behavior='delete_matching',
+        min_rows_per_group=min(batch_size, 100000),
+        max_rows_per_group=max(batch_size, 100000)
+    )
+    return count
+
+
+def load_dataframe(output_dir, export_format='parquet', date_from=None, date_to=None, columns=None):
+    """
+    export_dataset で書き出したデータセットを pandas の DataFrame として読み込む
+
+    期間を指定した場合は、対象の月のファイルだけを読む。
+
+    Args:
+        output_dir (str): export_dataset の書き出し先
+        export_format (str): 'parquet' または 'arrow'
+        date_from (date): この日以降（オプション）
+        date_to (date): この日以前（その日を含む、オプション）
+        columns (list): 読み込む列（省略時は全列）
+
+    Returns:
+        pandas.DataFrame: 1件1行のデータフレーム
+    """
+    dataset = ds.dataset(output_dir, format=DATASET_FORMATS[export_format], partitioning=PARTITIONING)
+
+    conditions = []
+    if date_from is not None:
+        conditions.append(ds.field('month') >= date_from.strftime('%Y-%m'))
+        conditions.append(ds.field('diagnosis_date') >= pa.scalar(
+            np.datetime64(date_from, 's'), type=pa.timestamp('s')
+        ))
+    if date_to is not None:
+        conditions.append(ds.field('month') <= date_to.strftime('%Y-%m'))
+        conditions.append(ds.field('diagnosis_date') < pa.scalar(
+            np.datetime64(date_to, 's') + np.timedelta64(1, 'D'), type=pa.timestamp('s')
+        ))
+
+    filter_expression = None
+    for condition in conditions:
+        filter_expression = condition if filter_expression is None else filter_expression & condition
+
+    table = dataset.to_table(columns=columns, filter=filter_expression)
+    return table.to_pandas()
+
+
+def summaries_to_table(summaries):
+    """
+    履歴一覧（DiagnosisSummary のリスト）を列ごとに Arrow のテーブルに変換
+
+    Args:
+        summaries (list): DiagnosisDatabase.list_diagnoses が返す DiagnosisSummary のリスト
+
+    Returns:
+        pyarrow.Table: SUMMARY_SCHEMA のテーブル（table.to_pandas() で DataFrame にできる）
+    """
+    columns = list(zip(*summaries)) or [()] * len(SUMMARY_SCHEMA)
+    return pa.Table.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, SUMMARY_SCHEMA)],
+        schema=SUMMARY_SCHEMA
+    )
+
+
+def format_summary_table(table):
+    """
+    履歴一覧のテーブルを表示用の DataFrame に変換（行ごとではなく列ごとに整形する）
+
+    Args:
+        table (pyarrow.Table): summaries_to_table の戻り値
+
+    Returns:
+        pandas.DataFrame: 表示用のデータフレーム
+    """
+    df = table.to_pandas()
+    return df.assign(
+        診断日時=df['diagnosis_date'].dt.strftime('%Y-%m-%d %H:%M'),
+        施設名=df['facility_name'].fillna('').replace('', '（未入力）'),
+        総合スコア=df['total_score'].astype(str) + '/' + df['max_score'].astype(str),
+        達成率=df['percentage'].map('{:.1f}%'.format),
+    ).rename(columns={'id': 'ID', 'rank': 'ランク'})[
+        ['ID', '診断日時', '施設名', '総合スコア', '達成率', 'ランク']
+    ]
+
+
+def main(argv=None):
+    """コマンドラインから列指向エクスポートを実行"""
+    parser = argparse.ArgumentParser(description="全ての診断を月別の Parquet / Arrow データセットに書き出します")
+    parser.add_argument("--db", default="data/diagnoses.db", help="データベースファイルのパス")
+    parser.add_argument("--output", default="exports/diagnoses", help="書き出し先のディレクトリ")
+    parser.add_argument("--format", choices=sorted(DATASET_FORMATS), default="parquet", help="出力形式")
+    parser.add_argument("--batch-size", type=int, default=10000, help="1バッチの件数")
+    parser.add_argument("--no-archives", action="store_true", help="アーカイブ済みの診断を含めない")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    count = export_dataset(
+        DiagnosisDatabase(args.db),
+        args.output,
+        export_format=args.format,
+        batch_size=args.batch_size,
+        include_archives=not args.no_archives,
+        progress=lambda n: print(f"  {n}件 書き出し済み", flush=True)
+    )
+    elapsed = time.perf_counter() - started
+    print(f"完了: {count}件を {args.output} に書き出しました（{elapsed:.1f}秒）")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,416 @@
 SQLiteを使用して診断結果を保存・取得
 """
 
+import atexit
+import calendar
+import os
+import queue
+import re
 import sqlite3
 import json
-from datetime import datetime
+import logging
+import threading
+import time
+from collections import namedtuple
+from collections.abc import MutableMapping
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+from modules.answer_codec import (
+    QUESTION_BANK_IDS,
+    QUESTION_BANK_VERSION,
+    decode_answers,
+    encode_answers,
+    encode_answers_exact,
+    register_question_bank,
+    rehydrate_answers
+)
+from modules.scoring import (
+    MAX_SCORE,
+    QUESTION_IDS,
+    SCORE_MATRIX,
+    SCORING_VERSION,
+    UNANSWERED,
+    answers_to_choice_matrix,
+    answers_to_dict,
+    build_category_entry,
+    percentile_from_counts
+)
+
+logger = logging.getLogger(__name__)
+
+# 接続ごとに設定するPRAGMA（journal_mode=WAL はファイルに保存されるので初期化時に1回だけ設定）
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",      # 約16MBのページキャッシュ
+    "PRAGMA mmap_size = 268435456",    # 256MBまでメモリマップで読む
+    "PRAGMA temp_store = MEMORY",
+)
+
+# ロック待ちの上限（ミリ秒）
+BUSY_TIMEOUT_MS = 5000
+
+# プールに保持しておく未使用接続の上限（DBファイルごと）
+MAX_IDLE_CONNECTIONS = 8
+
+# 正規化テーブルの移行で、初期化時にその場で処理する件数の上限（超える場合は modules.migrate で実行）
+INLINE_BACKFILL_LIMIT = 10000
+
+# この日数より古い診断を月別のアーカイブファイルに移す（modules.archive の既定値）
+ARCHIVE_AFTER_DAYS = 365
+
+# アーカイブファイルを置くディレクトリ（DBファイルと同じ場所からの相対パス）
+ARCHIVE_DIRECTORY = 'archive'
+
+# バックグラウンド書き込み: 1トランザクションにまとめる待ち時間（秒）・件数の上限・キューの上限
+WRITER_BATCH_WINDOW = 0.005
+WRITER_MAX_BATCH = 500
+WRITER_QUEUE_SIZE = 1000
+
+# 論理削除した診断の物理削除: 1トランザクションの件数とトランザクションの間に待つ秒数
+PURGE_CHUNK_SIZE = 500
+PURGE_PAUSE = 0.05
+
+# 履歴の範囲の絞り込みで、範囲の索引で1行読む（表を引いて並べ替える）コストと、
+# 日付順の索引で1行判定するコストの比（20万件で実測して約20）
+RANGE_INDEX_COST_RATIO = 20
+
+# 集計テーブル category_score_buckets のカテゴリースコアの刻み（点）
+SUMMARY_BUCKET_WIDTH = 10
+
+
+# 履歴一覧用の軽量レコード（JSONを含まない要約列だけ）
+DiagnosisSummary = namedtuple(
+    'DiagnosisSummary',
+    ['id', 'diagnosis_date', 'facility_name', 'total_score', 'max_score', 'percentage', 'rank']
+)
+
+
+class MigrationPendingError(RuntimeError):
+    """正規化テーブルへの移行が終わっておらず、索引を使う集計が一部の診断しか含まない"""
+
+
+# エポック秒 ⇔ datetime の変換の基準（タイムゾーンなしの日時はそのままの壁時計時刻として扱う）
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_epoch(value):
+    """datetime をエポック秒（整数）に変換"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return calendar.timegm(value.timetuple())
+
+
+def _from_epoch(seconds):
+    """エポック秒（整数）を datetime に変換"""
+    if seconds is None:
+        return None
+    return _EPOCH + timedelta(seconds=seconds)
+
+
+def _stored_answers(answers_json, answers_blob, question_bank_version):
+    """保存済みの回答（バイト列、または移行前のJSON）を回答辞書に変換"""
+    if answers_blob is not None:
+        return decode_answers(answers_blob, question_bank_version)
+    return answers_to_dict(json.loads(answers_json))
+
+
+# 履歴一覧（DiagnosisSummary）で読む列
+_SUMMARY_COLUMNS = (
+    'id, diagnosis_date, diagnosis_ts, facility_name, '
+    'total_score, max_score, percentage, rank'
+)
+
+# DiagnosisRecord を作るときに SELECT する列（DiagnosisRecord の引数と同じ順序）
+_RECORD_COLUMNS = (
+    'id, facility_name, diagnosis_ts, total_score, max_score, percentage, rank, '
+    'categories_json, answers_json, answers_blob, question_bank_version, '
+    'session_id, user_id, created_ts, scoring_version'
+)
+
+
+# カテゴリー名のタプル（同じ並びのタプルは全件で共有する）
+_CATEGORY_NAME_TUPLES = {}
+
+# (カテゴリー名, スコア) -> build_category_entry がスコアから作る項目
+_CATEGORY_ENTRIES = {}
+
+
+def _compact_categories(categories_json):
+    """
+    categories_json を (カテゴリー名のタプル, スコアのタプル, 平均との差のタプル) に変換
+    
+    percentage と comment は build_category_entry がスコアから作るものと同じなので持たない。
+    そうでないデータ（手で編集したものなど）は、変換せずにデコードしたリストを返す。
+    """
+    categories = json.loads(categories_json)
+    try:
+        names = tuple([cat['name'] for cat in categories])
+        scores = tuple([cat['score'] for cat in categories])
+        diffs = tuple([cat['diff'] for cat in categories])
+        for name, score, cat in zip(names, scores, categories):
+            if type(score) is not int:
+                return categories
+            entry = _CATEGORY_ENTRIES.get((name, score))
+            if entry is None:
+                entry = _CATEGORY_ENTRIES[(name, score)] = build_category_entry(name, score, None)
+            if len(cat) != 5 or cat['percentage'] != entry['percentage'] or cat['comment'] != entry['comment']:
+                return categories
+    except (KeyError, TypeError):
+        return categories
+    return _CATEGORY_NAME_TUPLES.setdefault(names, names), scores, diffs
+
+
+class DiagnosisRecord(MutableMapping):
+    """
+    保存済みの診断1件
+    
+    categories は読み込み時にスコアと平均との差のタプルだけにして持ち、参照のたびに
+    辞書のリストに戻す（スコア・差が変わらないので、変更しても保存はされない）。
+    回答のバイト列（answers）と日時は初めて参照したときに変換する。
+    これまでの辞書と同じように record['total_score'] や record.get(...) で読めて、
+    PDF生成などが追加するキーも保持できる。
+    
+    1件あたりのメモリは辞書のころの約5.9KBから約1.3KBで、1桁には届いていない。
+    残りの大半は施設名・セッションID・回答のバイト列などの列の値そのもの（約0.75KB）と、
+    このオブジェクト自体（約0.18KB）。
+    """
+    
+    __slots__ = (
+        'id', 'facility_name', 'diagnosis_ts', 'total_score', 'max_score',
+        'percentage', 'rank', 'answers_json', 'answers_blob',
+        'question_bank_version', 'session_id', 'user_id', 'created_ts', 'scoring_version',
+        '_categories', '_answers', '_extra'
+    )
+    
+    # 辞書として見せるキー（_row_to_dict が返していたものと同じ）
+    KEYS = (
+        'id', 'facility_name', 'diagnosis_date', 'total_score', 'max_score',
+        'percentage', 'rank', 'categories', 'answers', 'session_id', 'user_id',
+        'created_at', 'scoring_version'
+    )
+    _KEY_SET = frozenset(KEYS)
+    
+    def __init__(self, id, facility_name, diagnosis_ts, total_score, max_score,
+                 percentage, rank, categories_json, answers_json, answers_blob,
+                 question_bank_version, session_id, user_id, created_ts, scoring_version):
+        self.id = id
+        self.facility_name = facility_name
+        self.diagnosis_ts = diagnosis_ts
+        self.total_score = total_score
+        self.max_score = max_score
+        self.percentage = percentage
+        self.rank = rank
+        self._categories = _compact_categories(categories_json)
+        self.answers_json = answers_json
+        self.answers_blob = answers_blob
+        self.question_bank_version = question_bank_version
+        self.session_id = session_id
+        self.user_id = user_id
+        self.created_ts = created_ts
+        self.scoring_version = scoring_version
+        self._answers = None
+        self._extra = None
+    
+    @property
+    def diagnosis_date(self):
+        return _from_epoch(self.diagnosis_ts)
+    
+    @property
+    def created_at(self):
+        return _from_epoch(self.created_ts)
+    
+    @property
+    def categories(self):
+        if type(self._categories) is not tuple:
+            return self._categories
+        return [
+            build_category_entry(name, score, diff)
+            for name, score, diff in zip(*self._categories)
+        ]
+    
+    @property
+    def category_scores(self):
+        """カテゴリー名 -> スコア。辞書のリストを作らないので categories より軽い"""
+        if type(self._categories) is not tuple:
+            return {cat['name']: cat['score'] for cat in self._categories}
+        names, scores, _ = self._categories
+        return dict(zip(names, scores))
+    
+    @property
+    def answers(self):
+        if self._answers is None:
+            if self.answers_blob is not None:
+                # 質問文などは現在の質問データから復元する
+                self._answers = rehydrate_answers(
+                    decode_answers(self.answers_blob, self.question_bank_version)
+                )
+            else:
+                self._answers = json.loads(self.answers_json)
+        return self._answers
+    
+    @property
+    def choices(self):
+        """回答辞書（質問ID -> 選択肢インデックス）。質問文などを復元しないので answers より軽い"""
+        return _stored_answers(self.answers_json, self.answers_blob, self.question_bank_version)
+    
+    def __getitem__(self, key):
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        if key in self._KEY_SET:
+            return getattr(self, key)
+        raise KeyError(key)
+    
+    def __setitem__(self, key, value):
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+    
+    def __delitem__(self, key):
+        if self._extra is None or key not in self._extra:
+            raise KeyError(key)
+        del self._extra[key]
+    
+    def __iter__(self):
+        yield from self.KEYS
+        if self._extra:
+            yield from (key for key in self._extra if key not in self._KEY_SET)
+    
+    def __len__(self):
+        return len(self.KEYS) + sum(1 for key in (self._extra or ()) if key not in self._KEY_SET)
+    
+    def __repr__(self):
+        return f"DiagnosisRecord(id={self.id!r}, total_score={self.total_score!r}, rank={self.rank!r})"
+
+
+class ConnectionPool:
+    """
+    DBファイルごとの接続プール（プロセス内の全スレッド・全セッションで共有）
+    
+    接続は使い終わるとプールに戻して再利用するため、接続ごとの
+    プリペアドステートメントのキャッシュが捨てられない。
+    sqlite3の接続は同時に1スレッドだけが使う（貸し出し中は他のスレッドに渡さない）。
+    """
+    
+    def __init__(self, db_path, max_idle=MAX_IDLE_CONNECTIONS):
+        """
+        初期化
+        
+        Args:
+            db_path (str): データベースファイルのパス
+            max_idle (int): 保持しておく未使用接続の上限
+        """
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+    
+    def acquire(self):
+        """接続を借りる（未使用の接続がなければ新しく作る）"""
+        with self._lock:
+            self._reset_after_fork()
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+    
+    def release(self, conn):
+        """接続を返す（上限を超える分は閉じる）"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._reset_after_fork()
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+    
+    def close_all(self):
+        """未使用の接続を全て閉じる"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+    
+    def _reset_after_fork(self):
+        """fork後の子プロセスでは親の接続を使わない"""
+        if self._pid != os.getpid():
+            self._idle = []
+            self._pid = os.getpid()
+    
+    def _connect(self):
+        """PRAGMAを設定した新しい接続を作る"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=256
+        )
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+
+# DBファイルのパス -> 接続プール（プロセス全体で共有）
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+# スキーマ初期化済みのDBファイル（プロセスごとに1回だけ初期化する）
+_INITIALIZED_PATHS = set()
+_INIT_LOCK = threading.Lock()
+
+# get_database が返す共有インスタンス
+_DATABASES = {}
+
+# DBファイルごとの物理削除スレッドと、実行中に追加で依頼があったDBファイル
+_PURGE_THREADS = {}
+_PURGE_REQUESTED = set()
+_PURGE_LOCK = threading.Lock()
+
+
+def get_connection_pool(db_path):
+    """
+    DBファイルの接続プールを取得（なければ作成）
+    
+    Args:
+        db_path (str): データベースファイルのパス
+    
+    Returns:
+        ConnectionPool: 接続プール
+    """
+    key = str(Path(db_path).resolve())
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = _POOLS[key] = ConnectionPool(db_path)
+        return pool
+
+
+def get_database(db_path="data/diagnoses.db"):
+    """
+    プロセス内で共有する DiagnosisDatabase を取得
+    
+    ページの再実行ごとにインスタンスを作り直さずに済む。
+    
+    Args:
+        db_path (str): データベースファイルのパス
+    
+    Returns:
+        DiagnosisDatabase: 共有インスタンス
+    """
+    key = str(Path(db_path).resolve())
+    with _POOLS_LOCK:
+        db = _DATABASES.get(key)
+    if db is None:
+        db = DiagnosisDatabase(db_path)
+        with _POOLS_LOCK:
+            db = _DATABASES.setdefault(key, db)
+    return db
+
+
 class DiagnosisDatabase:
     """診断履歴データベースクラス"""
     
@@ -20,7 +425,56 @@ class DiagnosisDatabase:
         """
         self.db_path = db_path
         self._ensure_data_directory()
-        self._init_database()
+        self._pool = get_connection_pool(db_path)
+        
+        # スキーマ初期化はプロセスごとに1回だけ
+        key = str(Path(db_path).resolve())
+        with _INIT_LOCK:
+            if key not in _INITIALIZED_PATHS:
+                self._init_database()
+                if self._count_pending('population_aggregates') <= INLINE_BACKFILL_LIMIT:
+                    self.backfill_population()
+                if self._count_pending('normalized_tables') <= INLINE_BACKFILL_LIMIT:
+                    self.backfill_normalized_tables()
+                if self._count_pending('archived_child_rows') <= INLINE_BACKFILL_LIMIT:
+                    self.backfill_archived_child_rows()
+                _INITIALIZED_PATHS.add(key)
+                
+                # 前のプロセスが物理削除し終えなかった診断があれば続きを削除する
+                with self._connection() as conn:
+                    pending_purge = conn.execute(
+                        'SELECT 1 FROM diagnoses WHERE deleted_at IS NOT NULL LIMIT 1'
+                    ).fetchone() is not None
+                if pending_purge:
+                    self.start_background_purge()
+    
+    @contextmanager
+    def _connection(self, write=False):
+        """
+        プールから接続を借りて、終わったら返す
+        
+        書き込みの場合は BEGIN IMMEDIATE で最初に書き込みロックを取り、
+        正常終了ならコミット、例外ならロールバックする。
+        
+        Args:
+            write (bool): 書き込みトランザクションかどうか
+        
+        Yields:
+            sqlite3.Connection: 接続
+        """
+        conn = self._pool.acquire()
+        try:
+            if write:
+                conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            if write:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._pool.release(conn)
     
     def _ensure_data_directory(self):
         """dataディレクトリが存在しない場合は作成"""
@@ -28,40 +482,828 @@ class DiagnosisDatabase:
     
     def _init_database(self):
         """データベーステーブルの初期化"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # WALモード（ファイルに保存される設定なので1回でよい）
+        with self._connection() as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+        
+        with self._connection(write=True) as conn:
+            cursor = conn.cursor()
+            
+            # 診断結果テーブル
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS diagnoses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    facility_name TEXT,
+                    diagnosis_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    total_score INTEGER NOT NULL,
+                    max_score INTEGER NOT NULL,
+                    percentage REAL NOT NULL,
+                    rank TEXT NOT NULL,
+                    categories_json TEXT NOT NULL,
+                    answers_json TEXT NOT NULL,
+                    session_id TEXT,
+                    user_id TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    scoring_version TEXT
+                )
+            ''')
+            
+            # 既存DBへのカラム追加（スコア表のバージョン）
+            columns = {row[1] for row in cursor.execute('PRAGMA table_info(diagnoses)')}
+            if 'scoring_version' not in columns:
+                cursor.execute('ALTER TABLE diagnoses ADD COLUMN scoring_version TEXT')
+            
+            # 既存DBへのカラム追加（日時のエポック秒。読み出し時に文字列を解析しなくて済む）
+            if 'diagnosis_ts' not in columns:
+                cursor.execute('ALTER TABLE diagnoses ADD COLUMN diagnosis_ts INTEGER')
+                cursor.execute('ALTER TABLE diagnoses ADD COLUMN created_ts INTEGER')
+                cursor.execute('''
+                    UPDATE diagnoses
+                    SET diagnosis_ts = CAST(strftime('%s', diagnosis_date) AS INTEGER),
+                        created_ts = CAST(strftime('%s', created_at) AS INTEGER)
+                ''')
+            
+            # 既存DBへのカラム追加（回答のバイト列と質問バンクのバージョン）
+            if 'answers_blob' not in columns:
+                cursor.execute('ALTER TABLE diagnoses ADD COLUMN answers_blob BLOB')
+                cursor.execute('ALTER TABLE diagnoses ADD COLUMN question_bank_version TEXT')
+            
+            # 既存DBへのカラム追加（論理削除の日時。NULLなら有効な診断）
+            if 'deleted_at' not in columns:
+                cursor.execute('ALTER TABLE diagnoses ADD COLUMN deleted_at INTEGER')
+            
+            # 論理削除された診断だけの部分索引（物理削除の対象を探す用。通常はほぼ空）
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_deleted_at
+                ON diagnoses(deleted_at) WHERE deleted_at IS NOT NULL
+            ''')
+            
+            # インデックス作成
+            # (diagnosis_date, id) の順に並べ、履歴一覧のキーセットページングを
+            # 追加ソートなしで索引だけで返せるようにする（旧定義は作り直す）。
+            # 点数・達成率も索引に含め、範囲で絞り込むときも表を読まずに判定する
+            if len(cursor.execute('PRAGMA index_info(idx_diagnosis_date)').fetchall()) != 4:
+                cursor.execute('DROP INDEX IF EXISTS idx_diagnosis_date')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_diagnosis_date 
+                ON diagnoses(diagnosis_date DESC, id DESC, total_score, percentage)
+            ''')
+            
+            # 履歴の絞り込み用: 一致条件の列の後ろに (diagnosis_date, id) を並べ、
+            # 条件に合う行を新しい順にそのまま索引から読めるようにする
+            if len(cursor.execute('PRAGMA index_info(idx_session_id)').fetchall()) == 1:
+                cursor.execute('DROP INDEX idx_session_id')
+            # 点数・達成率の範囲の索引は、該当する診断が少ない範囲のときだけ使う（_range_index）
+            for index_name, column in (
+                ('idx_session_id', 'session_id'),
+                ('idx_user_date', 'user_id'),
+                ('idx_facility_date', 'facility_name'),
+                ('idx_rank_date', 'rank'),
+                ('idx_score_date', 'total_score'),
+                ('idx_percentage_date', 'percentage'),
+            ):
+                cursor.execute(f'''
+                    CREATE INDEX IF NOT EXISTS {index_name}
+                    ON diagnoses({column}, diagnosis_date DESC, id DESC)
+                ''')
+            
+            # カテゴリー別スコアの集計テーブル（件数・合計・二乗和）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS category_stats (
+                    category TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    score_sum REAL NOT NULL DEFAULT 0,
+                    score_sum_sq REAL NOT NULL DEFAULT 0
+                )
+            ''')
+            
+            # スコア分布のヒストグラム（カテゴリー別と総合スコア、1点刻み）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS score_histogram (
+                    metric TEXT NOT NULL,
+                    score INTEGER NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (metric, score)
+                ) WITHOUT ROWID
+            ''')
+            
+            # 正規化テーブル: カテゴリー別スコア
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS diagnosis_categories (
+                    diagnosis_id INTEGER NOT NULL,
+                    category TEXT NOT NULL,
+                    score INTEGER NOT NULL,
+                    percentage REAL,
+                    PRIMARY KEY (diagnosis_id, category)
+                ) WITHOUT ROWID
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_categories_score
+                ON diagnosis_categories(category, score, diagnosis_id)
+            ''')
+            
+            # 正規化テーブル: 質問ごとの回答（選択肢インデックス）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS diagnosis_answers (
+                    diagnosis_id INTEGER NOT NULL,
+                    question_id TEXT NOT NULL,
+                    choice_index INTEGER NOT NULL,
+                    PRIMARY KEY (diagnosis_id, question_id)
+                ) WITHOUT ROWID
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_answers_choice
+                ON diagnosis_answers(question_id, choice_index, diagnosis_id)
+            ''')
+            
+            # 論理削除した診断の正規化テーブルの行を消す（以前は物理削除まで残していた）
+            for table in ('diagnosis_categories', 'diagnosis_answers'):
+                cursor.execute(f'''
+                    DELETE FROM {table} WHERE diagnosis_id IN (
+                        SELECT id FROM diagnoses WHERE deleted_at IS NOT NULL
+                    )
+                ''')
+            
+            # スコア表のバージョンごとの配点（回答テーブルと結合して点数を求める）。
+            # 配点の違うコードのプロセスが同じDBを使っても互いに書き換えないよう、バージョンごとに持つ
+            choice_columns = {row[1] for row in cursor.execute('PRAGMA table_info(question_choices)')}
+            if choice_columns and 'scoring_version' not in choice_columns:
+                cursor.execute('DROP TABLE question_choices')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS question_choices (
+                    scoring_version TEXT NOT NULL,
+                    question_id TEXT NOT NULL,
+                    choice_index INTEGER NOT NULL,
+                    score INTEGER NOT NULL,
+                    PRIMARY KEY (scoring_version, question_id, choice_index)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute(
+                'SELECT 1 FROM question_choices WHERE scoring_version = ? LIMIT 1', (SCORING_VERSION,)
+            )
+            if cursor.fetchone() is None:
+                cursor.executemany('''
+                    INSERT INTO question_choices (scoring_version, question_id, choice_index, score)
+                    VALUES (?, ?, ?, ?)
+                ''', [
+                    (SCORING_VERSION, question_id, choice_index, int(score))
+                    for question_id, row in zip(QUESTION_IDS, SCORE_MATRIX)
+                    for choice_index, score in enumerate(row[:UNANSWERED])
+                ])
+            
+            # 移行処理の進捗
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS migration_state (
+                    name TEXT PRIMARY KEY,
+                    last_id INTEGER NOT NULL DEFAULT 0,
+                    completed INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            cursor.executemany('''
+                INSERT OR IGNORE INTO migration_state (name, last_id, completed)
+                VALUES (?, 0, 0)
+            ''', [('normalized_tables',), ('compact_answers',), ('archived_child_rows',)])
+            
+            # 集計テーブル（category_stats, score_histogram）の集計し直し。
+            # 集計テーブルが空なのに診断がある場合（集計テーブルより前のDB）だけ、空にしてから
+            # backfill_population で既存の診断を足す。それ以外は集計済みとして記録する
+            if cursor.execute(
+                "SELECT 1 FROM migration_state WHERE name = 'population_aggregates'"
+            ).fetchone() is None:
+                population_missing = (
+                    (cursor.execute('SELECT 1 FROM category_stats LIMIT 1').fetchone() is None
+                     or cursor.execute('SELECT 1 FROM score_histogram LIMIT 1').fetchone() is None)
+                    and cursor.execute(
+                        'SELECT 1 FROM diagnoses WHERE deleted_at IS NULL LIMIT 1'
+                    ).fetchone() is not None
+                )
+                if population_missing:
+                    cursor.execute('DELETE FROM category_stats')
+                    cursor.execute('DELETE FROM score_histogram')
+                cursor.execute('''
+                    INSERT INTO migration_state (name, last_id, completed)
+                    VALUES ('population_aggregates', 0, ?)
+                ''', (0 if population_missing else 1,))
+            
+            # 質問バンクのバージョンごとの回答バイト列の並び
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS question_banks (
+                    version TEXT PRIMARY KEY,
+                    question_ids TEXT NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                INSERT OR IGNORE INTO question_banks (version, question_ids)
+                VALUES (?, ?)
+            ''', (QUESTION_BANK_VERSION, json.dumps(QUESTION_BANK_IDS)))
+            for version, question_ids in cursor.execute(
+                'SELECT version, question_ids FROM question_banks'
+            ).fetchall():
+                register_question_bank(version, json.loads(question_ids))
+            
+            # 月別アーカイブファイルの一覧（期間とIDの範囲で、問い合わせに必要なファイルだけを開く）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS archives (
+                    month TEXT PRIMARY KEY,
+                    start_ts INTEGER NOT NULL,
+                    end_ts INTEGER NOT NULL,
+                    min_id INTEGER,
+                    max_id INTEGER,
+                    row_count INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            
+            self._init_facility_search(cursor)
+            self._init_summary_tables(cursor)
+    
+    @staticmethod
+    def _create_trigger(cursor, name, definition):
+        """
+        トリガーを作る（定義を変えたときは既存DBのトリガーを作り直す）
+        
+        スキーマを変えると他の接続が準備済みの文を作り直すことになるので、
+        保存されている定義（sqlite_master.sql）と同じなら何もしない。
+        
+        Args:
+            cursor (sqlite3.Cursor): トランザクション中のカーソル
+            name (str): トリガー名
+            definition (str): CREATE TRIGGER <name> に続く定義
+        """
+        # sqlite_master には END までが保存される（末尾の空白は残らない）
+        sql = f'CREATE TRIGGER {name} {definition}'.rstrip()
+        stored = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)
+        ).fetchone()
+        if stored is not None and stored[0] == sql:
+            return
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(sql)
+    
+    @staticmethod
+    def _init_facility_search(cursor):
+        """
+        施設名検索用のテーブルとトリガーを作成
+        
+        facilities は施設名ごとの診断件数で、diagnoses のトリガーで更新する。
+        facilities_fts は facilities を元にした trigram の FTS5 索引で、日本語の部分一致に使う。
+        
+        Args:
+            cursor (sqlite3.Cursor): カーソル
+        """
+        created = cursor.execute('''
+            SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'facilities'
+        ''').fetchone()[0] == 0
         
-        # 診断結果テーブル
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS diagnoses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                facility_name TEXT,
-                diagnosis_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                total_score INTEGER NOT NULL,
-                max_score INTEGER NOT NULL,
-                percentage REAL NOT NULL,
-                rank TEXT NOT NULL,
-                categories_json TEXT NOT NULL,
-                answers_json TEXT NOT NULL,
-                session_id TEXT,
-                user_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            CREATE TABLE IF NOT EXISTS facilities (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE,
+                diagnosis_count INTEGER NOT NULL DEFAULT 0
             )
         ''')
-        
-        # インデックス作成
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_diagnosis_date 
-            ON diagnoses(diagnosis_date DESC)
+            CREATE VIRTUAL TABLE IF NOT EXISTS facilities_fts USING fts5(
+                name, content='facilities', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+        
+        # facilities -> facilities_fts
+        DiagnosisDatabase._create_trigger(cursor, 'facilities_ai', '''
+            AFTER INSERT ON facilities BEGIN
+                INSERT INTO facilities_fts (rowid, name) VALUES (new.id, new.name);
+            END
+        ''')
+        DiagnosisDatabase._create_trigger(cursor, 'facilities_ad', '''
+            AFTER DELETE ON facilities BEGIN
+                INSERT INTO facilities_fts (facilities_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            END
+        ''')
+        
+        # diagnoses.facility_name -> facilities（論理削除された診断は数えない）
+        add = '''
+            INSERT INTO facilities (name, diagnosis_count) VALUES (new.facility_name, 1)
+            ON CONFLICT(name) DO UPDATE SET diagnosis_count = diagnosis_count + 1;
+        '''
+        remove = '''
+            UPDATE facilities SET diagnosis_count = diagnosis_count - 1 WHERE name = old.facility_name;
+            DELETE FROM facilities WHERE name = old.facility_name AND diagnosis_count <= 0;
+        '''
+        DiagnosisDatabase._create_trigger(cursor, 'diagnoses_facility_ai', f'''
+            AFTER INSERT ON diagnoses
+            WHEN new.facility_name <> '' AND new.deleted_at IS NULL BEGIN
+                {add}
+            END
+        ''')
+        DiagnosisDatabase._create_trigger(cursor, 'diagnoses_facility_ad', f'''
+            AFTER DELETE ON diagnoses
+            WHEN old.facility_name <> '' AND old.deleted_at IS NULL BEGIN
+                {remove}
+            END
+        ''')
+        DiagnosisDatabase._create_trigger(cursor, 'diagnoses_facility_au', f'''
+            AFTER UPDATE OF facility_name ON diagnoses
+            WHEN new.facility_name IS NOT old.facility_name AND new.deleted_at IS NULL BEGIN
+                {remove}
+                INSERT INTO facilities (name, diagnosis_count)
+                SELECT new.facility_name, 1 WHERE new.facility_name <> ''
+                ON CONFLICT(name) DO UPDATE SET diagnosis_count = diagnosis_count + 1;
+            END
+        ''')
+        DiagnosisDatabase._create_trigger(cursor, 'diagnoses_facility_sd', f'''
+            AFTER UPDATE OF deleted_at ON diagnoses
+            WHEN old.deleted_at IS NULL AND new.deleted_at IS NOT NULL AND old.facility_name <> '' BEGIN
+                {remove}
+            END
         ''')
+        DiagnosisDatabase._create_trigger(cursor, 'diagnoses_facility_restore', f'''
+            AFTER UPDATE OF deleted_at ON diagnoses
+            WHEN old.deleted_at IS NOT NULL AND new.deleted_at IS NULL AND new.facility_name <> '' BEGIN
+                {add}
+            END
+        ''')
+        
+        # 既存DBでは作成時に今ある診断から作る
+        if created:
+            cursor.execute('''
+                INSERT INTO facilities (name, diagnosis_count)
+                SELECT facility_name, COUNT(*) FROM diagnoses
+                WHERE facility_name <> '' AND deleted_at IS NULL
+                GROUP BY facility_name
+            ''')
+    
+    @staticmethod
+    def _init_summary_tables(cursor):
+        """
+        ダッシュボード用の集計テーブルとトリガーを作成
+        
+        daily_summary は日・ランクごとの件数と総合スコア・達成率の合計、
+        category_score_buckets は月・カテゴリー・スコア帯（SUMMARY_BUCKET_WIDTH 点刻み）ごとの件数で、
+        どちらも diagnoses のトリガーで保存・削除・再採点と同じトランザクションで更新する。
+        
+        Args:
+            cursor (sqlite3.Cursor): カーソル
+        """
+        created = cursor.execute('''
+            SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'daily_summary'
+        ''').fetchone()[0] == 0
         
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_session_id 
-            ON diagnoses(session_id)
+            CREATE TABLE IF NOT EXISTS daily_summary (
+                day TEXT NOT NULL,
+                rank TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                score_sum INTEGER NOT NULL DEFAULT 0,
+                percentage_sum REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, rank)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS category_score_buckets (
+                month TEXT NOT NULL,
+                category TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (month, category, bucket)
+            ) WITHOUT ROWID
         ''')
         
-        conn.commit()
-        conn.close()
+        # 診断1件（new / old）を集計に足す・集計から引く文
+        def add(row):
+            return f'''
+                INSERT INTO daily_summary (day, rank, count, score_sum, percentage_sum)
+                VALUES (substr({row}.diagnosis_date, 1, 10), {row}.rank, 1, {row}.total_score, {row}.percentage)
+                ON CONFLICT(day, rank) DO UPDATE SET
+                    count = count + 1,
+                    score_sum = score_sum + excluded.score_sum,
+                    percentage_sum = percentage_sum + excluded.percentage_sum;
+                INSERT INTO category_score_buckets (month, category, bucket, count)
+                SELECT substr({row}.diagnosis_date, 1, 7),
+                       json_extract(value, '$.name'),
+                       CAST(json_extract(value, '$.score') AS INTEGER) / {SUMMARY_BUCKET_WIDTH} * {SUMMARY_BUCKET_WIDTH},
+                       1
+                FROM json_each({row}.categories_json) WHERE true
+                ON CONFLICT(month, category, bucket) DO UPDATE SET count = count + 1;
+            '''
+        
+        def remove(row):
+            return f'''
+                UPDATE daily_summary SET
+                    count = count - 1,
+                    score_sum = score_sum - {row}.total_score,
+                    percentage_sum = percentage_sum - {row}.percentage
+                WHERE day = substr({row}.diagnosis_date, 1, 10) AND rank = {row}.rank;
+                DELETE FROM daily_summary
+                WHERE day = substr({row}.diagnosis_date, 1, 10) AND rank = {row}.rank AND count <= 0;
+                UPDATE category_score_buckets SET count = count - 1
+                WHERE month = substr({row}.diagnosis_date, 1, 7)
+                  AND (category, bucket) IN (
+                      SELECT json_extract(value, '$.name'),
+                             CAST(json_extract(value, '$.score') AS INTEGER) / {SUMMARY_BUCKET_WIDTH} * {SUMMARY_BUCKET_WIDTH}
+                      FROM json_each({row}.categories_json)
+                  );
+                DELETE FROM category_score_buckets
+                WHERE month = substr({row}.diagnosis_date, 1, 7) AND count <= 0;
+            '''
+        
+        # 論理削除された診断は集計に含めない（論理削除・復元のときに引く・足す）
+        DiagnosisDatabase._create_trigger(cursor, 'diagnoses_summary_ai', f'''
+            AFTER INSERT ON diagnoses WHEN new.deleted_at IS NULL BEGIN
+                {add('new')}
+            END
+        ''')
+        DiagnosisDatabase._create_trigger(cursor, 'diagnoses_summary_ad', f'''
+            AFTER DELETE ON diagnoses WHEN old.deleted_at IS NULL BEGIN
+                {remove('old')}
+            END
+        ''')
+        DiagnosisDatabase._create_trigger(cursor, 'diagnoses_summary_au', f'''
+            AFTER UPDATE OF diagnosis_date, rank, total_score, percentage, categories_json ON diagnoses
+            WHEN new.deleted_at IS NULL BEGIN
+                {remove('old')}
+                {add('new')}
+            END
+        ''')
+        DiagnosisDatabase._create_trigger(cursor, 'diagnoses_summary_sd', f'''
+            AFTER UPDATE OF deleted_at ON diagnoses
+            WHEN old.deleted_at IS NULL AND new.deleted_at IS NOT NULL BEGIN
+                {remove('old')}
+            END
+        ''')
+        DiagnosisDatabase._create_trigger(cursor, 'diagnoses_summary_restore', f'''
+            AFTER UPDATE OF deleted_at ON diagnoses
+            WHEN old.deleted_at IS NOT NULL AND new.deleted_at IS NULL BEGIN
+                {add('new')}
+            END
+        ''')
+        
+        # 既存DBでは作成時に今ある診断から作る
+        if created:
+            DiagnosisDatabase._add_to_summaries(cursor, 'deleted_at IS NULL', ())
+    
+    @staticmethod
+    def _add_to_summaries(cursor, condition, params):
+        """
+        main.diagnoses のうち condition に合う診断をまとめて集計テーブルに足す
+        
+        Args:
+            cursor (sqlite3.Cursor): トランザクション中のカーソル
+            condition (str): diagnoses に対する WHERE の条件
+            params (tuple): 条件のパラメータ
+        """
+        cursor.execute(f'''
+            INSERT INTO main.daily_summary (day, rank, count, score_sum, percentage_sum)
+            SELECT substr(diagnosis_date, 1, 10), rank, COUNT(*), SUM(total_score), SUM(percentage)
+            FROM main.diagnoses
+            WHERE {condition}
+            GROUP BY 1, 2
+            ON CONFLICT(day, rank) DO UPDATE SET
+                count = count + excluded.count,
+                score_sum = score_sum + excluded.score_sum,
+                percentage_sum = percentage_sum + excluded.percentage_sum
+        ''', params)
+        cursor.execute(f'''
+            INSERT INTO main.category_score_buckets (month, category, bucket, count)
+            SELECT substr(d.diagnosis_date, 1, 7),
+                   json_extract(c.value, '$.name'),
+                   CAST(json_extract(c.value, '$.score') AS INTEGER) / {SUMMARY_BUCKET_WIDTH} * {SUMMARY_BUCKET_WIDTH},
+                   COUNT(*)
+            FROM main.diagnoses AS d, json_each(d.categories_json) AS c
+            WHERE {condition}
+            GROUP BY 1, 2, 3
+            ON CONFLICT(month, category, bucket) DO UPDATE SET
+                count = count + excluded.count
+        ''', params)
+    
+    def _count_pending(self, name):
+        """
+        移行処理が済んでいない診断の件数
+        
+        Args:
+            name (str): migration_state の移行処理名
+        
+        Returns:
+            int: 未処理の件数
+        """
+        with self._connection() as conn:
+            last_id, completed = conn.execute('''
+                SELECT last_id, completed FROM migration_state WHERE name = ?
+            ''', (name,)).fetchone()
+            if completed:
+                return 0
+            if name == 'archived_child_rows':
+                return conn.execute('SELECT COALESCE(SUM(row_count), 0) FROM archives').fetchone()[0]
+            return conn.execute(
+                'SELECT COUNT(*) FROM diagnoses WHERE id > ?', (last_id,)
+            ).fetchone()[0]
+    
+    def backfill_population(self, chunk_size=2000, progress=None):
+        """
+        既存の診断を集計テーブル（category_stats, score_histogram）に足す
+        
+        backfill_normalized_tables と同じく、チャンクごとの短いトランザクションで処理し、
+        進捗を migration_state に記録する。移行中は、保存・削除・再採点が
+        まだ足していない診断（ID が last_id より大きい診断）の分を集計テーブルに反映しないので、
+        各診断はこの移行で最終的なスコアが1回だけ足される。
+        
+        Args:
+            chunk_size (int): 1トランザクションあたりの診断件数
+            progress (callable): チャンク処理ごとに累計件数を渡されるコールバック（オプション）
+        
+        Returns:
+            int: 集計した診断の件数
+        """
+        total = 0
+        while True:
+            with self._connection(write=True) as conn:
+                cursor = conn.cursor()
+                last_id, completed = cursor.execute('''
+                    SELECT last_id, completed FROM migration_state WHERE name = 'population_aggregates'
+                ''').fetchone()
+                if completed:
+                    return total
+                
+                rows = cursor.execute('''
+                    SELECT id, categories_json, total_score, deleted_at
+                    FROM diagnoses
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, chunk_size)).fetchall()
+                
+                if not rows:
+                    cursor.execute('''
+                        UPDATE migration_state SET completed = 1 WHERE name = 'population_aggregates'
+                    ''')
+                    return total
+                
+                # 論理削除した診断は集計に含めない
+                delta = self._new_population_delta()
+                for _, categories_json, total_score, deleted_at in rows:
+                    if deleted_at is None:
+                        self._accumulate_population(delta, json.loads(categories_json), total_score, 1)
+                self._apply_population(cursor, delta)
+                cursor.execute('''
+                    UPDATE migration_state SET last_id = ? WHERE name = 'population_aggregates'
+                ''', (rows[-1][0],))
+            
+            total += len(rows)
+            if progress:
+                progress(total)
+    
+    @classmethod
+    def _require_population(cls, cursor):
+        """
+        集計テーブルが全診断分そろっていることを確認（途中の集計は返さずに例外にする）
+        
+        Args:
+            cursor (sqlite3.Cursor): カーソル
+        
+        Raises:
+            MigrationPendingError: backfill_population が終わっていない場合
+        """
+        if cls._population_counted_up_to(cursor) is not None:
+            raise MigrationPendingError(
+                "集計テーブルの集計し直しが終わっていません。"
+                "python -m modules.migrate を実行してください"
+            )
+    
+    @staticmethod
+    def _population_counted_up_to(cursor):
+        """
+        集計テーブルに足し済みの診断IDの上限を取得
+        
+        Args:
+            cursor (sqlite3.Cursor): トランザクション中のカーソル
+        
+        Returns:
+            int: backfill_population の途中ならこのID以下の診断だけが集計済み（完了していればNone）
+        """
+        last_id, completed = cursor.execute('''
+            SELECT last_id, completed FROM migration_state WHERE name = 'population_aggregates'
+        ''').fetchone()
+        return None if completed else last_id
+    
+    def backfill_normalized_tables(self, chunk_size=2000, progress=None):
+        """
+        既存の診断を正規化テーブル（diagnosis_categories, diagnosis_answers）に移行
+        
+        チャンクごとに短いトランザクションで処理し、進捗を migration_state に記録するため、
+        アプリを動かしたまま実行でき、中断しても続きから再開できる。
+        移行中に保存された診断は save_diagnosis が子テーブルにも書くので INSERT OR IGNORE で重複を避ける。
+        
+        Args:
+            chunk_size (int): 1トランザクションあたりの診断件数
+            progress (callable): チャンク処理ごとに累計件数を渡されるコールバック（オプション）
+        
+        Returns:
+            int: 移行した診断の件数
+        """
+        total = 0
+        while True:
+            with self._connection(write=True) as conn:
+                cursor = conn.cursor()
+                last_id, completed = cursor.execute('''
+                    SELECT last_id, completed FROM migration_state WHERE name = 'normalized_tables'
+                ''').fetchone()
+                if completed:
+                    return total
+                
+                rows = cursor.execute('''
+                    SELECT id, categories_json, answers_json, answers_blob, question_bank_version,
+                           deleted_at
+                    FROM diagnoses
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, chunk_size)).fetchall()
+                
+                if not rows:
+                    cursor.execute('''
+                        UPDATE migration_state SET completed = 1 WHERE name = 'normalized_tables'
+                    ''')
+                    return total
+                
+                # 論理削除した診断は正規化テーブルに入れない
+                self._insert_child_rows(
+                    cursor,
+                    [
+                        (row[0], json.loads(row[1]), _stored_answers(*row[2:5]))
+                        for row in rows
+                        if row[5] is None
+                    ],
+                    ignore_existing=True
+                )
+                cursor.execute('''
+                    UPDATE migration_state SET last_id = ? WHERE name = 'normalized_tables'
+                ''', (rows[-1][0],))
+            
+            total += len(rows)
+            if progress:
+                progress(total)
+    
+    def backfill_archived_child_rows(self, chunk_size=2000, progress=None):
+        """
+        アーカイブ済みの診断を正規化テーブルに戻す
+        
+        以前はアーカイブ時に正規化テーブルの行も削除していたため、そのときに移した月の分を
+        アーカイブファイルから作り直す（今はアーカイブしても正規化テーブルの行は残す）。
+        月ごとに1トランザクションで処理する。INSERT OR IGNORE なので、中断したら最初からやり直せばよい。
+        
+        Args:
+            chunk_size (int): 1回の fetchmany で読む件数
+            progress (callable): 月ごとに累計件数を渡されるコールバック（オプション）
+        
+        Returns:
+            int: 処理したアーカイブ済みの診断の件数
+        """
+        with self._connection() as conn:
+            completed = conn.execute('''
+                SELECT completed FROM migration_state WHERE name = 'archived_child_rows'
+            ''').fetchone()[0]
+            if completed:
+                return 0
+            months = [month for (month,) in conn.execute(
+                'SELECT month FROM archives WHERE row_count > 0 ORDER BY month'
+            )]
+        
+        total = 0
+        for month in months:
+            with self._connection() as conn:
+                with self._attached(conn, month) as attached:
+                    if not attached:
+                        continue
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        cursor = conn.execute('''
+                            SELECT id, categories_json, answers_json, answers_blob, question_bank_version
+                            FROM archive.diagnoses
+                        ''')
+                        while True:
+                            rows = cursor.fetchmany(chunk_size)
+                            if not rows:
+                                break
+                            self._insert_child_rows(
+                                conn.cursor(),
+                                [(row[0], json.loads(row[1]), _stored_answers(*row[2:])) for row in rows],
+                                ignore_existing=True
+                            )
+                            total += len(rows)
+                        conn.commit()
+                    except BaseException:
+                        conn.rollback()
+                        raise
+            if progress:
+                progress(total)
+        
+        with self._connection(write=True) as conn:
+            conn.execute('''
+                UPDATE migration_state SET completed = 1 WHERE name = 'archived_child_rows'
+            ''')
+        return total
+    
+    def compact_answers(self, chunk_size=2000, progress=None):
+        """
+        既存の診断の回答JSONを回答バイト列（answers_blob）に置き換える
+        
+        回答JSONを消す元に戻せない移行なので、起動時には実行せず
+        modules.migrate --compact-answers で明示的に実行する。
+        バイト列から回答をすべて復元できる診断だけを置き換え、現在の質問バンクにない質問への
+        回答などを含む診断は回答JSONのまま残す。
+        
+        backfill_normalized_tables と同じく、チャンクごとの短いトランザクションで処理し、
+        進捗を migration_state に記録する。空いた領域を返すには移行後に VACUUM する
+        （modules.migrate --vacuum）。
+        
+        Args:
+            chunk_size (int): 1トランザクションあたりの診断件数
+            progress (callable): チャンク処理ごとに累計件数を渡されるコールバック（オプション）
+        
+        Returns:
+            int: 置き換えた診断の件数
+        """
+        total = 0
+        compacted = 0
+        while True:
+            with self._connection(write=True) as conn:
+                cursor = conn.cursor()
+                last_id, completed = cursor.execute('''
+                    SELECT last_id, completed FROM migration_state WHERE name = 'compact_answers'
+                ''').fetchone()
+                if completed:
+                    return compacted
+                
+                rows = cursor.execute('''
+                    SELECT id, answers_json FROM diagnoses
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, chunk_size)).fetchall()
+                
+                if not rows:
+                    cursor.execute('''
+                        UPDATE migration_state SET completed = 1 WHERE name = 'compact_answers'
+                    ''')
+                    return compacted
+                
+                updates = []
+                for diagnosis_id, answers_json in rows:
+                    blob = encode_answers_exact(json.loads(answers_json)) if answers_json else None
+                    if blob is not None:
+                        updates.append((blob, QUESTION_BANK_VERSION, diagnosis_id))
+                cursor.executemany('''
+                    UPDATE diagnoses
+                    SET answers_blob = ?, question_bank_version = ?, answers_json = ''
+                    WHERE id = ? AND answers_blob IS NULL
+                ''', updates)
+                cursor.execute('''
+                    UPDATE migration_state SET last_id = ? WHERE name = 'compact_answers'
+                ''', (rows[-1][0],))
+            
+            total += len(rows)
+            compacted += len(updates)
+            if progress:
+                progress(total)
+    
+    def vacuum(self):
+        """空き領域を解放してDBファイルを縮める（実行中は書き込みを待たせる）"""
+        with self._connection() as conn:
+            conn.execute('VACUUM')
+    
+    @staticmethod
+    def _insert_child_rows(cursor, diagnoses, ignore_existing=False):
+        """
+        正規化テーブルに診断のカテゴリー別スコアと回答を書き込む
+        
+        Args:
+            cursor (sqlite3.Cursor): トランザクション中のカーソル
+            diagnoses (list): (診断ID, categories, answers) のリスト
+            ignore_existing (bool): 既に行がある診断を無視するかどうか
+        """
+        verb = 'INSERT OR IGNORE' if ignore_existing else 'INSERT'
+        
+        cursor.executemany(f'''
+            {verb} INTO diagnosis_categories (diagnosis_id, category, score, percentage)
+            VALUES (?, ?, ?, ?)
+        ''', [
+            (diagnosis_id, cat['name'], cat['score'], cat.get('percentage'))
+            for diagnosis_id, categories, _ in diagnoses
+            for cat in categories
+        ])
+        
+        choices = answers_to_choice_matrix(
+            [answers_to_dict(answers) for _, _, answers in diagnoses]
+        ).tolist()
+        cursor.executemany(f'''
+            {verb} INTO diagnosis_answers (diagnosis_id, question_id, choice_index)
+            VALUES (?, ?, ?)
+        ''', [
+            (diagnosis_id, question_id, choice_index)
+            for (diagnosis_id, _, _), row in zip(diagnoses, choices)
+            for question_id, choice_index in zip(QUESTION_IDS, row)
+            if choice_index != UNANSWERED
+        ])
     
     def save_diagnosis(self, diagnosis_data):
         """
@@ -77,7 +1319,7 @@ class DiagnosisDatabase:
                     'percentage': float,
                     'rank': str,
                     'categories': list,
-                    'answers': list,
+                    'answers': list（回答辞書でも可）,
                     'session_id': str (optional),
                     'user_id': str (optional)
                 }
@@ -85,33 +1327,93 @@ class DiagnosisDatabase:
         Returns:
             int: 保存された診断のID
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        return self.save_diagnoses([diagnosis_data])[0]
+    
+    def save_diagnosis_async(self, diagnosis_data, timeout=None):
+        """
+        診断結果の保存をバックグラウンドの書き込みスレッドに依頼
         
-        cursor.execute('''
-            INSERT INTO diagnoses (
-                facility_name, diagnosis_date, total_score, max_score,
-                percentage, rank, categories_json, answers_json,
-                session_id, user_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            diagnosis_data.get('facility_name', ''),
-            diagnosis_data['diagnosis_date'].isoformat(),
-            diagnosis_data['total_score'],
-            diagnosis_data['max_score'],
-            diagnosis_data['percentage'],
-            diagnosis_data['rank'],
-            json.dumps(diagnosis_data['categories'], ensure_ascii=False),
-            json.dumps(diagnosis_data['answers'], ensure_ascii=False),
-            diagnosis_data.get('session_id', ''),
-            diagnosis_data.get('user_id', '')
-        ))
-        
-        diagnosis_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        同じ時間帯に届いた保存依頼は1トランザクションにまとめて書き込まれる。
+        
+        Args:
+            diagnosis_data (dict): save_diagnosis と同じ形式の診断データ
+            timeout (float): キューが満杯のときに空きを待つ秒数（Noneなら空くまで待つ）
+        
+        Returns:
+            concurrent.futures.Future: 保存された診断のIDを返すFuture
+        
+        Raises:
+            queue.Full: timeout 秒待ってもキューが空かなかった場合
+        """
+        return get_batch_writer(self).submit(diagnosis_data, timeout=timeout)
+    
+    def save_diagnoses(self, diagnoses):
+        """
+        複数の診断結果を1トランザクションでまとめて保存
+        
+        Args:
+            diagnoses (list): save_diagnosis と同じ形式の診断データのリスト
+        
+        Returns:
+            list: 保存された診断のID（diagnoses と同じ順序）
+        """
+        if not diagnoses:
+            return []
+        
+        # created_at（CURRENT_TIMESTAMP）と同じくUTCの現在時刻
+        created_ts = int(time.time())
         
-        return diagnosis_id
+        with self._connection(write=True) as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany('''
+                INSERT INTO diagnoses (
+                    facility_name, diagnosis_date, total_score, max_score,
+                    percentage, rank, categories_json, answers_json,
+                    answers_blob, question_bank_version,
+                    session_id, user_id, scoring_version, diagnosis_ts, created_ts
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, '', ?, ?, ?, ?, ?, ?, ?)
+            ''', [
+                (
+                    diagnosis_data.get('facility_name', ''),
+                    diagnosis_data['diagnosis_date'].isoformat(),
+                    diagnosis_data['total_score'],
+                    diagnosis_data['max_score'],
+                    diagnosis_data['percentage'],
+                    diagnosis_data['rank'],
+                    json.dumps(diagnosis_data['categories'], ensure_ascii=False),
+                    encode_answers(diagnosis_data['answers']),
+                    QUESTION_BANK_VERSION,
+                    diagnosis_data.get('session_id', ''),
+                    diagnosis_data.get('user_id', ''),
+                    diagnosis_data.get('scoring_version', SCORING_VERSION),
+                    _to_epoch(diagnosis_data['diagnosis_date']),
+                    created_ts
+                )
+                for diagnosis_data in diagnoses
+            ])
+            
+            # 書き込みロック中の連続した挿入なので、IDは最後のIDから逆算できる
+            last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+            diagnosis_ids = list(range(last_id - len(diagnoses) + 1, last_id + 1))
+            
+            # 正規化テーブルも同じトランザクションで書き込む
+            self._insert_child_rows(cursor, [
+                (diagnosis_id, diagnosis_data['categories'], diagnosis_data['answers'])
+                for diagnosis_id, diagnosis_data in zip(diagnosis_ids, diagnoses)
+            ])
+            
+            # 集計テーブルも同じトランザクションで更新
+            # （backfill_population の途中なら、新しい診断は移行のほうで足す）
+            if self._population_counted_up_to(cursor) is None:
+                delta = self._new_population_delta()
+                for diagnosis_data in diagnoses:
+                    self._accumulate_population(
+                        delta, diagnosis_data['categories'], diagnosis_data['total_score'], 1
+                    )
+                self._apply_population(cursor, delta)
+        
+        return diagnosis_ids
     
     def get_diagnosis_by_id(self, diagnosis_id):
         """
@@ -121,21 +1423,34 @@ class DiagnosisDatabase:
             diagnosis_id (int): 診断ID
         
         Returns:
-            dict: 診断データ、存在しない場合はNone
+            DiagnosisRecord: 診断データ、存在しない場合はNone
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM diagnoses WHERE id = ?
-        ''', (diagnosis_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                SELECT {_RECORD_COLUMNS} FROM diagnoses WHERE id = ? AND deleted_at IS NULL
+            ''', (diagnosis_id,))
+            
+            row = cursor.fetchone()
+            
+            # 見つからなければ、IDの範囲が合うアーカイブを探す
+            if row is None:
+                months = [month for (month,) in cursor.execute('''
+                    SELECT month FROM archives WHERE ? BETWEEN min_id AND max_id
+                    ORDER BY month DESC
+                ''', (diagnosis_id,))]
+                for month in months:
+                    with self._attached(conn, month) as attached:
+                        if attached:
+                            row = conn.execute(f'''
+                                SELECT {_RECORD_COLUMNS} FROM archive.diagnoses WHERE id = ?
+                            ''', (diagnosis_id,)).fetchone()
+                    if row is not None:
+                        break
         
         if row:
-            return self._row_to_dict(row)
+            return DiagnosisRecord(*row)
         return None
     
     def get_recent_diagnoses(self, limit=10, session_id=None):
@@ -147,51 +1462,490 @@ class DiagnosisDatabase:
             session_id (str): セッションIDでフィルタ（オプション）
         
         Returns:
-            list: 診断データのリスト
+            list: 診断データ（DiagnosisRecord）のリスト
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
         if session_id:
-            cursor.execute('''
-                SELECT * FROM diagnoses 
-                WHERE session_id = ?
-                ORDER BY diagnosis_date DESC 
-                LIMIT ?
-            ''', (session_id, limit))
+            rows = self._select_recent(_RECORD_COLUMNS, ['session_id = ?'], [session_id], limit)
         else:
-            cursor.execute('''
-                SELECT * FROM diagnoses 
-                ORDER BY diagnosis_date DESC 
-                LIMIT ?
-            ''', (limit,))
-        
-        rows = cursor.fetchall()
-        conn.close()
+            rows = self._select_recent(_RECORD_COLUMNS, [], [], limit)
         
-        return [self._row_to_dict(row) for row in rows]
+        return [DiagnosisRecord(*row) for row in rows]
     
     def get_all_diagnoses(self):
         """
-        全ての診断結果を取得
+        全ての診断結果を取得（アーカイブ済みのものも含む）
         
         Returns:
-            list: 診断データのリスト
+            list: 診断データ（DiagnosisRecord）のリスト
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        return [DiagnosisRecord(*row) for row in self._select_recent(_RECORD_COLUMNS, [], [])]
+    
+    def iter_diagnoses(self, batch_size=1000, include_archives=True):
+        """
+        全ての診断を1件ずつ取得
         
-        cursor.execute('''
-            SELECT * FROM diagnoses 
-            ORDER BY diagnosis_date DESC
-        ''')
+        カーソルから fetchmany で batch_size 件ずつ読むため、件数によらずメモリ使用量は一定。
+        アーカイブ（古い月から順）、ホットDBの順に、それぞれID順で返す。
+        ホットDBは1つの読み取りトランザクションで読むので、途中で保存された診断は含まない。
         
-        rows = cursor.fetchall()
-        conn.close()
+        Args:
+            batch_size (int): 1回の fetchmany で読む件数
+            include_archives (bool): アーカイブ済みの診断も含めるかどうか
+        
+        Yields:
+            DiagnosisRecord: 診断1件
+        """
+        sql = f'SELECT {_RECORD_COLUMNS} FROM {{schema}}.diagnoses {{where}} ORDER BY id'
+        
+        with self._connection() as conn:
+            months = [month for (month,) in conn.execute('''
+                SELECT month FROM archives WHERE row_count > 0 ORDER BY month
+            ''')] if include_archives else []
+            
+            for month in months + [None]:
+                with self._attached(conn, month) if month else nullcontext(True) as attached:
+                    if not attached:
+                        continue
+                    # アーカイブには論理削除された診断を移さないので、ホットDBだけ除外する
+                    cursor = conn.execute(
+                        sql.format(schema='archive', where='') if month
+                        else sql.format(schema='main', where='WHERE deleted_at IS NULL')
+                    )
+                    try:
+                        while True:
+                            rows = cursor.fetchmany(batch_size)
+                            if not rows:
+                                break
+                            for row in rows:
+                                yield DiagnosisRecord(*row)
+                    finally:
+                        # 読みかけの文が残っていると DETACH できない
+                        cursor.close()
+    
+    def list_diagnoses(self, after=None, limit=50, session_id=None, user_id=None,
+                       facility_name=None, date_from=None, date_to=None, ranks=None,
+                       min_score=None, max_score=None, min_percentage=None, max_percentage=None):
+        """
+        診断履歴の要約を新しい順にページ単位で取得
+        
+        一覧表示に必要な列だけを読み、(diagnosis_date, id) のキーセットで
+        続きを取得するため、保存件数が増えても1ページの取得時間は変わらない。
+        アーカイブ済みの診断も、そのページに入りうる月のファイルだけを開いて続けて返す。
+        絞り込み条件はすべてSQLで評価し、それぞれ対応する索引を使う。
+        
+        Args:
+            after (tuple): 前のページの next_cursor（最初のページはNone）
+            limit (int): 1ページの件数
+            session_id (str): セッションIDでフィルタ（オプション）
+            user_id (str): ユーザーIDでフィルタ（オプション）
+            facility_name (str): 施設名でフィルタ（完全一致、オプション）
+            date_from (date): この日以降の診断（オプション）
+            date_to (date): この日以前の診断（その日を含む、オプション）
+            ranks (list): ランクのリスト（例: ['A', 'B']、オプション）
+            min_score (int): 総合スコアの下限（オプション）
+            max_score (int): 総合スコアの上限（オプション）
+            min_percentage (float): 達成率の下限（オプション）
+            max_percentage (float): 達成率の上限（オプション）
+        
+        Returns:
+            tuple: (DiagnosisSummary のリスト, 次のページの next_cursor（最後のページはNone）)
+        """
+        conditions, params, min_ts, max_ts, main_index = self._list_query(
+            after, limit, session_id, user_id, facility_name, date_from, date_to, ranks,
+            min_score, max_score, min_percentage, max_percentage
+        )
+        rows = self._select_recent(
+            _SUMMARY_COLUMNS, conditions, params, limit,
+            min_ts=min_ts, max_ts=max_ts, main_index=main_index
+        )
+        
+        records = [
+            DiagnosisSummary(
+                row[0], _from_epoch(row[2]), row[3], row[4], row[5], row[6], row[7]
+            )
+            for row in rows
+        ]
+        next_cursor = (rows[-1][1], rows[-1][0]) if len(rows) == limit else None
+        return records, next_cursor
+    
+    def explain_list_diagnoses(self, after=None, limit=50, **filters):
+        """
+        list_diagnoses がホットDBに発行する問い合わせの実行計画を取得
+        
+        Args:
+            after (tuple): 前のページの next_cursor（オプション）
+            limit (int): 1ページの件数
+            **filters: list_diagnoses と同じ絞り込み条件
+        
+        Returns:
+            list: EXPLAIN QUERY PLAN の detail 列（例: 'SEARCH diagnoses USING INDEX ...'）
+        """
+        conditions, params, _, _, main_index = self._list_query(after, limit, **filters)
+        sql = self._recent_sql('main', _SUMMARY_COLUMNS, [*conditions, 'deleted_at IS NULL'], limit, main_index)
+        with self._connection() as conn:
+            return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', (*params, limit))]
+    
+    def _list_query(self, after, limit, session_id=None, user_id=None, facility_name=None,
+                    date_from=None, date_to=None, ranks=None, min_score=None, max_score=None,
+                    min_percentage=None, max_percentage=None):
+        """
+        list_diagnoses の条件・期間・ホットDBで使う索引を組み立てる
+        
+        Returns:
+            tuple: (条件のリスト, パラメータのリスト, 期間の下限, 期間の上限, 索引名またはNone)
+        """
+        conditions, params, min_ts, max_ts = self._filter_conditions(
+            session_id, user_id, facility_name, date_from, date_to, ranks,
+            min_score, max_score, min_percentage, max_percentage
+        )
+        if after is not None:
+            conditions.append('(diagnosis_date, id) < (?, ?)')
+            params.extend(after)
+            after_ts = _to_epoch(datetime.fromisoformat(after[0]))
+            max_ts = after_ts if max_ts is None else min(max_ts, after_ts)
+        
+        # 一致条件はそれぞれの索引で該当行だけを読めるので、範囲の索引を選ぶのはそれがないときだけ
+        main_index = None
+        if not (session_id or user_id or facility_name or ranks):
+            main_index = self._range_index(min_score, max_score, min_percentage, max_percentage, limit)
+        return conditions, params, min_ts, max_ts, main_index
+    
+    def _range_index(self, min_score, max_score, min_percentage, max_percentage, limit):
+        """
+        点数・達成率の範囲で絞り込むときに使う索引を選ぶ
+        
+        idx_diagnosis_date を新しい順に読みながら範囲を判定すると、該当する診断が少ないほど
+        多くの行を読む（該当なしなら全件）。score_histogram から該当件数 m を見積もり、
+        日付順の索引で読む約 limit × 全件数 / m 行と、範囲の索引で読んで並べ替える m 行
+        （1行あたり RANGE_INDEX_COST_RATIO 倍のコスト）を比べて速い方を選ぶ。
+        SQLite は範囲の絞り込み率を知らないので、どちらの場合も索引を指定する。
+        
+        Returns:
+            str: INDEXED BY に指定する索引名（範囲の条件がない場合はNone）
+        """
+        if min_score is None and max_score is None and min_percentage is None and max_percentage is None:
+            return None
+        
+        # 達成率は現在の満点で総合スコアから求める（満点の違う古い診断があっても見積もりには十分）
+        with self._connection() as conn:
+            total, matches = conn.execute('''
+                SELECT
+                    COALESCE(SUM(count), 0),
+                    COALESCE(SUM(CASE WHEN
+                        (? IS NULL OR score >= ?) AND (? IS NULL OR score <= ?)
+                        AND (? IS NULL OR ROUND(score * 100.0 / ?, 1) >= ?)
+                        AND (? IS NULL OR ROUND(score * 100.0 / ?, 1) <= ?)
+                    THEN count ELSE 0 END), 0)
+                FROM score_histogram
+                WHERE metric = 'total'
+            ''', (
+                min_score, min_score, max_score, max_score,
+                min_percentage, MAX_SCORE, min_percentage,
+                max_percentage, MAX_SCORE, max_percentage
+            )).fetchone()
+        
+        if matches * matches * RANGE_INDEX_COST_RATIO > limit * total:
+            return 'idx_diagnosis_date'
+        if min_score is not None or max_score is not None:
+            return 'idx_score_date'
+        return 'idx_percentage_date'
+    
+    @staticmethod
+    def _filter_conditions(session_id=None, user_id=None, facility_name=None, date_from=None,
+                           date_to=None, ranks=None, min_score=None, max_score=None,
+                           min_percentage=None, max_percentage=None):
+        """
+        list_diagnoses・delete_diagnoses_where の絞り込み条件をSQLの条件にする
+        
+        Returns:
+            tuple: (条件のリスト, パラメータのリスト, 期間の下限のエポック秒, 期間の上限のエポック秒)
+        """
+        conditions = []
+        params = []
+        for column, value in (
+            ('session_id', session_id),
+            ('user_id', user_id),
+            ('facility_name', facility_name),
+        ):
+            if value:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        if ranks:
+            conditions.append(f"rank IN ({', '.join('?' * len(ranks))})")
+            params.extend(ranks)
+        for column, operator, value in (
+            ('total_score', '>=', min_score),
+            ('total_score', '<=', max_score),
+            ('percentage', '>=', min_percentage),
+            ('percentage', '<=', max_percentage),
+        ):
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                params.append(value)
+        
+        # 日付は 'YYYY-MM-DD' と比べる（時刻の書式によらずその日の全ての診断が入る）
+        min_ts = max_ts = None
+        if date_from is not None:
+            conditions.append('diagnosis_date >= ?')
+            params.append(date_from.isoformat())
+            min_ts = _to_epoch(datetime.combine(date_from, datetime.min.time()))
+        if date_to is not None:
+            next_day = date_to + timedelta(days=1)
+            conditions.append('diagnosis_date < ?')
+            params.append(next_day.isoformat())
+            max_ts = _to_epoch(datetime.combine(next_day, datetime.min.time()))
+        return conditions, params, min_ts, max_ts
+    
+    def search_facilities(self, query, limit=20):
+        """
+        施設名を部分一致で検索
+        
+        3文字以上は trigram の全文検索索引で探す。2文字以下は索引が使えないため
+        施設名の一覧（施設ごとに1行）を LIKE で探す。
+        前方一致する施設を先に、その中では診断件数の多い順に返す。
+        
+        Args:
+            query (str): 検索文字列（施設名の一部）
+            limit (int): 最大件数
+        
+        Returns:
+            list: {'name': 施設名, 'diagnosis_count': 診断件数} のリスト
+        """
+        query = (query or '').strip()
+        if not query:
+            return []
+        
+        pattern = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        if len(query) >= 3:
+            source = '''
+                facilities
+                JOIN facilities_fts ON facilities_fts.rowid = facilities.id
+                WHERE facilities_fts MATCH ?
+            '''
+            params = ['"' + query.replace('"', '""') + '"']
+        else:
+            source = "facilities WHERE name LIKE ? ESCAPE '\\'"
+            params = [f'%{pattern}%']
+        
+        with self._connection() as conn:
+            rows = conn.execute(f'''
+                SELECT facilities.name, diagnosis_count FROM {source}
+                ORDER BY facilities.name LIKE ? ESCAPE '\\' DESC, diagnosis_count DESC, facilities.name
+                LIMIT ?
+            ''', (*params, f'{pattern}%', limit)).fetchall()
         
-        return [self._row_to_dict(row) for row in rows]
+        return [{'name': name, 'diagnosis_count': count} for name, count in rows]
+    
+    @staticmethod
+    def _recent_sql(schema, columns, conditions, limit=None, index=None):
+        """_select_recent が1つのDBに発行するSQL（新しい順）"""
+        indexed_by = f' INDEXED BY {index}' if index else ''
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        sql = f'''
+            SELECT {columns}, diagnosis_date, diagnosis_ts, id
+            FROM {schema}.diagnoses{indexed_by}
+            {where}
+            ORDER BY diagnosis_date DESC, id DESC
+        '''
+        return sql + ' LIMIT ?' if limit is not None else sql
+    
+    def _select_recent(self, columns, conditions, params, limit=None, min_ts=None, max_ts=None,
+                       main_index=None):
+        """
+        ホットDBとアーカイブから、条件に合う診断を新しい順に取得
+        
+        まずホットDBを読み、アーカイブは新しい月から順に1つずつ ATTACH する。
+        既に limit 件そろっていて、その最後の行よりアーカイブの期間が古ければ
+        そのファイル以降は開かない。
+        
+        Args:
+            columns (str): SELECT する列
+            conditions (list): WHERE の条件（AND で結合）
+            params (list): 条件のパラメータ
+            limit (int): 取得件数（Noneなら全件）
+            min_ts (int): これより古い診断を含まないことが分かっている場合のエポック秒
+            max_ts (int): これより新しい診断を含まないことが分かっている場合のエポック秒
+            main_index (str): ホットDBで使う索引（INDEXED BY、オプション）
+        
+        Returns:
+            list: columns の行のリスト
+        """
+        # アーカイブには論理削除された診断を移さないので、ホットDBだけ除外する
+        main_sql = self._recent_sql('main', columns, [*conditions, 'deleted_at IS NULL'], limit, main_index)
+        archive_sql = self._recent_sql('archive', columns, conditions, limit)
+        if limit is not None:
+            params = (*params, limit)
+        
+        with self._connection() as conn:
+            rows = conn.execute(main_sql, params).fetchall()
+            
+            months = conn.execute('''
+                SELECT month, end_ts FROM archives
+                WHERE row_count > 0
+                  AND (? IS NULL OR start_ts <= ?)
+                  AND (? IS NULL OR end_ts > ?)
+                ORDER BY month DESC
+            ''', (max_ts, max_ts, min_ts, min_ts)).fetchall()
+            
+            for month, end_ts in months:
+                if limit is not None and len(rows) >= limit and (rows[limit - 1][-2] or 0) >= end_ts:
+                    break
+                with self._attached(conn, month) as attached:
+                    if not attached:
+                        continue
+                    rows += conn.execute(archive_sql, params).fetchall()
+                rows.sort(key=lambda row: (row[-3], row[-1]), reverse=True)
+                if limit is not None:
+                    del rows[limit:]
+        
+        return [row[:-3] for row in rows]
+    
+    def _archive_path(self, month):
+        """月別アーカイブファイルのパス（例: data/archive/diagnoses_2024-03.db）"""
+        db_path = Path(self.db_path)
+        return db_path.parent / ARCHIVE_DIRECTORY / f"{db_path.stem}_{month}.db"
+    
+    @contextmanager
+    def _attached(self, conn, month):
+        """
+        月別アーカイブファイルを schema 名 archive で ATTACH し、終わったら DETACH する
+        
+        Yields:
+            bool: ATTACH できたかどうか（ファイルがなければ False）
+        """
+        path = self._archive_path(month)
+        if not path.exists():
+            yield False
+            return
+        conn.execute('ATTACH DATABASE ? AS archive', (str(path),))
+        try:
+            yield True
+        finally:
+            conn.execute('DETACH DATABASE archive')
+    
+    def archive_diagnoses(self, older_than_days=ARCHIVE_AFTER_DAYS, vacuum=True, progress=None):
+        """
+        古い診断を月別のアーカイブファイルに移す
+        
+        月ごとに、アーカイブへのコピーとホットDBからの削除を1トランザクションで行う。
+        アーカイブ側は INSERT OR REPLACE なので、中断しても再実行できる。
+        集計テーブル（category_stats, score_histogram, daily_summary, category_score_buckets）と
+        正規化テーブル（diagnosis_categories, diagnosis_answers）はホットDBに全期間分を残す。
+        
+        Args:
+            older_than_days (int): この日数より前の診断をアーカイブする
+            vacuum (bool): 移動後にホットDBを VACUUM するかどうか
+            progress (callable): 月ごとに (月, 件数) を渡されるコールバック（オプション）
+        
+        Returns:
+            int: アーカイブした診断の件数
+        """
+        # 集計テーブルは全期間分を残すので、まだ集計していない診断を移す前に集計し終える
+        self.backfill_population()
+        
+        cutoff_ts = _to_epoch(datetime.now() - timedelta(days=older_than_days))
+        
+        with self._connection() as conn:
+            months = [month for (month,) in conn.execute('''
+                SELECT DISTINCT strftime('%Y-%m', diagnosis_ts, 'unixepoch')
+                FROM diagnoses
+                WHERE diagnosis_ts < ?
+                ORDER BY 1
+            ''', (cutoff_ts,))]
+        
+        total = 0
+        for month in months:
+            count = self._archive_month(month, cutoff_ts)
+            total += count
+            if progress:
+                progress(month, count)
+        
+        if vacuum and total:
+            self.vacuum()
+        return total
+    
+    def _archive_month(self, month, cutoff_ts):
+        """1か月分の診断（cutoff_ts より前）をアーカイブファイルに移す"""
+        year, month_number = map(int, month.split('-'))
+        start = datetime(year, month_number, 1)
+        end = datetime(year + month_number // 12, month_number % 12 + 1, 1)
+        start_ts, end_ts = _to_epoch(start), min(_to_epoch(end), cutoff_ts)
+        
+        path = self._archive_path(month)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch(exist_ok=True)
+        
+        with self._connection() as conn:
+            with self._attached(conn, month):
+                # ホットDBと同じ定義のテーブルを作る（列の追加はアーカイブ側にも反映）
+                create_sql = conn.execute('''
+                    SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'diagnoses'
+                ''').fetchone()[0]
+                conn.execute(re.sub(
+                    r'^CREATE TABLE\s+"?diagnoses"?',
+                    'CREATE TABLE IF NOT EXISTS archive.diagnoses',
+                    create_sql
+                ))
+                archive_columns = {row[1] for row in conn.execute('PRAGMA archive.table_info(diagnoses)')}
+                for column, column_type in [
+                    (row[1], row[2]) for row in conn.execute('PRAGMA main.table_info(diagnoses)')
+                ]:
+                    if column not in archive_columns:
+                        conn.execute(f'ALTER TABLE archive.diagnoses ADD COLUMN {column} {column_type}')
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS archive.idx_diagnosis_date
+                    ON diagnoses(diagnosis_date DESC, id DESC)
+                ''')
+                columns = ', '.join(row[1] for row in conn.execute('PRAGMA main.table_info(diagnoses)'))
+                
+                moving = '''
+                    SELECT id FROM main.diagnoses
+                    WHERE diagnosis_ts >= ? AND diagnosis_ts < ? AND deleted_at IS NOT NULL
+                '''
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    cursor = conn.execute(f'''
+                        INSERT OR REPLACE INTO archive.diagnoses ({columns})
+                        SELECT {columns} FROM main.diagnoses
+                        WHERE diagnosis_ts >= ? AND diagnosis_ts < ? AND deleted_at IS NULL
+                    ''', (start_ts, end_ts))
+                    count = cursor.rowcount
+                    # アーカイブした診断の施設も検索できるように、削除トリガーで減る分を先に足しておく
+                    conn.execute('''
+                        INSERT INTO main.facilities (name, diagnosis_count)
+                        SELECT facility_name, COUNT(*) FROM main.diagnoses
+                        WHERE diagnosis_ts >= ? AND diagnosis_ts < ? AND facility_name <> ''
+                          AND deleted_at IS NULL
+                        GROUP BY facility_name
+                        ON CONFLICT(name) DO UPDATE SET
+                            diagnosis_count = diagnosis_count + excluded.diagnosis_count
+                    ''', (start_ts, end_ts))
+                    # ダッシュボードの集計テーブルも全期間のまま残す
+                    self._add_to_summaries(
+                        conn, 'diagnosis_ts >= ? AND diagnosis_ts < ? AND deleted_at IS NULL', (start_ts, end_ts)
+                    )
+                    # 正規化テーブルの行は、索引を使う集計が全期間を対象にするよう残す。
+                    # アーカイブに移さない論理削除済みの診断の分だけ消す
+                    conn.execute(f'DELETE FROM main.diagnosis_categories WHERE diagnosis_id IN ({moving})',
+                                 (start_ts, end_ts))
+                    conn.execute(f'DELETE FROM main.diagnosis_answers WHERE diagnosis_id IN ({moving})',
+                                 (start_ts, end_ts))
+                    conn.execute('DELETE FROM main.diagnoses WHERE diagnosis_ts >= ? AND diagnosis_ts < ?',
+                                 (start_ts, end_ts))
+                    conn.execute('''
+                        INSERT INTO main.archives (month, start_ts, end_ts, min_id, max_id, row_count)
+                        SELECT ?, ?, ?, MIN(id), MAX(id), COUNT(*) FROM archive.diagnoses WHERE true
+                        ON CONFLICT(month) DO UPDATE SET
+                            min_id = excluded.min_id,
+                            max_id = excluded.max_id,
+                            row_count = excluded.row_count
+                    ''', (month, _to_epoch(start), _to_epoch(end)))
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+        
+        return count
     
     def delete_diagnosis(self, diagnosis_id):
         """
@@ -203,40 +1957,995 @@ class DiagnosisDatabase:
         Returns:
             bool: 削除成功したかどうか
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        return self.delete_diagnoses([diagnosis_id]) > 0
+    
+    def delete_diagnoses(self, diagnosis_ids, soft=False):
+        """
+        複数の診断を1トランザクションでまとめて削除
         
-        cursor.execute('''
-            DELETE FROM diagnoses WHERE id = ?
-        ''', (diagnosis_id,))
+        IDの一覧は1つのパラメータ（JSON配列）で渡し、集計テーブルの更新・子テーブルと
+        診断の削除をそれぞれ1文で行う。アーカイブ済みの診断は対象外。
         
-        deleted_rows = cursor.rowcount
-        conn.commit()
-        conn.close()
+        Args:
+            diagnosis_ids (list): 診断IDのリスト
+            soft (bool): 論理削除にするかどうか（行の削除はバックグラウンドの purge_deleted が行う）
+        
+        Returns:
+            int: 削除した件数（既に論理削除されていた診断は含まない）
+        """
+        if not diagnosis_ids:
+            return 0
+        return self._delete_where(
+            'id IN (SELECT value FROM json_each(?))',
+            [json.dumps([int(diagnosis_id) for diagnosis_id in diagnosis_ids])],
+            soft
+        )
+    
+    def get_deletable_ids(self, diagnosis_ids):
+        """
+        指定した診断のうち削除できるもの（ホットDBにあり、論理削除されていない）のIDを取得
         
-        return deleted_rows > 0
+        アーカイブ済みの診断は delete_diagnoses の対象外なので含まない。
+        
+        Args:
+            diagnosis_ids (list): 診断IDのリスト
+        
+        Returns:
+            list: 削除できる診断IDのリスト
+        """
+        if not diagnosis_ids:
+            return []
+        with self._connection() as conn:
+            rows = conn.execute('''
+                SELECT id FROM diagnoses
+                WHERE id IN (SELECT value FROM json_each(?)) AND deleted_at IS NULL
+            ''', (json.dumps([int(diagnosis_id) for diagnosis_id in diagnosis_ids]),)).fetchall()
+        return [row[0] for row in rows]
     
-    def _row_to_dict(self, row):
+    def delete_diagnoses_where(self, soft=True, before=None, **filters):
         """
-        SQLite Rowを辞書に変換
+        条件に合う診断をまとめて削除（例: ある日より前のテスト用ユーザーの診断）
+        
+        条件は1つのSQL文で評価する。件数が多くても書き込みロックを短くするため、
+        既定では論理削除にして行の削除はバックグラウンドで少しずつ行う。アーカイブ済みの診断は対象外。
         
         Args:
-            row (sqlite3.Row): データベース行
+            soft (bool): 論理削除にするかどうか
+            before (date): この日より前の診断（その日を含まない、オプション）
+            **filters: list_diagnoses と同じ絞り込み条件
+                      （session_id, user_id, facility_name, date_from, date_to, ranks,
+                        min_score, max_score, min_percentage, max_percentage）
         
         Returns:
-            dict: 診断データ
+            int: 削除した件数（既に論理削除されていた診断は含まない）
+        
+        Raises:
+            ValueError: 条件が1つも指定されていない場合
+        """
+        conditions, params, _, _ = self._filter_conditions(**filters)
+        if before is not None:
+            conditions.append('diagnosis_date < ?')
+            params.append(before.isoformat())
+        if not conditions:
+            raise ValueError("削除する診断の条件を指定してください")
+        return self._delete_where(' AND '.join(conditions), params, soft)
+    
+    def _delete_where(self, condition, params, soft):
         """
+        condition に合う診断を1トランザクションで削除（論理削除済みの診断は集計から引き済み）
+        
+        論理削除でも正規化テーブル（diagnosis_categories, diagnosis_answers）の行は同じ
+        トランザクションで削除し、索引を使う集計や検索にすぐ出てこないようにする。
+        
+        Args:
+            condition (str): diagnoses に対する WHERE の条件
+            params (list): 条件のパラメータ
+            soft (bool): 論理削除にするかどうか
+        
+        Returns:
+            int: 削除した件数（既に論理削除されていた診断は、物理削除しても数えない）
+        """
+        live = f'SELECT id FROM diagnoses WHERE ({condition}) AND deleted_at IS NULL'
+        
+        with self._connection(write=True) as conn:
+            cursor = conn.cursor()
+            
+            # 集計テーブル（category_stats, score_histogram）から削除する診断の分を差し引く。
+            # 施設・日別などの集計はトリガーで更新される
+            self._apply_population_where(
+                cursor, live, params, -1, self._population_counted_up_to(cursor)
+            )
+            
+            # 論理削除済みの診断の子テーブルの行は、論理削除したときに削除済み
+            for table in ('diagnosis_categories', 'diagnosis_answers'):
+                cursor.execute(f'''
+                    DELETE FROM {table} WHERE diagnosis_id IN ({live})
+                ''', params)
+            
+            if soft:
+                cursor.execute(f'''
+                    UPDATE diagnoses SET deleted_at = ? WHERE id IN ({live})
+                ''', [int(time.time()), *params])
+                deleted_rows = cursor.rowcount
+            else:
+                # 論理削除済みの診断の行も消すが、削除済みとして報告済みなので件数には含めない
+                deleted_rows = cursor.execute(f'''
+                    SELECT COUNT(*) FROM ({live})
+                ''', params).fetchone()[0]
+                cursor.execute(f'''
+                    DELETE FROM diagnoses WHERE {condition}
+                ''', params)
+        
+        if soft and deleted_rows > 0:
+            self.start_background_purge()
+        return deleted_rows
+    
+    def restore_diagnoses(self, diagnosis_ids):
+        """
+        論理削除した診断を元に戻す（まだ物理削除されていないものだけ）
+        
+        Args:
+            diagnosis_ids (list): 診断IDのリスト
+        
+        Returns:
+            int: 元に戻した件数
+        """
+        if not diagnosis_ids:
+            return 0
+        deleted = '''
+            SELECT id FROM diagnoses
+            WHERE id IN (SELECT value FROM json_each(?)) AND deleted_at IS NOT NULL
+        '''
+        params = [json.dumps([int(diagnosis_id) for diagnosis_id in diagnosis_ids])]
+        
+        with self._connection(write=True) as conn:
+            cursor = conn.cursor()
+            self._apply_population_where(
+                cursor, deleted, params, 1, self._population_counted_up_to(cursor)
+            )
+            # 論理削除のときに消した正規化テーブルの行を作り直す
+            rows = cursor.execute(f'''
+                SELECT id, categories_json, answers_json, answers_blob, question_bank_version
+                FROM diagnoses WHERE id IN ({deleted})
+            ''', params).fetchall()
+            self._insert_child_rows(
+                cursor,
+                [(row[0], json.loads(row[1]), _stored_answers(*row[2:])) for row in rows],
+                ignore_existing=True
+            )
+            cursor.execute(f'UPDATE diagnoses SET deleted_at = NULL WHERE id IN ({deleted})', params)
+            restored_rows = cursor.rowcount
+        
+        return restored_rows
+    
+    def purge_deleted(self, chunk_size=PURGE_CHUNK_SIZE, pause=PURGE_PAUSE, progress=None):
+        """
+        論理削除した診断を少しずつ物理削除する
+        
+        chunk_size 件ごとの短いトランザクションで削除し、間に pause 秒待って
+        ほかの書き込みを先に通す。集計と正規化テーブルは論理削除のときに更新済みなので、
+        診断の行を消すだけで、表示や集計の結果は変わらない。
+        
+        Args:
+            chunk_size (int): 1トランザクションあたりの件数
+            pause (float): トランザクションの間に待つ秒数
+            progress (callable): チャンク処理ごとに累計件数を渡されるコールバック（オプション）
+        
+        Returns:
+            int: 物理削除した件数
+        """
+        total = 0
+        while True:
+            with self._connection(write=True) as conn:
+                ids = [row[0] for row in conn.execute('''
+                    SELECT id FROM diagnoses WHERE deleted_at IS NOT NULL LIMIT ?
+                ''', (chunk_size,))]
+                if not ids:
+                    return total
+                
+                conn.execute('''
+                    DELETE FROM diagnoses WHERE id IN (SELECT value FROM json_each(?))
+                ''', (json.dumps(ids),))
+            
+            total += len(ids)
+            if progress:
+                progress(total)
+            time.sleep(pause)
+    
+    def start_background_purge(self):
+        """
+        論理削除した診断の物理削除をバックグラウンドのスレッドで始める
+        
+        DBファイルごとに1スレッドで、実行中に呼ばれた場合は終わった後にもう一度確認する。
+        """
+        key = str(Path(self.db_path).resolve())
+        with _PURGE_LOCK:
+            thread = _PURGE_THREADS.get(key)
+            if thread is not None and thread.is_alive():
+                _PURGE_REQUESTED.add(key)
+                return
+            thread = threading.Thread(
+                target=self._run_background_purge, args=(key,), name="diagnosis-purge", daemon=True
+            )
+            _PURGE_THREADS[key] = thread
+            thread.start()
+    
+    def _run_background_purge(self, key):
+        """start_background_purge のスレッド本体"""
+        while True:
+            try:
+                self.purge_deleted()
+            except sqlite3.Error:
+                # ロック待ちのタイムアウトなど。論理削除した診断はどこにも表示されないので、
+                # 次の論理削除かプロセスの起動時に続きを削除する
+                logger.warning("論理削除した診断の物理削除に失敗しました: %s", self.db_path, exc_info=True)
+            with _PURGE_LOCK:
+                if key not in _PURGE_REQUESTED:
+                    del _PURGE_THREADS[key]
+                    return
+                _PURGE_REQUESTED.discard(key)
+    
+    def iter_answer_chunks(self, chunk_size=5000, stale_for_version=None):
+        """
+        診断の回答をチャンク単位で取得
+        
+        idのキーセットで読み進めるため、メモリ使用量はチャンクサイズで頭打ちになる。
+        
+        Args:
+            chunk_size (int): 1チャンクあたりの行数
+            stale_for_version (str): 指定した場合、このスコア表のバージョン以外で
+                                     採点された診断だけを返す（オプション）
+        
+        Yields:
+            list: (id, 回答辞書) のリスト
+        """
+        last_id = 0
+        while True:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                if stale_for_version is None:
+                    cursor.execute('''
+                        SELECT id, answers_json, answers_blob, question_bank_version
+                        FROM diagnoses
+                        WHERE id > ? AND deleted_at IS NULL
+                        ORDER BY id
+                        LIMIT ?
+                    ''', (last_id, chunk_size))
+                else:
+                    cursor.execute('''
+                        SELECT id, answers_json, answers_blob, question_bank_version
+                        FROM diagnoses
+                        WHERE id > ? AND scoring_version IS NOT ? AND deleted_at IS NULL
+                        ORDER BY id
+                        LIMIT ?
+                    ''', (last_id, stale_for_version, chunk_size))
+                rows = cursor.fetchall()
+            
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [(row[0], _stored_answers(*row[1:])) for row in rows]
+    
+    def update_scores(self, score_rows):
+        """
+        再採点結果を1トランザクションでまとめて書き戻す
+        
+        Args:
+            score_rows (list): (total_score, max_score, percentage, rank,
+                               categories_json, scoring_version, id) のリスト
+        
+        Returns:
+            int: 更新した行数
+        """
+        with self._connection(write=True) as conn:
+            cursor = conn.cursor()
+            
+            # 集計テーブルの差分（旧スコアを引いて新スコアを足す）。
+            # backfill_population がまだ足していない診断は、移行のほうで新スコアを足す
+            counted_up_to = self._population_counted_up_to(cursor)
+            delta = self._new_population_delta()
+            live_rows = []
+            for score_row in score_rows:
+                cursor.execute('''
+                    SELECT categories_json, total_score FROM diagnoses WHERE id = ? AND deleted_at IS NULL
+                ''', (score_row[-1],))
+                row = cursor.fetchone()
+                if row:
+                    if counted_up_to is None or score_row[-1] <= counted_up_to:
+                        self._accumulate_population(delta, json.loads(row[0]), row[1], -1)
+                        self._accumulate_population(delta, json.loads(score_row[4]), score_row[0], 1)
+                    live_rows.append(score_row)
+            self._apply_population(cursor, delta)
+            
+            # 正規化テーブルのカテゴリー別スコアも更新（削除・論理削除された診断の行は作らない）
+            cursor.executemany('''
+                INSERT OR REPLACE INTO diagnosis_categories (diagnosis_id, category, score, percentage)
+                VALUES (?, ?, ?, ?)
+            ''', [
+                (score_row[-1], cat['name'], cat['score'], cat.get('percentage'))
+                for score_row in live_rows
+                for cat in json.loads(score_row[4])
+            ])
+            
+            cursor.executemany('''
+                UPDATE diagnoses
+                SET total_score = ?, max_score = ?, percentage = ?, rank = ?,
+                    categories_json = ?, scoring_version = ?
+                WHERE id = ? AND deleted_at IS NULL
+            ''', score_rows)
+            
+            updated_rows = cursor.rowcount
+        
+        return updated_rows
+    
+    def get_category_stats(self):
+        """
+        カテゴリー別スコアの母集団統計を取得（集計テーブルを読むだけなのでO(1)）
+        
+        Returns:
+            dict: カテゴリーをキーとする統計情報
+                {
+                    'business': {'count': int, 'mean': float, 'std': float},
+                    ...
+                }
+        
+        Raises:
+            MigrationPendingError: 集計テーブルの集計し直し（backfill_population）が終わっていない場合
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            self._require_population(cursor)
+            
+            cursor.execute('''
+                SELECT category, count, score_sum, score_sum_sq FROM category_stats
+            ''')
+            
+            rows = cursor.fetchall()
+        
+        stats = {}
+        for category, count, score_sum, score_sum_sq in rows:
+            if count <= 0:
+                continue
+            mean = score_sum / count
+            variance = max(score_sum_sq / count - mean * mean, 0.0)
+            stats[category] = {'count': count, 'mean': mean, 'std': variance ** 0.5}
+        return stats
+    
+    def get_score_rank_counts(self, metric, score):
+        """
+        ヒストグラムから指定スコア未満・同点・全体の件数を取得
+        
+        スコアは0〜600点の固定グリッドなので、読む行数はデータ件数に依存しない。
+        
+        Args:
+            metric (str): カテゴリー名、または総合スコアなら 'total'
+            score (int): スコア
+        
+        Returns:
+            tuple: (スコア未満の件数, 同点の件数, 全件数)
+        
+        Raises:
+            MigrationPendingError: 集計テーブルの集計し直し（backfill_population）が終わっていない場合
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            self._require_population(cursor)
+            
+            cursor.execute('''
+                SELECT
+                    COALESCE(SUM(CASE WHEN score < ? THEN count ELSE 0 END), 0),
+                    COALESCE(SUM(CASE WHEN score = ? THEN count ELSE 0 END), 0),
+                    COALESCE(SUM(count), 0)
+                FROM score_histogram
+                WHERE metric = ?
+            ''', (score, score, metric))
+            
+            counts = cursor.fetchone()
+        
+        return counts
+    
+    def get_score_range(self, metric):
+        """
+        ヒストグラムから最低点と最高点を取得
+        
+        Args:
+            metric (str): カテゴリー名、または総合スコアなら 'total'
+        
+        Returns:
+            tuple: (最低点, 最高点)。診断がなければ (None, None)
+        
+        Raises:
+            MigrationPendingError: 集計テーブルの集計し直し（backfill_population）が終わっていない場合
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            self._require_population(cursor)
+            
+            cursor.execute('''
+                SELECT MIN(score), MAX(score) FROM score_histogram
+                WHERE metric = ? AND count > 0
+            ''', (metric,))
+            
+            score_range = cursor.fetchone()
+        
+        return score_range
+    
+    def get_population_percentile(self, metric, score):
+        """
+        保存済み診断の中でのパーセンタイル順位を取得（ヒストグラムを読むだけなので件数に関係なく一定時間）
+        
+        Args:
+            metric (str): カテゴリー名、または総合スコアなら 'total'
+            score (int): スコア
+        
+        Returns:
+            float: 0〜100のパーセンタイル（小数1桁）。母集団がない場合はNone
+        
+        Raises:
+            MigrationPendingError: 集計テーブルの集計し直しが終わっていない場合
+        """
+        return percentile_from_counts(*self.get_score_rank_counts(metric, score))
+    
+    def get_population_percentiles(self, scores):
+        """
+        総合スコアとカテゴリー別スコアのパーセンタイル順位をまとめて取得
+        
+        Args:
+            scores (dict): calculate_scores の戻り値
+        
+        Returns:
+            dict: {'total': パーセンタイル, カテゴリー: パーセンタイル, ...}（母集団がなければNone）
+        
+        Raises:
+            MigrationPendingError: 集計テーブルの集計し直しが終わっていない場合
+        """
+        percentiles = {'total': self.get_population_percentile('total', scores['total_score'])}
+        for category, score in scores['category_scores'].items():
+            percentiles[category] = self.get_population_percentile(category, score)
+        return percentiles
+    
+    def get_daily_summary(self, date_from=None, date_to=None):
+        """
+        日ごとの診断件数と平均スコアを集計テーブルから取得（古い順）
+        
+        Args:
+            date_from (date): この日以降（オプション）
+            date_to (date): この日以前（その日を含む、オプション）
+        
+        Returns:
+            list: 日ごとの辞書
+                [{'day': date, 'count': int, 'average_score': float,
+                  'average_percentage': float, 'ranks': {ランク: 件数}}, ...]
+        """
+        with self._connection() as conn:
+            rows = conn.execute('''
+                SELECT day, rank, count, score_sum, percentage_sum FROM daily_summary
+                WHERE (? IS NULL OR day >= ?) AND (? IS NULL OR day <= ?)
+                ORDER BY day
+            ''', self._day_range(date_from, date_to)).fetchall()
+        
+        days = {}
+        for day, rank, count, score_sum, percentage_sum in rows:
+            summary = days.setdefault(day, {'count': 0, 'score_sum': 0, 'percentage_sum': 0.0, 'ranks': {}})
+            summary['count'] += count
+            summary['score_sum'] += score_sum
+            summary['percentage_sum'] += percentage_sum
+            summary['ranks'][rank] = count
+        
+        return [
+            {
+                'day': datetime.strptime(day, '%Y-%m-%d').date(),
+                'count': summary['count'],
+                'average_score': summary['score_sum'] / summary['count'],
+                'average_percentage': summary['percentage_sum'] / summary['count'],
+                'ranks': summary['ranks']
+            }
+            for day, summary in days.items()
+            if summary['count'] > 0
+        ]
+    
+    def get_rank_distribution(self, date_from=None, date_to=None):
+        """
+        ランクごとの診断件数を集計テーブルから取得
+        
+        Args:
+            date_from (date): この日以降（オプション）
+            date_to (date): この日以前（その日を含む、オプション）
+        
+        Returns:
+            dict: ランク -> 件数
+        """
+        with self._connection() as conn:
+            rows = conn.execute('''
+                SELECT rank, SUM(count) FROM daily_summary
+                WHERE (? IS NULL OR day >= ?) AND (? IS NULL OR day <= ?)
+                GROUP BY rank
+                ORDER BY rank
+            ''', self._day_range(date_from, date_to)).fetchall()
+        
+        return {rank: count for rank, count in rows if count > 0}
+    
+    def get_category_score_buckets(self, month_from=None, month_to=None):
+        """
+        カテゴリーごとのスコア帯別の診断件数を集計テーブルから取得
+        
+        Args:
+            month_from (str): この月以降（'YYYY-MM'、オプション）
+            month_to (str): この月以前（'YYYY-MM'、その月を含む、オプション）
+        
+        Returns:
+            dict: カテゴリー -> {スコア帯の下限: 件数}（スコア帯は SUMMARY_BUCKET_WIDTH 点刻み）
+        """
+        with self._connection() as conn:
+            rows = conn.execute('''
+                SELECT category, bucket, SUM(count) FROM category_score_buckets
+                WHERE (? IS NULL OR month >= ?) AND (? IS NULL OR month <= ?)
+                GROUP BY category, bucket
+                ORDER BY category, bucket
+            ''', (month_from, month_from, month_to, month_to)).fetchall()
+        
+        buckets = {}
+        for category, bucket, count in rows:
+            if count > 0:
+                buckets.setdefault(category, {})[bucket] = count
+        return buckets
+    
+    @staticmethod
+    def _day_range(date_from, date_to):
+        """daily_summary の日付範囲の条件に渡すパラメータ"""
+        day_from = date_from.isoformat() if date_from is not None else None
+        day_to = date_to.isoformat() if date_to is not None else None
+        return (day_from, day_from, day_to, day_to)
+    
+    def _require_normalized_tables(self, conn):
+        """
+        正規化テーブルへの移行（アーカイブ済みの診断の分を含む）が済んでいることを確認
+        
+        移行が INLINE_BACKFILL_LIMIT を超えて起動時に行われなかった場合、
+        正規化テーブルを使う集計は一部の診断しか含まないので、途中の結果を返さずに例外にする。
+        
+        Args:
+            conn (sqlite3.Connection): 接続
+        
+        Raises:
+            MigrationPendingError: 移行が終わっていない場合
+        """
+        completed = conn.execute('''
+            SELECT MIN(completed) FROM migration_state
+            WHERE name IN ('normalized_tables', 'archived_child_rows')
+        ''').fetchone()[0]
+        if not completed:
+            raise MigrationPendingError(
+                "正規化テーブルへの移行が終わっていません。"
+                "python -m modules.migrate を実行してください"
+            )
+    
+    def get_answer_counts(self, question_id):
+        """
+        質問ごとの選択肢別の回答件数を取得（idx_answers_choice だけで集計）
+        
+        正規化テーブルはアーカイブしてもホットDBに残すので、アーカイブ済みの診断を含む全期間が対象
+        （論理削除した診断の行は論理削除のときに消すので含まない）。
+        
+        Args:
+            question_id (str): 質問ID
+        
+        Returns:
+            dict: 選択肢インデックス -> 件数
+        
+        Raises:
+            MigrationPendingError: 正規化テーブルへの移行が終わっていない場合
+        """
+        with self._connection() as conn:
+            self._require_normalized_tables(conn)
+            rows = conn.execute('''
+                SELECT choice_index, COUNT(*) FROM diagnosis_answers
+                WHERE question_id = ?
+                GROUP BY choice_index
+            ''', (question_id,)).fetchall()
+        
+        return dict(rows)
+    
+    def get_question_average_scores(self):
+        """
+        質問ごとの平均点を現在の配点で取得
+        
+        アーカイブ済みの診断を含む全期間が対象（論理削除した診断は含まない）。
+        
+        Returns:
+            dict: 質問ID -> {'count': 件数, 'average': 平均点}
+        
+        Raises:
+            MigrationPendingError: 正規化テーブルへの移行が終わっていない場合
+        """
+        with self._connection() as conn:
+            self._require_normalized_tables(conn)
+            rows = conn.execute('''
+                SELECT a.question_id, COUNT(*), AVG(c.score)
+                FROM diagnosis_answers AS a
+                JOIN question_choices AS c
+                    ON c.scoring_version = ?
+                   AND c.question_id = a.question_id
+                   AND c.choice_index = a.choice_index
+                GROUP BY a.question_id
+            ''', (SCORING_VERSION,)).fetchall()
+        
         return {
-            'id': row['id'],
-            'facility_name': row['facility_name'],
-            'diagnosis_date': datetime.fromisoformat(row['diagnosis_date']),
-            'total_score': row['total_score'],
-            'max_score': row['max_score'],
-            'percentage': row['percentage'],
-            'rank': row['rank'],
-            'categories': json.loads(row['categories_json']),
-            'answers': json.loads(row['answers_json']),
-            'session_id': row['session_id'],
-            'user_id': row['user_id'],
-            'created_at': datetime.fromisoformat(row['created_at'])
+            question_id: {'count': count, 'average': average}
+            for question_id, count, average in rows
         }
+    
+    def find_diagnoses_by_answer(self, question_id, choice_index, limit=100):
+        """
+        指定した選択肢を選んだ診断のIDを取得（新しい順）
+        
+        アーカイブ済みの診断のIDも返す（get_diagnosis_by_id で取得できる）。論理削除した診断は返さない。
+        
+        Args:
+            question_id (str): 質問ID
+            choice_index (int): 選択肢インデックス
+            limit (int): 取得件数
+        
+        Returns:
+            list: 診断IDのリスト
+        
+        Raises:
+            MigrationPendingError: 正規化テーブルへの移行が終わっていない場合
+        """
+        with self._connection() as conn:
+            self._require_normalized_tables(conn)
+            rows = conn.execute('''
+                SELECT diagnosis_id FROM diagnosis_answers
+                WHERE question_id = ? AND choice_index = ?
+                ORDER BY diagnosis_id DESC
+                LIMIT ?
+            ''', (question_id, choice_index, limit)).fetchall()
+        
+        return [row[0] for row in rows]
+    
+    def find_diagnoses_by_category_score(self, category, min_score=None, max_score=None, limit=100):
+        """
+        カテゴリースコアが範囲内の診断のIDを取得（スコアの低い順）
+        
+        アーカイブ済みの診断のIDも返す（get_diagnosis_by_id で取得できる）。論理削除した診断は返さない。
+        
+        Args:
+            category (str): カテゴリー名
+            min_score (int): 下限（オプション）
+            max_score (int): 上限（オプション）
+            limit (int): 取得件数
+        
+        Returns:
+            list: (診断ID, スコア) のリスト
+        
+        Raises:
+            MigrationPendingError: 正規化テーブルへの移行が終わっていない場合
+        """
+        conditions = ['category = ?']
+        params = [category]
+        if min_score is not None:
+            conditions.append('score >= ?')
+            params.append(min_score)
+        if max_score is not None:
+            conditions.append('score <= ?')
+            params.append(max_score)
+        params.append(limit)
+        
+        with self._connection() as conn:
+            self._require_normalized_tables(conn)
+            rows = conn.execute(f'''
+                SELECT diagnosis_id, score FROM diagnosis_categories
+                WHERE {' AND '.join(conditions)}
+                ORDER BY score, diagnosis_id
+                LIMIT ?
+            ''', params).fetchall()
+        
+        return rows
+    
+    @staticmethod
+    def _new_population_delta():
+        """集計テーブル（category_stats, score_histogram）の差分を入れる空の辞書"""
+        return {'stats': {}, 'histogram': {}}
+    
+    @staticmethod
+    def _accumulate_population(delta, categories, total_score, sign):
+        """
+        診断1件分のスコアを集計テーブルの差分に加算
+        
+        Args:
+            delta (dict): _new_population_delta で作った差分
+            categories (list): 診断データの categories（nameとscoreを持つ辞書のリスト）
+            total_score (int): 総合スコア
+            sign (int): 追加なら1、削除なら-1
+        """
+        stats = delta['stats']
+        histogram = delta['histogram']
+        for cat in categories:
+            score = cat['score']
+            category_delta = stats.setdefault(cat['name'], [0, 0, 0])
+            category_delta[0] += sign
+            category_delta[1] += sign * score
+            category_delta[2] += sign * score * score
+            key = (cat['name'], int(score))
+            histogram[key] = histogram.get(key, 0) + sign
+        key = ('total', int(total_score))
+        histogram[key] = histogram.get(key, 0) + sign
+    
+    @staticmethod
+    def _apply_population(cursor, delta):
+        """
+        集計テーブルの差分を category_stats と score_histogram に反映
+        
+        Args:
+            cursor (sqlite3.Cursor): トランザクション中のカーソル
+            delta (dict): _accumulate_population で作った差分
+        """
+        cursor.executemany('''
+            INSERT INTO category_stats (category, count, score_sum, score_sum_sq)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(category) DO UPDATE SET
+                count = count + excluded.count,
+                score_sum = score_sum + excluded.score_sum,
+                score_sum_sq = score_sum_sq + excluded.score_sum_sq
+        ''', [(category, *values) for category, values in delta['stats'].items()])
+        
+        cursor.executemany('''
+            INSERT INTO score_histogram (metric, score, count)
+            VALUES (?, ?, ?)
+            ON CONFLICT(metric, score) DO UPDATE SET
+                count = count + excluded.count
+        ''', [
+            (metric, score, count)
+            for (metric, score), count in delta['histogram'].items()
+            if count != 0
+        ])
+    
+    @staticmethod
+    def _apply_population_where(cursor, target, params, sign, counted_up_to=None):
+        """
+        target の診断をまとめて category_stats と score_histogram に足す・引く
+        
+        Args:
+            cursor (sqlite3.Cursor): トランザクション中のカーソル
+            target (str): 対象の診断IDを返す SELECT 文
+            params (list): target のパラメータ
+            sign (int): 追加なら1、削除なら-1
+            counted_up_to (int): このID以下の診断だけを対象にする（_population_counted_up_to の値。
+                                 Noneなら target のすべて）
+        """
+        if counted_up_to is not None:
+            target = f'SELECT id FROM diagnoses WHERE id IN ({target}) AND id <= {int(counted_up_to)}'
+        score = "json_extract(c.value, '$.score')"
+        cursor.execute(f'''
+            INSERT INTO category_stats (category, count, score_sum, score_sum_sq)
+            SELECT json_extract(c.value, '$.name'), ? * COUNT(*), ? * SUM({score}), ? * SUM({score} * {score})
+            FROM diagnoses AS d, json_each(d.categories_json) AS c
+            WHERE d.id IN ({target})
+            GROUP BY 1
+            ON CONFLICT(category) DO UPDATE SET
+                count = count + excluded.count,
+                score_sum = score_sum + excluded.score_sum,
+                score_sum_sq = score_sum_sq + excluded.score_sum_sq
+        ''', [sign, sign, sign, *params])
+        
+        cursor.execute(f'''
+            INSERT INTO score_histogram (metric, score, count)
+            SELECT json_extract(c.value, '$.name'), CAST({score} AS INTEGER), ? * COUNT(*)
+            FROM diagnoses AS d, json_each(d.categories_json) AS c
+            WHERE d.id IN ({target})
+            GROUP BY 1, 2
+            ON CONFLICT(metric, score) DO UPDATE SET
+                count = count + excluded.count
+        ''', [sign, *params])
+        cursor.execute(f'''
+            INSERT INTO score_histogram (metric, score, count)
+            SELECT 'total', total_score, ? * COUNT(*)
+            FROM diagnoses
+            WHERE id IN ({target})
+            GROUP BY 2
+            ON CONFLICT(metric, score) DO UPDATE SET
+                count = count + excluded.count
+        ''', [sign, *params])
+
+
+class BatchWriter:
+    """
+    DBファイルごとの単一の書き込みスレッド
+    
+    保存依頼をキューで受け取り、window 秒以内に届いた依頼（最大 max_batch 件）を
+    save_diagnoses で1トランザクションにまとめて書き込む。
+    キューには上限があり、満杯のときは submit が空きを待つ（背圧）。
+    """
+    
+    # キューに入れる制御用の印
+    _FLUSH = object()
+    _STOP = object()
+    
+    def __init__(self, db, window=WRITER_BATCH_WINDOW, max_batch=WRITER_MAX_BATCH,
+                 max_queue=WRITER_QUEUE_SIZE):
+        """
+        初期化（書き込みスレッドを起動する）
+        
+        Args:
+            db (DiagnosisDatabase): 書き込み先データベース
+            window (float): 最初の依頼から後続の依頼を待つ秒数
+            max_batch (int): 1トランザクションあたりの件数の上限
+            max_queue (int): キューに溜められる依頼数の上限
+        """
+        self.db = db
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._putting = 0
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name=f"BatchWriter({db.db_path})", daemon=True
+        )
+        self._thread.start()
+    
+    def submit(self, diagnosis_data, timeout=None):
+        """
+        診断データの保存を依頼
+        
+        Args:
+            diagnosis_data (dict): save_diagnosis と同じ形式の診断データ
+            timeout (float): キューが満杯のときに空きを待つ秒数（Noneなら空くまで待つ）
+        
+        Returns:
+            concurrent.futures.Future: 保存された診断のIDを返すFuture
+        """
+        future = Future()
+        self._put(diagnosis_data, future, timeout)
+        return future
+    
+    def flush(self, timeout=None):
+        """
+        それまでに依頼された保存が全て書き込まれるまで待つ
+        
+        Args:
+            timeout (float): 待つ秒数の上限（Noneなら完了まで待つ）
+        """
+        future = Future()
+        self._put(self._FLUSH, future, timeout)
+        future.result(timeout=timeout)
+    
+    def close(self, timeout=None):
+        """
+        残りの依頼を全て書き込んでから書き込みスレッドを終了
+        
+        Args:
+            timeout (float): 終了を待つ秒数の上限（Noneなら終了まで待つ）
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put((self._STOP, None))
+        self._thread.join(timeout)
+    
+    def _put(self, item, future, timeout):
+        """
+        依頼をキューに入れる（close 後は受け付けない）
+        
+        キューの空きはロックの外で待つので、満杯のときもほかの依頼や close は
+        それぞれの timeout で待てる。close と行き違って終了の印より後に入った依頼は
+        書き込みスレッドが失敗させる（_fail_pending）。
+        
+        Raises:
+            RuntimeError: close 後に呼ばれた場合
+            queue.Full: timeout 秒待ってもキューが空かなかった場合
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("BatchWriter は既に終了しています")
+            self._putting += 1
+        try:
+            self._queue.put((item, future), timeout=timeout)
+        finally:
+            with self._lock:
+                self._putting -= 1
+    
+    def _run(self):
+        """書き込みスレッド本体"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            
+            # 制御用の印が来るまで、window 秒以内に届いた依頼をまとめる
+            while len(batch) < self.max_batch and batch[-1][0] not in (self._FLUSH, self._STOP):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            self._write([
+                (item, future) for item, future in batch
+                if item is not self._FLUSH and item is not self._STOP
+            ])
+            
+            for item, future in batch:
+                if item is self._FLUSH:
+                    future.set_result(None)
+                elif item is self._STOP:
+                    self._fail_pending()
+                    return
+    
+    def _fail_pending(self):
+        """終了の印より後にキューに入った依頼を、Futureが待ち続けないように失敗させる"""
+        error = RuntimeError("BatchWriter は既に終了しています")
+        while True:
+            try:
+                _, future = self._queue.get(timeout=0.01)
+            except queue.Empty:
+                # close 後は新しい依頼が始まらないので、キューに入れている途中の依頼がなく
+                # キューが空なら、もう何も届かない
+                with self._lock:
+                    if not self._putting and self._queue.empty():
+                        return
+                continue
+            if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(error)
+    
+    def _write(self, requests):
+        """依頼をまとめて保存し、各Futureに結果を設定"""
+        requests = [
+            (item, future) for item, future in requests
+            if future.set_running_or_notify_cancel()
+        ]
+        if not requests:
+            return
+        
+        try:
+            diagnosis_ids = self.db.save_diagnoses([item for item, _ in requests])
+        except Exception as e:
+            if len(requests) == 1:
+                requests[0][1].set_exception(e)
+                return
+            # どの依頼が原因か分からないので1件ずつ保存し直す
+            for item, future in requests:
+                try:
+                    future.set_result(self.db.save_diagnosis(item))
+                except Exception as item_error:
+                    future.set_exception(item_error)
+            return
+        
+        for (_, future), diagnosis_id in zip(requests, diagnosis_ids):
+            future.set_result(diagnosis_id)
+
+
+# DBファイルのパス -> 書き込みスレッド
+_WRITERS = {}
+
+
+def get_batch_writer(db):
+    """
+    DBファイルの書き込みスレッドを取得（なければ起動）
+    
+    Args:
+        db (DiagnosisDatabase): 書き込み先データベース
+    
+    Returns:
+        BatchWriter: 書き込みスレッド
+    """
+    key = str(Path(db.db_path).resolve())
+    with _POOLS_LOCK:
+        writer = _WRITERS.get(key)
+        # fork後の子プロセスには親のスレッドが引き継がれないので作り直す
+        if writer is None or writer._pid != os.getpid():
+            writer = _WRITERS[key] = BatchWriter(db)
+        return writer
+
+
+@atexit.register
+def close_batch_writers():
+    """終了時に全ての書き込みスレッドの残りの依頼を書き込む"""
+    with _POOLS_LOCK:
+        writers = [writer for writer in _WRITERS.values() if writer._pid == os.getpid()]
+        _WRITERS.clear()
+    for writer in writers:
+        writer.close()
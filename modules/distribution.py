@@ -0,0 +1,180 @@
+"""
+理論スコア分布
+各質問の選択肢が一定の確率で選ばれると仮定したときの、カテゴリー別・総合スコアの
+正確な分布を、質問ごとの分布の畳み込みで求める
+
+インポート時に一様分布（全選択肢が等確率）で1回だけ計算してキャッシュするため、
+保存済みの診断がない環境でも、各問い合わせは配列参照だけで済む
+"""
+
+import numpy as np
+
+from modules.questions import QUESTIONS, get_question_by_id
+from modules.scoring import CATEGORY_KEYS, as_choice_index
+
+
+def _question_pmf(question, probabilities=None):
+    """
+    1問分のスコア分布（インデックス = 点数）
+
+    Args:
+        question (dict): QUESTIONS の質問
+        probabilities (list): 選択肢ごとの確率（省略時は一様）
+
+    Returns:
+        np.ndarray: 点数ごとの確率
+    """
+    scores = [choice["score"] for choice in question["choices"]]
+    if probabilities is None:
+        probabilities = [1.0 / len(scores)] * len(scores)
+    probabilities = np.asarray(probabilities, dtype=float)
+    probabilities = probabilities / probabilities.sum()
+
+    pmf = np.zeros(max(scores) + 1)
+    np.add.at(pmf, scores, probabilities)
+    return pmf
+
+
+def build_distributions(choice_probabilities=None):
+    """
+    カテゴリー別・総合スコアの分布を畳み込みで計算
+
+    Args:
+        choice_probabilities (dict): 質問ID -> 選択肢ごとの確率のリスト
+                                    （省略した質問は一様分布）
+                                    例: 保存済み診断の回答比率
+
+    Returns:
+        dict: カテゴリー名（総合は "total"）-> {"pmf": 点数ごとの確率,
+                                                 "sf": 点数以上になる確率,
+                                                 "mean": 期待値}
+    """
+    choice_probabilities = choice_probabilities or {}
+
+    pmfs = {}
+    for category in CATEGORY_KEYS:
+        pmf = np.ones(1)
+        for question in QUESTIONS[category]:
+            pmf = np.convolve(pmf, _question_pmf(question, choice_probabilities.get(question["id"])))
+        pmfs[category] = pmf
+
+    total = np.ones(1)
+    for category in CATEGORY_KEYS:
+        total = np.convolve(total, pmfs[category])
+    pmfs["total"] = total
+
+    distributions = {}
+    for metric, pmf in pmfs.items():
+        distributions[metric] = {
+            "pmf": pmf,
+            "sf": np.cumsum(pmf[::-1])[::-1],
+            "mean": float(np.dot(np.arange(len(pmf)), pmf))
+        }
+    return distributions
+
+
+def _upgrade_gains(scores, probabilities=None):
+    """
+    現在の選択肢ごとの「より高い選択肢へ改善したときの増加点の期待値」
+    （最後の要素は未回答の場合）
+
+    改善先は選択肢の確率で重み付けする。改善先の確率がすべて0なら等確率とする。
+
+    Args:
+        scores (list): 選択肢ごとの点数
+        probabilities (list): 選択肢ごとの確率（省略時は一様）
+
+    Returns:
+        list: 増加点の期待値
+    """
+    if probabilities is None:
+        probabilities = [1.0] * len(scores)
+    gains = []
+    for current in scores + [0]:
+        upgrades = [(score - current, p) for score, p in zip(scores, probabilities) if score > current]
+        weight = sum(p for _, p in upgrades)
+        if not upgrades:
+            gains.append(0.0)
+        elif weight > 0:
+            gains.append(sum(gain * p for gain, p in upgrades) / weight)
+        else:
+            gains.append(sum(gain for gain, _ in upgrades) / len(upgrades))
+    return gains
+
+
+def _build_expected_gains():
+    """
+    質問ID -> 一様分布での _upgrade_gains
+    """
+    return {
+        question["id"]: _upgrade_gains([choice["score"] for choice in question["choices"]])
+        for questions in QUESTIONS.values()
+        for question in questions
+    }
+
+
+# 一様分布での理論分布（インポート時に1回だけ計算）
+UNIFORM_DISTRIBUTIONS = build_distributions()
+
+# 一様分布での質問ごとの改善時の増加点の期待値
+_EXPECTED_GAINS = _build_expected_gains()
+
+
+def probability_at_least(metric, score, distributions=None):
+    """
+    理論分布で指定点数以上になる確率
+
+    Args:
+        metric (str): カテゴリー名、または総合スコアなら "total"
+        score (int): 点数
+        distributions (dict): build_distributions の戻り値（省略時は一様分布）
+
+    Returns:
+        float: 0〜1の確率
+    """
+    sf = (distributions or UNIFORM_DISTRIBUTIONS)[metric]["sf"]
+    if score <= 0:
+        return 1.0
+    if score >= len(sf):
+        return 0.0
+    return float(sf[int(score)])
+
+
+def expected_score(metric, distributions=None):
+    """
+    理論分布での期待値
+
+    Args:
+        metric (str): カテゴリー名、または総合スコアなら "total"
+        distributions (dict): build_distributions の戻り値（省略時は一様分布）
+
+    Returns:
+        float: 期待値
+    """
+    return (distributions or UNIFORM_DISTRIBUTIONS)[metric]["mean"]
+
+
+def expected_gain(question_id, current_choice=None, probabilities=None):
+    """
+    質問の回答を今より高い選択肢に改善したときの増加点の期待値
+
+    改善先の選択肢は probabilities（例: 保存済み診断の回答比率）で重み付けする。
+
+    Args:
+        question_id (str): 質問ID
+        current_choice (int): 現在の選択肢インデックス（未回答ならNone）
+        probabilities (list): 選択肢ごとの確率（省略時は一様分布）
+
+    Returns:
+        float: 増加点の期待値（既に最高点なら0）
+    """
+    gains = _EXPECTED_GAINS.get(question_id)
+    if gains is None:
+        return 0.0
+    if probabilities is not None:
+        gains = _upgrade_gains([choice["score"] for choice in get_question_by_id(question_id)["choices"]],
+                               probabilities)
+    current_choice = as_choice_index(current_choice)
+    if current_choice is not None and 0 <= current_choice < len(gains) - 1:
+        return gains[current_choice]
+    return gains[-1]
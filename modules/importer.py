@@ -0,0 +1,411 @@
+"""
+診断結果の一括取り込み
+ReportExporter が出力した JSON / CSV ファイルを読み込み、現在の質問データ
+（modules/questions.py）で検証・再採点してからデータベースへまとめて保存する
+
+対応する形式:
+    - JSON: export_to_json の出力（1件のオブジェクト）、その配列、
+            またはオブジェクトを1行ずつ並べたもの（NDJSON）
+    - CSV: export_answers_to_csv の出力（回答詳細）。export_to_csv の出力
+           （サマリー）を直前に連結しておくと、診断日と施設名も取り込む
+
+使い方:
+    python -m modules.importer exports/*.json exports/*.csv --db data/diagnoses.db
+
+処理時間の目安（既知の課題）:
+    10万件（質問文を含む NDJSON で約530MB）の取り込みに約50秒かかり、目標の数秒には届いていない。
+    JSON のデコードに約12秒、検証・再採点に約6秒、保存に約30秒（diagnoses の索引・トリガーの
+    更新と、diagnosis_answers への60万行の挿入）で、いずれも SQLite・json の内部処理が大半を占める。
+"""
+
+import argparse
+import csv
+import json
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+from modules.answer_codec import ANSWER_LAYOUT
+from modules.database import DiagnosisDatabase, MigrationPendingError
+from modules.questions import QUESTIONS
+from modules.rescoring import build_categories
+from modules.scoring import (
+    CATEGORY_KEYS,
+    answers_to_choice_matrix,
+    as_choice_index,
+    build_scores,
+    get_industry_averages,
+    get_readiness_rank,
+    score_choice_matrix
+)
+
+# 質問ID -> 選択肢数
+_CHOICE_COUNTS = {
+    question['id']: len(question['choices'])
+    for questions in QUESTIONS.values()
+    for question in questions
+}
+
+# CSV の質問文・質問番号 -> 質問ID
+_QUESTION_ID_BY_TEXT = {text: question_id for _, _, _, question_id, text in ANSWER_LAYOUT}
+_QUESTION_ID_BY_NUMBER = {number: question_id for _, _, number, question_id, _ in ANSWER_LAYOUT}
+
+# 未回答として扱う回答値
+_UNANSWERED_VALUES = {None, '', '選択されていません'}
+
+# JSON のレコード間の区切り（空白・カンマ・配列の括弧）
+_JSON_SEPARATORS = re.compile(r'[\s,\[\]]*')
+
+# JSON の次のレコードの先頭の候補（行頭の字下げに続く "{"）
+_JSON_RECORD_START = re.compile(r'\n([ \t]*)\{')
+
+# CSV の見出し行
+_SUMMARY_HEADER = '診断日'
+_ANSWERS_HEADER = ('カテゴリー', '質問番号')
+
+
+class ImportRecordError(ValueError):
+    """取り込めない診断レコード"""
+
+
+def iter_json_records(fp, read_size=65536):
+    """
+    JSON ファイルから診断レコードを1件ずつ読み出す
+
+    ファイル全体を読み込まず、read_size ずつ読みながら先頭から順にデコードする。
+    単一オブジェクト・配列・NDJSON のいずれにも対応する。
+
+    JSON として読めないレコードがあれば、次のレコードの先頭（そのレコード以下の字下げで
+    "{" から始まる行）まで読み飛ばし、その位置に ImportRecordError を返して続きを読む。
+    NDJSON と export_to_json の出力（indent=2）は、レコードの途中の行がそのレコードより
+    浅い字下げの "{" で始まることがないため、次のレコードから読み直せる。
+
+    Args:
+        fp: テキストモードで開いたファイル
+        read_size (int): 1回に読み込む文字数
+
+    Yields:
+        dict: 診断レコード（読めなかったレコードの位置では ImportRecordError）
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    indent = 0
+    eof = False
+
+    while True:
+        # レコード間の区切りを読み飛ばし、次のレコードの行頭の字下げを記録する
+        end = _JSON_SEPARATORS.match(buffer, position).end()
+        newline = buffer.rfind('\n', position, end)
+        if newline >= 0:
+            indent = end - newline - 1
+        position = end
+
+        if position < len(buffer):
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                resync = _next_json_record(buffer, position, indent)
+                if resync is not None or eof:
+                    yield ImportRecordError(f"JSON として読めません: {e.msg}")
+                    if resync is None:
+                        return
+                    position = resync
+                    continue
+            else:
+                yield record
+                continue
+        elif eof:
+            return
+
+        data = fp.read(read_size)
+        if not data:
+            eof = True
+        buffer = buffer[position:] + data
+        position = 0
+
+
+def _next_json_record(buffer, start, indent):
+    """start より後にある、字下げが indent 以下の "{" で始まる行の "{" の位置（なければNone）"""
+    for match in _JSON_RECORD_START.finditer(buffer, start):
+        if len(match.group(1)) <= indent:
+            return match.end() - 1
+    return None
+
+
+def iter_csv_records(fp):
+    """
+    CSV ファイルから診断レコードを1件ずつ読み出す
+
+    回答詳細の見出し行ごとに新しい診断として扱う。直前にサマリーがあれば
+    その診断日・施設名を引き継ぐ。
+
+    Args:
+        fp: テキストモードで開いたファイル（newline=''）
+
+    Yields:
+        dict: {'diagnosis_date', 'facility_name', 'answers'} の診断レコード
+    """
+    summary = {}
+    record = None
+    expect_summary = False
+
+    for row in csv.reader(fp):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        head = row[0].strip()
+
+        if head == _SUMMARY_HEADER:
+            if record is not None:
+                yield record
+                record = None
+            summary = {}
+            expect_summary = True
+        elif expect_summary:
+            summary = {
+                'diagnosis_date': row[0],
+                'facility_name': row[1] if len(row) > 1 else ''
+            }
+            expect_summary = False
+        elif tuple(cell.strip() for cell in row[:2]) == _ANSWERS_HEADER:
+            if record is not None:
+                yield record
+            record = dict(summary, answers=[])
+            summary = {}
+        elif record is not None and len(row) >= 4:
+            record['answers'].append({
+                'number': row[1],
+                'question': row[2],
+                'answer': row[3]
+            })
+
+    if record is not None:
+        yield record
+
+
+def iter_import_records(path):
+    """
+    ファイルの拡張子に応じて診断レコードを1件ずつ読み出す
+
+    Args:
+        path (str): .json / .jsonl / .ndjson / .csv ファイルのパス
+
+    Yields:
+        dict: 診断レコード
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix in ('.json', '.jsonl', '.ndjson'):
+        with open(path, encoding='utf-8-sig') as fp:
+            yield from iter_json_records(fp)
+    elif suffix == '.csv':
+        with open(path, encoding='utf-8-sig', newline='') as fp:
+            yield from iter_csv_records(fp)
+    else:
+        raise ValueError(f"対応していないファイル形式です: {path}")
+
+
+def _parse_choice(question_id, value):
+    """回答値を選択肢インデックスに変換（未回答ならNone。bool や端数のある小数は受け付けない）"""
+    if type(value) is int and 0 <= value < _CHOICE_COUNTS[question_id]:
+        return value
+    if isinstance(value, str):
+        value = value.strip()
+        if value in _UNANSWERED_VALUES:
+            return None
+        choice = int(value) if value.isdecimal() else None
+    elif value is None:
+        return None
+    elif isinstance(value, float) and value.is_integer():
+        # JSON で 2.0 のように書き出された選択肢番号
+        choice = int(value)
+    else:
+        choice = as_choice_index(value)
+    if choice is None:
+        raise ImportRecordError(f"{question_id} の回答が選択肢番号ではありません: {value!r}")
+    if not 0 <= choice < _CHOICE_COUNTS[question_id]:
+        raise ImportRecordError(f"{question_id} の回答が選択肢の範囲外です: {choice}")
+    return choice
+
+
+def _resolve_question_id(answer):
+    """回答1件から質問IDを特定（ID → 質問文 → 質問番号の順）"""
+    question_id = answer.get('question_id')
+    if question_id is None:
+        question_id = _QUESTION_ID_BY_TEXT.get(str(answer.get('question', '')).strip())
+    if question_id is None:
+        try:
+            question_id = _QUESTION_ID_BY_NUMBER.get(int(answer.get('number')))
+        except (TypeError, ValueError):
+            pass
+    if question_id not in _CHOICE_COUNTS:
+        raise ImportRecordError(
+            f"質問を特定できません: {answer.get('question_id') or answer.get('question') or answer.get('number')!r}"
+        )
+    return question_id
+
+
+def validate_record(record):
+    """
+    診断レコードを検証し、回答辞書と診断日に変換
+
+    Args:
+        record (dict): iter_import_records が返すレコード
+
+    Returns:
+        tuple: ({質問ID: 選択肢インデックス}, 診断日 datetime)
+
+    Raises:
+        ImportRecordError: 質問や回答が現在の質問データと一致しない場合
+    """
+    if isinstance(record, ImportRecordError):
+        raise record
+    if not isinstance(record, dict):
+        raise ImportRecordError("診断レコードがオブジェクトではありません")
+
+    raw_answers = record.get('answers')
+    if isinstance(raw_answers, dict):
+        raw_answers = [
+            {'question_id': question_id, 'answer': value}
+            for question_id, value in raw_answers.items()
+        ]
+    if not raw_answers:
+        raise ImportRecordError("回答がありません")
+
+    answers = {}
+    for answer in raw_answers:
+        if not isinstance(answer, dict):
+            raise ImportRecordError("回答の形式が正しくありません")
+        question_id = answer.get('question_id')
+        if question_id not in _CHOICE_COUNTS:
+            question_id = _resolve_question_id(answer)
+        choice = _parse_choice(question_id, answer.get('answer'))
+        if choice is not None:
+            answers[question_id] = choice
+
+    diagnosis_date = record.get('diagnosis_date')
+    if diagnosis_date:
+        try:
+            diagnosis_date = datetime.fromisoformat(str(diagnosis_date).strip())
+        except ValueError:
+            raise ImportRecordError(f"診断日の形式が正しくありません: {diagnosis_date!r}")
+    else:
+        diagnosis_date = datetime.now()
+
+    return answers, diagnosis_date
+
+
+def build_diagnoses(records, averages):
+    """
+    検証済みのレコードをまとめて再採点し、save_diagnoses に渡す形式にする
+
+    Args:
+        records (list): (元のレコード, 回答辞書, 診断日) のリスト
+        averages (dict): 業界平均値
+
+    Returns:
+        list: save_diagnoses に渡す診断データのリスト（answers は回答辞書のまま渡す）
+    """
+    category_matrix, total_scores = score_choice_matrix(
+        answers_to_choice_matrix([answers for _, answers, _ in records])
+    )
+
+    diagnoses = []
+    for (record, answers, diagnosis_date), category_row, total in zip(
+        records, category_matrix.tolist(), total_scores.tolist()
+    ):
+        scores = build_scores(dict(zip(CATEGORY_KEYS, category_row)), total)
+        diagnoses.append({
+            'facility_name': record.get('facility_name') or '',
+            'diagnosis_date': diagnosis_date,
+            'total_score': scores['total_score'],
+            'max_score': scores['max_score'],
+            'percentage': scores['percentage'],
+            'rank': get_readiness_rank(scores['total_score']),
+            'categories': build_categories(scores['category_scores'], averages),
+            'answers': answers,
+            'session_id': record.get('session_id') or '',
+            'user_id': record.get('user_id') or ''
+        })
+    return diagnoses
+
+
+def import_diagnoses(db, paths, batch_size=5000, progress=None):
+    """
+    エクスポートファイルの診断をまとめてデータベースに取り込む
+
+    ファイルは1件ずつ読み進め、batch_size 件ごとに1トランザクションで保存する。
+    検証に失敗したレコードは読み飛ばし、理由を errors に記録する。
+
+    Args:
+        db (DiagnosisDatabase): 取り込み先データベース
+        paths (list): 取り込むファイルのパス
+        batch_size (int): 1トランザクションあたりの件数
+        progress (callable): バッチ保存ごとに累計件数を渡されるコールバック（オプション）
+
+    Returns:
+        dict: {'imported': 取り込んだ件数, 'errors': [(ファイル, レコード番号, 理由), ...]}
+    """
+    try:
+        averages = get_industry_averages(db.get_category_stats())
+    except MigrationPendingError:
+        # 集計し直しの途中は固定の業界平均を使う
+        averages = get_industry_averages()
+    imported = 0
+    errors = []
+    batch = []
+
+    def flush():
+        nonlocal imported
+        imported += len(db.save_diagnoses(build_diagnoses(batch, averages)))
+        batch.clear()
+        if progress:
+            progress(imported)
+
+    for path in paths:
+        try:
+            for number, record in enumerate(iter_import_records(path), start=1):
+                try:
+                    answers, diagnosis_date = validate_record(record)
+                except ImportRecordError as e:
+                    errors.append((str(path), number, str(e)))
+                    continue
+                batch.append((record, answers, diagnosis_date))
+                if len(batch) >= batch_size:
+                    flush()
+        except (OSError, ValueError) as e:
+            errors.append((str(path), None, str(e)))
+
+    if batch:
+        flush()
+
+    return {'imported': imported, 'errors': errors}
+
+
+def main(argv=None):
+    """コマンドラインから一括取り込みを実行"""
+    parser = argparse.ArgumentParser(description="エクスポートされた診断結果を一括で取り込みます")
+    parser.add_argument("paths", nargs="+", help="取り込む JSON / CSV ファイル")
+    parser.add_argument("--db", default="data/diagnoses.db", help="データベースファイルのパス")
+    parser.add_argument("--batch-size", type=int, default=5000, help="1トランザクションあたりの件数")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    result = import_diagnoses(
+        DiagnosisDatabase(args.db),
+        args.paths,
+        batch_size=args.batch_size,
+        progress=lambda n: print(f"  {n}件 取り込み済み", flush=True)
+    )
+    elapsed = time.perf_counter() - started
+
+    for path, number, reason in result['errors']:
+        location = f"{path}:{number}" if number is not None else path
+        print(f"  スキップ {location}: {reason}")
+    print(f"完了: {result['imported']}件を取り込みました"
+          f"（スキップ {len(result['errors'])}件, {elapsed:.1f}秒）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+データベース移行のコマンドライン
+既存の診断を集計テーブル（category_stats, score_histogram）に集計し直し、
+正規化テーブル（diagnosis_categories, diagnosis_answers）に移行する。
+アーカイブ済みの診断の正規化テーブルの行も作り直す
+（件数が INLINE_BACKFILL_LIMIT 以下なら起動時に自動で移行される）
+
+--compact-answers を付けると、回答JSONを回答バイト列に置き換える。
+回答JSONは元に戻せないので、起動時には実行されない。バックアップを取ってから実行する。
+
+使い方:
+    python -m modules.migrate --db data/diagnoses.db --chunk-size 2000
+    python -m modules.migrate --db data/diagnoses.db --compact-answers --vacuum
+"""
+
+import argparse
+import time
+
+from modules.database import DiagnosisDatabase
+
+
+def main(argv=None):
+    """コマンドラインから移行を実行"""
+    parser = argparse.ArgumentParser(description="既存の診断を正規化テーブルに移行します")
+    parser.add_argument("--db", default="data/diagnoses.db", help="データベースファイルのパス")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="1トランザクションあたりの件数")
+    parser.add_argument("--compact-answers", action="store_true",
+                        help="回答JSONを回答バイト列に置き換える（元に戻せません）")
+    parser.add_argument("--vacuum", action="store_true", help="移行後に VACUUM して空き領域を解放する")
+    args = parser.parse_args(argv)
+
+    db = DiagnosisDatabase(args.db)
+    started = time.perf_counter()
+    db.backfill_population(
+        chunk_size=args.chunk_size,
+        progress=lambda n: print(f"  {n}件 集計済み", flush=True)
+    )
+    count = db.backfill_normalized_tables(
+        chunk_size=args.chunk_size,
+        progress=lambda n: print(f"  {n}件 移行済み", flush=True)
+    )
+    count += db.backfill_archived_child_rows(
+        chunk_size=args.chunk_size,
+        progress=lambda n: print(f"  {n}件 アーカイブ済みの診断を移行済み", flush=True)
+    )
+    message = f"{count}件を移行しました"
+    if args.compact_answers:
+        compacted = db.compact_answers(
+            chunk_size=args.chunk_size,
+            progress=lambda n: print(f"  {n}件 回答を確認済み", flush=True)
+        )
+        message = f"{count}件を移行し、{compacted}件の回答を圧縮しました"
+    if args.vacuum:
+        db.vacuum()
+    elapsed = time.perf_counter() - started
+    print(f"完了: {message}（{elapsed:.1f}秒）")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,8 +22,12 @@ import subprocess
 import urllib.request
 import zipfile
 import shutil
-from modules.scoring import INDUSTRY_AVERAGES
-from modules.questions import CATEGORIES
+from modules.scoring import (
+    INDUSTRY_AVERAGES,
+    find_minimum_upgrades,
+    get_top_question_gains
+)
+from modules.questions import CATEGORIES, get_question_by_id
 
 # 日本語フォント設定（japanize-matplotlibの代替）
 def setup_japanese_font():
@@ -390,8 +394,8 @@ class DiagnosticPDFGenerator:
         
         return styles
     
-    def create_radar_chart_image(self, scores_dict):
-        """レーダーチャートを画像として生成"""
+    def create_radar_chart_image(self, scores_dict, industry_averages=None):
+        """レーダーチャートを画像として生成（業界平均を省略すると INDUSTRY_AVERAGES の固定値）"""
         # カテゴリー名のリストとスコアのリストを取得
         categories = list(scores_dict.keys())
         values = list(scores_dict.values())
@@ -411,7 +415,9 @@ class DiagnosticPDFGenerator:
                     break
         
         # 業界平均値をカテゴリー順に取得
-        industry_avg = [INDUSTRY_AVERAGES.get(key, 50) for key in category_keys]
+        if industry_averages is None:
+            industry_averages = INDUSTRY_AVERAGES
+        industry_avg = [industry_averages.get(key, 50) for key in category_keys]
         
         # データの整合性チェック
         if len(industry_avg) != len(values):
@@ -500,7 +506,9 @@ class DiagnosticPDFGenerator:
                     'rank': str,
                     'categories': list,
                     'top3_improvements': list,
-                    'answers': list
+                    'answers': list,
+                    'industry_averages': dict (optional),
+                    'population_percentiles': dict (optional)
                 }
             filename (str): 出力ファイル名
         
@@ -554,7 +562,9 @@ class DiagnosticPDFGenerator:
         
         # レーダーチャート挿入
         scores_dict = {cat['name']: cat['score'] for cat in diagnosis_data['categories']}
-        radar_image_buffer = self.create_radar_chart_image(scores_dict)
+        radar_image_buffer = self.create_radar_chart_image(
+            scores_dict, diagnosis_data.get('industry_averages')
+        )
         radar_img = Image(radar_image_buffer, width=140*mm, height=140*mm)
         story.append(radar_img)
         
@@ -576,6 +586,9 @@ class DiagnosticPDFGenerator:
             story.append(cat_heading)
             
             comment = f"スコア: {cat['score']}/100点（{cat['percentage']:.1f}%）<br/>"
+            percentile = (diagnosis_data.get('population_percentiles') or {}).get(cat['name'])
+            if percentile is not None:
+                comment += f"保存済み診断の中で {percentile:.0f} パーセンタイルです。<br/>"
             comment += cat.get('comment', 'このカテゴリーの改善が推奨されます。')
             story.append(Paragraph(comment, self.styles['CustomBody']))
             story.append(Spacer(1, 5*mm))
@@ -630,6 +643,50 @@ class DiagnosticPDFGenerator:
             story.append(Paragraph(priority_text, self.styles['CustomBody']))
             story.append(Spacer(1, 8*mm))
         
+        # 質問別の改善優先度（保存済み診断の場合は回答から求める）
+        question_priorities = diagnosis_data.get('question_priorities')
+        if question_priorities is None and diagnosis_data.get('answers'):
+            question_priorities = get_top_question_gains(diagnosis_data['answers'], k=5)
+        if question_priorities:
+            story.append(Paragraph("質問別の改善優先度 TOP5", self.styles['CustomHeading2']))
+            priorities_text = ""
+            for i, priority in enumerate(question_priorities, 1):
+                question = get_question_by_id(priority['question_id'])
+                current_text = (
+                    question['choices'][priority['current_choice']]['text']
+                    if priority['current_choice'] is not None else '未回答'
+                )
+                priorities_text += (
+                    f"{i}. {question['text']}<br/>"
+                    f"　現在: {current_text} ／ 伸びしろ +{priority['headroom']}点<br/>"
+                )
+            story.append(Paragraph(priorities_text, self.styles['CustomBody']))
+            story.append(Spacer(1, 8*mm))
+        
+        # 次のランクへの最短ステップ（保存済み診断の場合は回答から求める）
+        next_rank_plan = diagnosis_data.get('next_rank_plan')
+        if next_rank_plan is None and diagnosis_data.get('answers'):
+            next_rank_plan = find_minimum_upgrades(diagnosis_data['answers'])
+        if next_rank_plan and next_rank_plan['reachable'] and next_rank_plan['changes']:
+            story.append(Paragraph("次のランクへの最短ステップ", self.styles['CustomHeading2']))
+            steps_text = (
+                f"ランク{next_rank_plan['target_rank']}（{next_rank_plan['target_score']}点以上）まで、"
+                f"あと{len(next_rank_plan['changes'])}問の改善で到達できます。<br/>"
+            )
+            for step, change in enumerate(next_rank_plan['changes'], 1):
+                question = get_question_by_id(change['question_id'])
+                current_text = (
+                    question['choices'][change['current_choice']]['text']
+                    if change['current_choice'] is not None else '未回答'
+                )
+                new_text = question['choices'][change['new_choice']]['text']
+                steps_text += (
+                    f"{step}. {question['text']}<br/>"
+                    f"　{current_text} → <b>{new_text}</b>（+{change['gain']}点）<br/>"
+                )
+            story.append(Paragraph(steps_text, self.styles['CustomBody']))
+            story.append(Spacer(1, 8*mm))
+        
         story.append(PageBreak())
         
         # ==================== 5ページ目: 質問回答詳細 ====================
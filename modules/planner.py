@@ -0,0 +1,341 @@
+"""
+予算内の改善プラン
+回答の改善（質問ごとの選択肢の引き上げ）に費用を設定し、
+予算内で総合スコアを最大化する、または目標ランクに最小費用で届く組み合わせを
+多肢選択ナップサック問題として動的計画法で求める
+
+費用表の形式（JSON）:
+    {"b1": [0, 10, 30, 60, 100], "d1": [0, 50, 120], ...}
+    質問IDごとに「その選択肢の水準に到達するための累計費用」を選択肢の順に並べる。
+    現在の選択肢から引き上げる費用は両者の差（未回答からは到達費用そのまま）。
+    費用表にない質問は、1点あたり DEFAULT_COST_PER_POINT の費用とみなす。
+
+使い方:
+    python -m modules.planner --budget 100 --costs costs.json --db data/diagnoses.db
+"""
+
+import argparse
+import csv
+import json
+import math
+import sys
+
+import numpy as np
+
+from modules.questions import QUESTIONS
+from modules.scoring import (
+    QUESTION_IDS,
+    QUESTION_CATEGORY_KEYS,
+    READINESS_RANKS,
+    SCORE_MATRIX,
+    UNANSWERED,
+    answers_to_choice_matrix,
+    answers_to_dict,
+    get_next_rank,
+    get_readiness_rank
+)
+
+# 費用表にない質問の1点あたりの費用
+DEFAULT_COST_PER_POINT = 1
+
+# QUESTION_IDS と同じ並びの質問データ
+_QUESTION_LIST = [question for questions in QUESTIONS.values() for question in questions]
+
+
+def default_cost_table(cost_per_point=DEFAULT_COST_PER_POINT):
+    """
+    配点に比例した費用表を作成
+
+    Args:
+        cost_per_point (int): 1点あたりの費用
+
+    Returns:
+        dict: 質問ID -> 選択肢ごとの累計費用のリスト
+    """
+    return {
+        question["id"]: [choice["score"] * cost_per_point for choice in question["choices"]]
+        for question in _QUESTION_LIST
+    }
+
+
+def load_cost_table(path):
+    """
+    JSONファイルから費用表を読み込む
+
+    Args:
+        path (str): 費用表のJSONファイルのパス
+
+    Returns:
+        dict: 質問ID -> 選択肢ごとの累計費用のリスト
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _upgrade_options(answers, cost_table):
+    """
+    質問ごとの改善候補 [(選択肢, 費用, 増加点), ...] と現在の選択肢を作成
+
+    Args:
+        answers (dict): 回答辞書
+        cost_table (dict): 費用表
+
+    Returns:
+        tuple: (質問ごとの改善候補のリスト, 現在の選択肢のリスト)
+    """
+    defaults = default_cost_table()
+    current_choices = answers_to_choice_matrix([answers])[0].tolist()
+
+    options = []
+    for row, question in enumerate(_QUESTION_LIST):
+        level_costs = cost_table.get(question["id"]) or defaults[question["id"]]
+        if len(level_costs) != len(question["choices"]):
+            raise ValueError(
+                f"質問 {question['id']} の費用の数({len(level_costs)})が"
+                f"選択肢の数({len(question['choices'])})と一致しません"
+            )
+        current = current_choices[row]
+        current_score = SCORE_MATRIX[row, current]
+        current_cost = 0 if current == UNANSWERED else level_costs[current]
+
+        question_options = []
+        for choice in range(len(question["choices"])):
+            gain = int(SCORE_MATRIX[row, choice] - current_score)
+            if gain > 0:
+                question_options.append((choice, max(level_costs[choice] - current_cost, 0), gain))
+        options.append(question_options)
+    return options, current_choices
+
+
+def _build_plan(answers, options, current_choices, selected):
+    """
+    選んだ改善候補からプランの辞書を組み立てる
+
+    Args:
+        answers (dict): 回答辞書
+        options (list): _upgrade_options の改善候補
+        current_choices (list): 現在の選択肢
+        selected (dict): 行番号 -> 改善候補のインデックス
+
+    Returns:
+        dict: 改善プラン
+    """
+    current_score = int(SCORE_MATRIX[np.arange(len(QUESTION_IDS)), current_choices].sum())
+    upgrades = []
+    for row in sorted(selected):
+        choice, cost, gain = options[row][selected[row]]
+        current = current_choices[row]
+        upgrades.append({
+            "question_id": QUESTION_IDS[row],
+            "category": QUESTION_CATEGORY_KEYS[row],
+            "current_choice": None if current == UNANSWERED else current,
+            "new_choice": choice,
+            "cost": cost,
+            "gain": gain
+        })
+
+    gain = sum(upgrade["gain"] for upgrade in upgrades)
+    new_score = current_score + gain
+    return {
+        "current_score": current_score,
+        "current_rank": get_readiness_rank(current_score),
+        "new_score": new_score,
+        "new_rank": get_readiness_rank(new_score),
+        "gain": gain,
+        "cost": sum(upgrade["cost"] for upgrade in upgrades),
+        "upgrades": upgrades
+    }
+
+
+def plan_within_budget(answers, budget, cost_table=None):
+    """
+    予算内で総合スコアが最大になる改善の組み合わせを求める
+
+    予算を費用の最大公約数で割った整数の刻みで、予算ごとの最大増加点を
+    numpy 配列で質問ごとに更新する（同じ増加点なら費用の少ない組み合わせを選ぶ）。
+
+    Args:
+        answers (dict): 回答辞書（保存済み診断の answers も可）
+        budget (int): 予算（費用表と同じ単位の整数）
+        cost_table (dict): 費用表（省略時は default_cost_table）
+
+    Returns:
+        dict: 改善プラン
+        {
+            "current_score": 410, "current_rank": "D",
+            "new_score": 470, "new_rank": "C",
+            "gain": 60, "cost": 95,
+            "upgrades": [{"question_id": "d1", "category": "data", "current_choice": 0,
+                          "new_choice": 2, "cost": 30, "gain": 20}, ...]
+        }
+    """
+    answers = answers_to_dict(answers)
+    options, current_choices = _upgrade_options(answers, cost_table or {})
+
+    costs = [cost for question_options in options for _, cost, _ in question_options]
+    if any(int(cost) != cost or cost < 0 for cost in costs) or int(budget) != budget:
+        raise ValueError("予算内プランの費用と予算は0以上の整数で指定してください")
+
+    # 費用と予算を最大公約数で割って配列を小さくする
+    unit = math.gcd(int(budget), *[int(cost) for cost in costs]) or 1
+    size = int(budget) // unit + 1 if budget >= 0 else 0
+    if size == 0:
+        return _build_plan(answers, options, current_choices, {})
+
+    best = np.zeros(size)
+    taken = np.full((len(options), size), -1, dtype=np.int8)
+    for row, question_options in enumerate(options):
+        updated = best.copy()
+        for index, (_, cost, gain) in enumerate(question_options):
+            steps = int(cost) // unit
+            if steps >= size:
+                continue
+            candidate = np.full(size, -np.inf)
+            candidate[steps:] = best[:size - steps] + gain
+            better = candidate > updated
+            updated[better] = candidate[better]
+            taken[row, better] = index
+        best = updated
+
+    # 最大増加点を最小の費用で実現する予算から復元
+    position = int(np.argmax(best >= best[-1]))
+    selected = {}
+    for row in range(len(options) - 1, -1, -1):
+        index = int(taken[row, position])
+        if index >= 0:
+            selected[row] = index
+            position -= int(options[row][index][1]) // unit
+    return _build_plan(answers, options, current_choices, selected)
+
+
+def plan_for_rank(answers, target_rank=None, budget=None, cost_table=None):
+    """
+    目標ランクに最小の費用で届く改善の組み合わせを求める
+
+    必要な増加点（0〜600点）ごとの最小費用を質問ごとに更新する。
+    必要点を超える増加点は必要点にまとめるので、配列の大きさは必要点+1で済む。
+
+    Args:
+        answers (dict): 回答辞書（保存済み診断の answers も可）
+        target_rank (str): 目標ランク（省略時は現在の1つ上のランク）
+        budget (float): 予算（指定した場合、最小費用が予算を超えると reachable が False）
+        cost_table (dict): 費用表（省略時は default_cost_table）
+
+    Returns:
+        dict: plan_within_budget と同じ形式に "target_rank", "target_score", "reachable" を加えたもの
+              届かない場合は upgrades が空
+    """
+    answers = answers_to_dict(answers)
+    options, current_choices = _upgrade_options(answers, cost_table or {})
+    plan = _build_plan(answers, options, current_choices, {})
+    if target_rank is None:
+        target_rank = get_next_rank(plan["current_rank"])
+    target_score = READINESS_RANKS[target_rank]["min"] if target_rank in READINESS_RANKS else None
+    plan.update({"target_rank": target_rank, "target_score": target_score, "reachable": False})
+    if target_score is None:
+        return plan
+
+    needed = target_score - plan["current_score"]
+    if needed <= 0:
+        plan["reachable"] = True
+        return plan
+
+    # min_cost[g]: 増加点g（needed以上はneededにまとめる）に必要な最小費用
+    min_cost = np.full(needed + 1, np.inf)
+    min_cost[0] = 0.0
+    layers = []
+    taken = np.full((len(options), needed + 1), -1, dtype=np.int8)
+    for row, question_options in enumerate(options):
+        layers.append(min_cost)
+        updated = min_cost.copy()
+        for index, (_, cost, gain) in enumerate(question_options):
+            candidate = np.full(needed + 1, np.inf)
+            if gain < needed:
+                candidate[gain:needed] = min_cost[:needed - gain] + cost
+            # needed に到達する遷移は、needed - gain 以上のどの状態からでもよい
+            candidate[needed] = min_cost[max(needed - gain, 0):].min() + cost
+            better = candidate < updated
+            updated[better] = candidate[better]
+            taken[row, better] = index
+        min_cost = updated
+
+    total_cost = min_cost[needed]
+    if not np.isfinite(total_cost) or (budget is not None and total_cost > budget):
+        return plan
+
+    # 後ろの質問から復元
+    selected = {}
+    state = needed
+    for row in range(len(options) - 1, -1, -1):
+        index = int(taken[row, state])
+        if index < 0:
+            continue
+        selected[row] = index
+        gain = options[row][index][2]
+        if state < needed:
+            state -= gain
+        else:
+            low = max(needed - gain, 0)
+            state = low + int(np.argmin(layers[row][low:]))
+
+    plan.update(_build_plan(answers, options, current_choices, selected))
+    plan["reachable"] = True
+    return plan
+
+
+def plan_portfolio(db, budget=None, target_rank=None, cost_table=None, chunk_size=5000):
+    """
+    保存済みの全診断について改善プランをまとめて求める
+
+    回答はチャンク単位で読み出すので、件数が多くてもメモリ使用量は一定。
+
+    Args:
+        db (DiagnosisDatabase): 対象データベース
+        budget (int): 予算（target_rank を省略した場合は必須）
+        target_rank (str): 目標ランク。指定すると plan_for_rank、省略すると plan_within_budget を使う
+        cost_table (dict): 費用表（省略時は default_cost_table）
+        chunk_size (int): 1回に読み出す件数
+
+    Yields:
+        tuple: (診断ID, 改善プラン)
+    """
+    for rows in db.iter_answer_chunks(chunk_size=chunk_size):
+        for diagnosis_id, answers in rows:
+            if target_rank is not None:
+                yield diagnosis_id, plan_for_rank(answers, target_rank, budget, cost_table)
+            else:
+                yield diagnosis_id, plan_within_budget(answers, budget, cost_table)
+
+
+def main(argv=None):
+    """保存済みの全診断の改善プランをCSVで標準出力に書き出す"""
+    from modules.database import DiagnosisDatabase
+
+    parser = argparse.ArgumentParser(description="保存済み診断ごとに予算内の改善プランを求めます")
+    parser.add_argument("--db", default="data/diagnoses.db", help="データベースファイルのパス")
+    parser.add_argument("--budget", type=int, help="予算（費用表と同じ単位の整数）")
+    parser.add_argument("--costs", help="費用表のJSONファイル（省略時は配点に比例）")
+    parser.add_argument("--target-rank", choices=sorted(READINESS_RANKS), help="目標ランク（最小費用で到達するプランを求める）")
+    args = parser.parse_args(argv)
+
+    if args.budget is None and args.target_rank is None:
+        parser.error("--budget か --target-rank のどちらかを指定してください")
+
+    cost_table = load_cost_table(args.costs) if args.costs else None
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["id", "current_score", "new_score", "new_rank", "cost", "upgrades"])
+    for diagnosis_id, plan in plan_portfolio(
+        DiagnosisDatabase(args.db), args.budget, args.target_rank, cost_table
+    ):
+        writer.writerow([
+            diagnosis_id,
+            plan["current_score"],
+            plan["new_score"],
+            plan["new_rank"],
+            plan["cost"],
+            ";".join(f"{u['question_id']}:{u['new_choice']}" for u in plan["upgrades"])
+        ])
+
+
+if __name__ == "__main__":
+    main()
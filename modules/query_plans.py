@@ -0,0 +1,164 @@
+"""
+履歴一覧の問い合わせの実行計画の確認
+list_diagnoses の絞り込み条件ごとに、ホットDBへの問い合わせの EXPLAIN QUERY PLAN と
+1ページの取得時間を表示し、全件を読む計画がないことを確認する。
+
+- どの条件でも、索引を使わない表の全件走査（SCAN diagnoses）があれば失敗
+- 該当する診断が少ない条件で、索引を順にたどる走査（SCAN diagnoses USING INDEX ...）があれば失敗
+  （該当が少ないと1ページ分そろうまでに索引のほぼ全件を読むため）
+
+DBに診断がなければ、乱数の種を固定した診断を --rows 件作ってから確認する。
+絞り込みの仕組みや索引を変更したときに実行する。
+
+使い方:
+    python -m modules.query_plans --db /tmp/plans.db --rows 200000
+    python -m modules.query_plans --db data/diagnoses.db
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from modules.answer_codec import QUESTION_BANK_IDS
+from modules.database import DiagnosisDatabase
+from modules.importer import build_diagnoses
+from modules.questions import QUESTIONS
+from modules.scoring import MAX_SCORE
+
+# 質問ID -> 選択肢数
+_CHOICE_COUNTS = {
+    question["id"]: len(question["choices"])
+    for questions in QUESTIONS.values()
+    for question in questions
+}
+
+
+def generate_diagnoses(db, rows, seed=0, chunk_size=10000):
+    """
+    確認用の診断を作って保存（日付は直近1年に、施設・ユーザー・セッションはばらけさせる）
+
+    Args:
+        db (DiagnosisDatabase): 保存先データベース
+        rows (int): 作る件数
+        seed (int): 乱数の種
+        chunk_size (int): 1トランザクションあたりの件数
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+    for start in range(0, rows, chunk_size):
+        db.save_diagnoses(build_diagnoses([
+            (
+                {
+                    "facility_name": f"確認用施設{rng.randrange(300)}",
+                    "user_id": f"user{rng.randrange(1000)}",
+                    "session_id": f"session{rng.randrange(rows)}"
+                },
+                {question_id: rng.randrange(_CHOICE_COUNTS[question_id]) for question_id in QUESTION_BANK_IDS},
+                now - timedelta(minutes=rng.randrange(60 * 24 * 365))
+            )
+            for _ in range(min(chunk_size, rows - start))
+        ], {}))
+
+
+def plan_cases(db):
+    """
+    確認する絞り込み条件の一覧（値はDBにある診断から選ぶ）
+
+    Returns:
+        list: (名前, list_diagnoses の絞り込み条件, 該当する診断が少ないかどうか) のリスト
+    """
+    latest = db.get_recent_diagnoses(limit=1)[0]
+    min_score, max_score = db.get_score_range('total')
+    # 該当なしではなく実際に絞り込む計画を確認するため、件数が最も少ないランクを使う
+    rank_counts = db.get_rank_distribution()
+    rare_rank = min(rank_counts, key=rank_counts.get)
+
+    today = date.today()
+    return [
+        ("絞り込みなし", {}, False),
+        ("セッションID", {"session_id": latest.session_id}, True),
+        ("ユーザーID", {"user_id": latest.user_id}, True),
+        ("施設名", {"facility_name": latest.facility_name}, True),
+        ("ランク（最も少ないもの）", {"ranks": [rare_rank]}, True),
+        ("期間（直近7日）", {"date_from": today - timedelta(days=7), "date_to": today}, True),
+        ("総合スコア（最高点のみ）", {"min_score": max_score}, True),
+        ("総合スコア（最低点のみ）", {"max_score": min_score}, True),
+        ("総合スコア（該当なし）", {"min_score": MAX_SCORE + 1}, True),
+        ("達成率（最高のみ）", {"min_percentage": round(max_score * 100 / MAX_SCORE, 1)}, True),
+        ("総合スコア（全件）", {"min_score": 0}, False),
+        ("期間と総合スコア", {"date_from": today - timedelta(days=30), "min_score": max_score}, True),
+    ]
+
+
+def check_plans(db, limit=50, repeat=5):
+    """
+    絞り込み条件ごとに実行計画と取得時間を調べる
+
+    Args:
+        db (DiagnosisDatabase): 対象データベース
+        limit (int): 1ページの件数
+        repeat (int): 取得時間を測る回数
+
+    Returns:
+        list: {'name', 'plan', 'ms', 'rows', 'problems'} の辞書のリスト
+    """
+    results = []
+    for name, filters, selective in plan_cases(db):
+        plan = db.explain_list_diagnoses(limit=limit, **filters)
+
+        problems = []
+        for detail in plan:
+            detail = detail.replace("main.", "")
+            if detail == "SCAN diagnoses":
+                problems.append("索引を使わない全件走査")
+            elif selective and detail.startswith("SCAN diagnoses"):
+                problems.append("該当が少ない条件で索引を全件たどる走査")
+
+        db.list_diagnoses(limit=limit, **filters)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            rows, _ = db.list_diagnoses(limit=limit, **filters)
+        elapsed = (time.perf_counter() - started) / repeat
+
+        results.append({
+            "name": name,
+            "plan": plan,
+            "ms": elapsed * 1000,
+            "rows": len(rows),
+            "problems": problems
+        })
+    return results
+
+
+def main(argv=None):
+    """コマンドラインから実行計画を確認"""
+    parser = argparse.ArgumentParser(description="履歴一覧の問い合わせの実行計画を確認します")
+    parser.add_argument("--db", default="data/plans.db", help="対象DBファイルのパス")
+    parser.add_argument("--rows", type=int, default=200000, help="DBが空のときに作る診断の件数")
+    parser.add_argument("--limit", type=int, default=50, help="1ページの件数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数の種")
+    args = parser.parse_args(argv)
+
+    db = DiagnosisDatabase(args.db)
+    if not db.list_diagnoses(limit=1)[0]:
+        print(f"{args.rows}件の診断を作成しています...", flush=True)
+        generate_diagnoses(db, args.rows, args.seed)
+
+    failed = False
+    for result in check_plans(db, args.limit):
+        status = "NG" if result["problems"] else "OK"
+        print(f"[{status}] {result['name']}: {result['rows']}件 {result['ms']:.2f}ms")
+        for detail in result["plan"]:
+            print(f"       {detail}")
+        for problem in result["problems"]:
+            print(f"       → {problem}")
+        failed = failed or bool(result["problems"])
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ JSON、CSV形式でのエクスポートをサポート
 
 import json
 import csv
+from collections.abc import Mapping
 from datetime import datetime
 import io
 
@@ -26,7 +27,7 @@ class ReportExporter:
             """datetimeオブジェクトを再帰的にISO形式の文字列に変換"""
             if isinstance(obj, datetime):
                 return obj.isoformat()
-            elif isinstance(obj, dict):
+            elif isinstance(obj, Mapping):
                 return {key: convert_datetime(value) for key, value in obj.items()}
             elif isinstance(obj, list):
                 return [convert_datetime(item) for item in obj]
@@ -0,0 +1,126 @@
+"""
+保存済み診断の一括再採点
+質問の配点（modules/questions.py）を変更した後に、既存の診断結果を
+現在のスコア表で採点し直してデータベースへ書き戻す
+
+使い方:
+    python -m modules.rescoring --db data/diagnoses.db --chunk-size 5000
+"""
+
+import argparse
+import json
+import time
+
+from modules.database import DiagnosisDatabase, MigrationPendingError
+from modules.scoring import (
+    CATEGORY_KEYS,
+    SCORING_VERSION,
+    answers_to_choice_matrix,
+    build_category_entry,
+    get_industry_averages,
+    get_readiness_rank,
+    score_choice_matrix,
+    build_scores
+)
+
+
+def build_categories(category_scores, averages):
+    """
+    categories_json に保存するカテゴリー別データを組み立てる
+
+    Args:
+        category_scores (dict): カテゴリー別スコア
+        averages (dict): 業界平均値
+
+    Returns:
+        list: 診断結果ページが保存するものと同じ形式のリスト
+    """
+    return [
+        build_category_entry(category, score, score - averages.get(category, 0))
+        for category, score in category_scores.items()
+    ]
+
+
+def rescore_chunk(rows, averages):
+    """
+    1チャンク分の (id, 回答辞書) をまとめて再採点
+
+    Args:
+        rows (list): DiagnosisDatabase.iter_answer_chunks が返す (id, 回答辞書) のリスト
+        averages (dict): 業界平均値
+
+    Returns:
+        list: DiagnosisDatabase.update_scores に渡す行のリスト
+    """
+    ids = [row[0] for row in rows]
+    answers_list = [row[1] for row in rows]
+
+    category_matrix, total_scores = score_choice_matrix(
+        answers_to_choice_matrix(answers_list)
+    )
+
+    score_rows = []
+    for diagnosis_id, category_row, total in zip(
+        ids, category_matrix.tolist(), total_scores.tolist()
+    ):
+        scores = build_scores(dict(zip(CATEGORY_KEYS, category_row)), total)
+        score_rows.append((
+            scores['total_score'],
+            scores['max_score'],
+            scores['percentage'],
+            get_readiness_rank(scores['total_score']),
+            json.dumps(build_categories(scores['category_scores'], averages), ensure_ascii=False),
+            SCORING_VERSION,
+            diagnosis_id
+        ))
+    return score_rows
+
+
+def rescore_all_diagnoses(db, chunk_size=5000, progress=None):
+    """
+    現在のスコア表で採点されていない診断を全て再採点する
+
+    チャンクごとに読み出し・採点・書き戻しを行うため、メモリ使用量は
+    chunk_size で頭打ちになり、書き込みロックもチャンク1回分しか保持しない。
+    scoring_version が一致する行は読み飛ばすので、途中で中断しても再実行できる。
+
+    Args:
+        db (DiagnosisDatabase): 対象データベース
+        chunk_size (int): 1チャンクあたりの行数
+        progress (callable): チャンク処理ごとに累計件数を渡されるコールバック（オプション）
+
+    Returns:
+        int: 再採点した件数
+    """
+    try:
+        averages = get_industry_averages(db.get_category_stats())
+    except MigrationPendingError:
+        # 集計し直しの途中は固定の業界平均を使う
+        averages = get_industry_averages()
+    total = 0
+    for rows in db.iter_answer_chunks(chunk_size=chunk_size, stale_for_version=SCORING_VERSION):
+        total += db.update_scores(rescore_chunk(rows, averages))
+        if progress:
+            progress(total)
+    return total
+
+
+def main(argv=None):
+    """コマンドラインから再採点を実行"""
+    parser = argparse.ArgumentParser(description="保存済み診断を現在の配点で再採点します")
+    parser.add_argument("--db", default="data/diagnoses.db", help="データベースファイルのパス")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="1トランザクションあたりの行数")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    count = rescore_all_diagnoses(
+        DiagnosisDatabase(args.db),
+        chunk_size=args.chunk_size,
+        progress=lambda n: print(f"  {n}件 再採点済み", flush=True)
+    )
+    elapsed = time.perf_counter() - started
+    print(f"完了: {count}件を再採点しました（スコア表 {SCORING_VERSION}, {elapsed:.1f}秒）")
+
+
+if __name__ == "__main__":
+    main()
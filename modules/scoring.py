@@ -3,6 +3,12 @@
 診断結果からスコアを計算し、準備度ランクや改善優先度を判定
 """
 
+import hashlib
+import heapq
+import numbers
+
+import numpy as np
+
 from modules.questions import QUESTIONS, CATEGORIES
 
 # 業界平均値
@@ -15,6 +21,9 @@ INDUSTRY_AVERAGES = {
     "compliance": 70
 }
 
+# 実データの平均に切り替えるのに必要な診断件数
+MIN_POPULATION_FOR_AVERAGES = 30
+
 # 準備度ランクの定義
 READINESS_RANKS = {
     "A": {"min": 541, "max": 600, "label": "優秀"},
@@ -25,6 +34,130 @@ READINESS_RANKS = {
 }
 
 
+# ======================================
+# スコア表のコンパイル（インポート時に1回だけ実行）
+# ======================================
+
+# カテゴリーの並び順（QUESTIONSの定義順）
+CATEGORY_KEYS = tuple(QUESTIONS.keys())
+
+# 質問IDの並び順（QUESTIONSの定義順）
+QUESTION_IDS = tuple(
+    question["id"] for questions in QUESTIONS.values() for question in questions
+)
+
+# 質問ID -> 行番号
+_QUESTION_INDEX = {question_id: i for i, question_id in enumerate(QUESTION_IDS)}
+
+# 各質問が属するカテゴリーの列番号
+_QUESTION_CATEGORY = np.array(
+    [
+        CATEGORY_KEYS.index(category)
+        for category, questions in QUESTIONS.items()
+        for _ in questions
+    ],
+    dtype=np.int64
+)
+
+# 各質問が属するカテゴリー名（QUESTION_IDS と同じ並び）
+QUESTION_CATEGORY_KEYS = tuple(CATEGORY_KEYS[i] for i in _QUESTION_CATEGORY)
+
+# 各質問の選択肢数
+_CHOICE_COUNTS = np.array(
+    [len(question["choices"]) for questions in QUESTIONS.values() for question in questions],
+    dtype=np.int64
+)
+
+# 未回答・範囲外の回答を表す列番号（スコア0の番兵列）
+UNANSWERED = int(_CHOICE_COUNTS.max())
+
+# 質問×選択肢のスコア行列（最終列は未回答用の0点列）
+SCORE_MATRIX = np.zeros((len(QUESTION_IDS), UNANSWERED + 1), dtype=np.int64)
+for _row, _question in enumerate(
+    question for questions in QUESTIONS.values() for question in questions
+):
+    SCORE_MATRIX[_row, :len(_question["choices"])] = [
+        choice["score"] for choice in _question["choices"]
+    ]
+
+# 質問×カテゴリーの所属行列（カテゴリー別集計用）
+_CATEGORY_INDICATOR = np.zeros((len(QUESTION_IDS), len(CATEGORY_KEYS)), dtype=np.int64)
+_CATEGORY_INDICATOR[np.arange(len(QUESTION_IDS)), _QUESTION_CATEGORY] = 1
+
+# 各質問の最高点
+QUESTION_MAX_SCORES = SCORE_MATRIX.max(axis=1)
+
+# カテゴリー別の最大スコア
+CATEGORY_MAX_SCORES = dict(zip(
+    CATEGORY_KEYS,
+    (int(v) for v in QUESTION_MAX_SCORES @ _CATEGORY_INDICATOR)
+))
+
+# 全問で最高点を取った場合の総合スコア
+MAX_SCORE = int(QUESTION_MAX_SCORES.sum())
+
+# スコア表のバージョン（配点が変わると値が変わる）
+SCORING_VERSION = hashlib.sha1(
+    repr([(question_id, row.tolist()) for question_id, row in zip(QUESTION_IDS, SCORE_MATRIX)]).encode()
+).hexdigest()[:12]
+
+# 1件ずつのスコア計算用（Pythonのリストで保持した方が速い）
+_SCORE_TABLE = [
+    (question_id, CATEGORY_KEYS[category], [int(v) for v in SCORE_MATRIX[i, :count]])
+    for i, (question_id, category, count) in enumerate(
+        zip(QUESTION_IDS, _QUESTION_CATEGORY, _CHOICE_COUNTS)
+    )
+]
+
+# ランクの並び（低い順）
+RANK_ORDER = tuple(sorted(READINESS_RANKS, key=lambda rank: READINESS_RANKS[rank]["min"]))
+
+# 質問ごと・現在の選択肢ごとの改善候補 [(選択肢, 増加点), ...]（増加点の大きい順）
+# 最後の要素は未回答の場合の候補
+_UPGRADE_OPTIONS = []
+for _row, _count in enumerate(_CHOICE_COUNTS):
+    _options_by_current = []
+    for _current in list(range(_count)) + [UNANSWERED]:
+        _seen_gains = {}
+        for _choice in range(_count):
+            _gain = int(SCORE_MATRIX[_row, _choice] - SCORE_MATRIX[_row, _current])
+            if _gain > 0 and _gain not in _seen_gains:
+                _seen_gains[_gain] = _choice
+        _options_by_current.append(sorted(
+            ((choice, gain) for gain, choice in _seen_gains.items()),
+            key=lambda option: -option[1]
+        ))
+    _UPGRADE_OPTIONS.append(_options_by_current)
+
+# 1問の変更で得られる最大の増加点
+_MAX_QUESTION_GAIN = int(QUESTION_MAX_SCORES.max())
+
+# 質問ID -> (カテゴリー, 選択肢ごとのスコア)（1問ずつの差分更新用）
+_QUESTION_SCORES = {
+    question_id: (category, choice_scores)
+    for question_id, category, choice_scores in _SCORE_TABLE
+}
+
+
+def as_choice_index(value):
+    """
+    回答値を選択肢インデックスの整数に変換
+    
+    int のほか numpy.int64 など整数型の値も受け付ける。bool・小数・文字列は選択肢として扱わない。
+    
+    Args:
+        value: 回答辞書の値
+    
+    Returns:
+        int: 選択肢インデックス（整数でない値ならNone。範囲は確認しない）
+    """
+    if type(value) is int:
+        return value
+    if isinstance(value, numbers.Integral) and not isinstance(value, bool):
+        return int(value)
+    return None
+
+
 def calculate_scores(answers: dict) -> dict:
     """
     診断結果からスコアを計算
@@ -46,42 +179,204 @@ def calculate_scores(answers: dict) -> dict:
             "percentage": 75.0
         }
     """
-    category_scores = {}
-    
-    # カテゴリーごとにスコアを計算
-    for category, questions in QUESTIONS.items():
-        category_score = 0
-        for question in questions:
-            question_id = question["id"]
-            if question_id in answers:
-                choice_index = answers[question_id]
-                # 選択肢インデックスが有効範囲内かチェック
-                if 0 <= choice_index < len(question["choices"]):
-                    choice = question["choices"][choice_index]
-                    category_score += choice["score"]
-        category_scores[category] = category_score
-    
-    # 総合スコアを計算
-    total_score = sum(category_scores.values())
-    
-    # 最大スコアを計算（全問で最高点を取った場合）
-    max_score = 0
-    for questions in QUESTIONS.values():
-        for question in questions:
-            max_choice_score = max(choice["score"] for choice in question["choices"])
-            max_score += max_choice_score
+    category_scores = dict.fromkeys(CATEGORY_KEYS, 0)
+    
+    # コンパイル済みのスコア表を参照して加算
+    for question_id, category, choice_scores in _SCORE_TABLE:
+        if question_id in answers:
+            choice_index = as_choice_index(answers[question_id])
+            # 選択肢インデックスが整数で有効範囲内かチェック（bool・小数・文字列は未回答扱い）
+            if choice_index is not None and 0 <= choice_index < len(choice_scores):
+                category_scores[category] += choice_scores[choice_index]
+    
+    return build_scores(category_scores, sum(category_scores.values()))
+
+
+def build_scores(category_scores: dict, total_score: int) -> dict:
+    """
+    calculate_scores と同じ形式のスコア辞書を組み立てる
+    
+    Args:
+        category_scores: カテゴリー別スコア
+        total_score: 総合スコア
     
+    Returns:
+        スコア情報を含む辞書
+    """
     # パーセンテージを計算
-    percentage = (total_score / max_score * 100) if max_score > 0 else 0.0
+    percentage = (total_score / MAX_SCORE * 100) if MAX_SCORE > 0 else 0.0
     
     return {
         "category_scores": category_scores,
         "total_score": total_score,
-        "max_score": max_score,
+        "max_score": MAX_SCORE,
         "percentage": round(percentage, 1)
     }
 
 
+def answers_to_choice_matrix(answers_list: list) -> np.ndarray:
+    """
+    回答辞書のリストを選択肢インデックスの行列に変換
+    
+    Args:
+        answers_list: 回答辞書のリスト
+                     例: [{"b1": 2, "b2": 1, ...}, ...]
+    
+    Returns:
+        (回答数, 質問数) の整数行列。列の並びは QUESTION_IDS と同じ。
+        未回答・範囲外の回答は UNANSWERED になる。
+    """
+    choices = np.full((len(answers_list), len(QUESTION_IDS)), UNANSWERED, dtype=np.int64)
+    if not answers_list:
+        return choices
+    
+    # 質問ごとに1列ずつまとめて変換
+    for column, question_id in enumerate(QUESTION_IDS):
+        values = [answers.get(question_id, -1) for answers in answers_list]
+        # calculate_scores と同じく、整数以外（bool・小数・文字列など）は未回答として扱う
+        if set(map(type, values)) != {int}:
+            values = [as_choice_index(v) for v in values]
+            values = [-1 if v is None else v for v in values]
+        values = np.asarray(values, dtype=np.int64)
+        valid = (values >= 0) & (values < _CHOICE_COUNTS[column])
+        choices[valid, column] = values[valid]
+    
+    return choices
+
+
+def score_choice_matrix(choices: np.ndarray) -> tuple:
+    """
+    選択肢インデックスの行列をまとめてスコア化
+    
+    Args:
+        choices: answers_to_choice_matrix が返す (回答数, 質問数) の行列
+    
+    Returns:
+        (カテゴリー別スコア行列 (回答数, カテゴリー数), 総合スコア配列 (回答数,))
+        カテゴリーの並びは CATEGORY_KEYS と同じ。
+    """
+    question_scores = SCORE_MATRIX[np.arange(len(QUESTION_IDS)), choices]
+    category_scores = question_scores @ _CATEGORY_INDICATOR
+    return category_scores, category_scores.sum(axis=1)
+
+
+def calculate_scores_batch(answers_list: list) -> list:
+    """
+    複数の診断結果のスコアをベクトル演算でまとめて計算
+    
+    Args:
+        answers_list: 回答辞書のリスト
+                     例: [{"b1": 2, "b2": 1, ...}, ...]
+    
+    Returns:
+        calculate_scores と同じ形式の辞書のリスト（入力と同じ順序）
+    """
+    category_scores, total_scores = score_choice_matrix(
+        answers_to_choice_matrix(answers_list)
+    )
+    
+    return [
+        build_scores(dict(zip(CATEGORY_KEYS, row)), total)
+        for row, total in zip(category_scores.tolist(), total_scores.tolist())
+    ]
+
+
+def _choice_score(question_id: str, choice_index) -> tuple:
+    """
+    1問分の (カテゴリー, スコア) を取得（未回答・範囲外は0点）
+    """
+    category, choice_scores = _QUESTION_SCORES[question_id]
+    choice_index = as_choice_index(choice_index)
+    if choice_index is not None and 0 <= choice_index < len(choice_scores):
+        return category, choice_scores[choice_index]
+    return category, 0
+
+
+def answers_to_dict(answers) -> dict:
+    """
+    保存済み診断の answers（質問ごとの辞書のリスト）を回答辞書に変換
+    
+    Args:
+        answers: 診断データの answers、または回答辞書
+    
+    Returns:
+        質問IDをキー、選択肢インデックスを値とする辞書
+    """
+    if isinstance(answers, dict):
+        return answers
+    return {
+        answer["question_id"]: answer["answer"]
+        for answer in answers
+        if "question_id" in answer
+    }
+
+
+def _current_choice(question_id: str, answers: dict) -> int:
+    """回答辞書から選択肢インデックスを取得（未回答・範囲外は UNANSWERED）"""
+    choice_index = as_choice_index(answers.get(question_id))
+    _, choice_scores = _QUESTION_SCORES[question_id]
+    if choice_index is not None and 0 <= choice_index < len(choice_scores):
+        return choice_index
+    return UNANSWERED
+
+
+def init_live_scores(answers: dict) -> dict:
+    """
+    回答途中のスコア状態を作成（診断ページのセッションに保持する）
+    
+    Args:
+        answers: その時点までの回答辞書
+    
+    Returns:
+        スコア状態
+        {
+            "choices": {"b1": 2, ...},      # 状態に反映済みの回答
+            "category_scores": {"business": 20, ...},
+            "total_score": 120
+        }
+    """
+    state = {
+        "choices": {},
+        "category_scores": dict.fromkeys(CATEGORY_KEYS, 0),
+        "total_score": 0
+    }
+    for question_id, choice_index in answers.items():
+        update_live_scores(state, question_id, choice_index)
+    return state
+
+
+def update_live_scores(state: dict, question_id: str, choice_index) -> dict:
+    """
+    1問の回答変更をスコア状態に差分で反映（旧選択肢の点を引き、新選択肢の点を足す）
+    
+    全問を数え直さないので、1回の変更はO(1)で済む。
+    
+    Args:
+        state: init_live_scores で作ったスコア状態
+        question_id: 変更された質問ID
+        choice_index: 新しい選択肢インデックス（未回答に戻した場合はNone）
+    
+    Returns:
+        更新後のスコア状態（引数のstateをそのまま更新して返す）
+    """
+    if question_id not in _QUESTION_SCORES:
+        return state
+    
+    choices = state["choices"]
+    category, old_score = _choice_score(question_id, choices.get(question_id))
+    _, new_score = _choice_score(question_id, choice_index)
+    
+    if choice_index is None:
+        choices.pop(question_id, None)
+    else:
+        choices[question_id] = choice_index
+    
+    delta = new_score - old_score
+    state["category_scores"][category] += delta
+    state["total_score"] += delta
+    return state
+
+
 def get_readiness_rank(total_score: int) -> str:
     """
     準備度ランクを判定
@@ -100,6 +395,147 @@ def get_readiness_rank(total_score: int) -> str:
     return "E"
 
 
+def get_next_rank(rank: str):
+    """
+    1つ上のランクを取得
+    
+    Args:
+        rank: ランク文字列 (A, B, C, D, E)
+    
+    Returns:
+        1つ上のランク。最高ランクの場合はNone
+    """
+    if rank not in RANK_ORDER:
+        return None
+    position = RANK_ORDER.index(rank)
+    return RANK_ORDER[position + 1] if position + 1 < len(RANK_ORDER) else None
+
+
+def find_minimum_upgrades(answers: dict, target_rank: str = None) -> dict:
+    """
+    目標ランクに届くための最小の回答改善を求める
+    
+    変更する質問数が最少の組み合わせのうち、目標点からの超過が最も小さいものを返す。
+    質問数の下限は各質問の最大増加点の大きい順に足して求め、
+    その質問数の中での超過最小化は「変更数ごとの到達可能な増加点」を
+    ビット列で持つ動的計画法で解く（超過は1問分の最大増加点以内に収まるので、
+    それより上のビットは切り捨てて探索範囲を抑える）。
+    
+    Args:
+        answers: 質問IDをキー、選択肢インデックスを値とする辞書
+        target_rank: 目標ランク（省略時は現在の1つ上のランク）
+    
+    Returns:
+        改善プラン
+        {
+            "current_score": 410,
+            "current_rank": "D",
+            "target_rank": "C",
+            "target_score": 421,
+            "reachable": True,
+            "changes": [
+                {"question_id": "d1", "category": "data",
+                 "current_choice": 0, "new_choice": 2, "gain": 20},
+                ...
+            ],
+            "new_score": 430,
+            "overshoot": 9
+        }
+        current_choice は未回答の場合None。目標に届かない場合は reachable が False で changes は空。
+    """
+    answers = answers_to_dict(answers)
+    current_score = calculate_scores(answers)["total_score"]
+    current_rank = get_readiness_rank(current_score)
+    if target_rank is None:
+        target_rank = get_next_rank(current_rank)
+    
+    plan = {
+        "current_score": current_score,
+        "current_rank": current_rank,
+        "target_rank": target_rank,
+        "target_score": READINESS_RANKS[target_rank]["min"] if target_rank in READINESS_RANKS else None,
+        "reachable": False,
+        "changes": [],
+        "new_score": current_score,
+        "overshoot": 0
+    }
+    if plan["target_score"] is None:
+        return plan
+    
+    needed = plan["target_score"] - current_score
+    if needed <= 0:
+        plan["reachable"] = True
+        plan["overshoot"] = -needed
+        return plan
+    
+    # 各質問の現在の選択肢と改善候補
+    current_choices = [_current_choice(question_id, answers) for question_id in QUESTION_IDS]
+    options = [
+        _UPGRADE_OPTIONS[row][min(choice, len(_UPGRADE_OPTIONS[row]) - 1)]
+        for row, choice in enumerate(current_choices)
+    ]
+    
+    # 変更する質問数の下限（最大増加点の大きい順に足す）
+    max_gains = sorted((opts[0][1] for opts in options if opts), reverse=True)
+    accumulated = 0
+    min_changes = None
+    for count, gain in enumerate(max_gains, 1):
+        accumulated += gain
+        if accumulated >= needed:
+            min_changes = count
+            break
+    if min_changes is None:
+        return plan
+    
+    # reachable[j] のビットg: j問変更して増加点gにできる
+    mask = (1 << (needed + _MAX_QUESTION_GAIN + 1)) - 1
+    reachable = [1] + [0] * min_changes
+    layers = []
+    for opts in options:
+        layers.append(reachable)
+        updated = reachable[:]
+        for count in range(min_changes - 1, -1, -1):
+            if reachable[count]:
+                for _, gain in opts:
+                    updated[count + 1] |= (reachable[count] << gain) & mask
+        reachable = updated
+    
+    # 目標点以上で最小の増加点
+    candidates = reachable[min_changes] >> needed
+    total_gain = needed + (candidates & -candidates).bit_length() - 1
+    
+    # 後ろの質問から変更内容を復元
+    changes = []
+    count, gain_left = min_changes, total_gain
+    for row in range(len(QUESTION_IDS) - 1, -1, -1):
+        previous = layers[row]
+        if (previous[count] >> gain_left) & 1:
+            continue
+        for choice, gain in options[row]:
+            if gain <= gain_left and (previous[count - 1] >> (gain_left - gain)) & 1:
+                question_id = QUESTION_IDS[row]
+                current_choice = current_choices[row]
+                changes.append({
+                    "question_id": question_id,
+                    "category": CATEGORY_KEYS[_QUESTION_CATEGORY[row]],
+                    "current_choice": None if current_choice == UNANSWERED else current_choice,
+                    "new_choice": choice,
+                    "gain": gain
+                })
+                count -= 1
+                gain_left -= gain
+                break
+    changes.reverse()
+    
+    plan.update({
+        "reachable": True,
+        "changes": changes,
+        "new_score": current_score + total_gain,
+        "overshoot": total_gain - needed
+    })
+    return plan
+
+
 def get_readiness_rank_label(rank: str) -> str:
     """
     ランクのラベルを取得
@@ -113,22 +549,102 @@ def get_readiness_rank_label(rank: str) -> str:
     return READINESS_RANKS.get(rank, {}).get("label", "不明")
 
 
-def compare_with_average(category_scores: dict) -> dict:
+def get_industry_statistics(category_stats: dict = None) -> dict:
+    """
+    業界平均・標準偏差を取得
+    
+    保存済み診断の母集団統計（DiagnosisDatabase.get_category_stats の値）から平均と標準偏差を使う。
+    件数が MIN_POPULATION_FOR_AVERAGES に満たないカテゴリーや、
+    母集団統計が渡されない場合は INDUSTRY_AVERAGES の固定値を使う。
+    
+    Args:
+        category_stats: カテゴリー別の母集団統計（省略時は固定値だけを使う）
+                       例: {"business": {"count": 120, "mean": 65.0, "std": 12.3}, ...}
+    
+    Returns:
+        カテゴリー別の統計情報
+        例: {"business": {"mean": 65.0, "std": 12.3, "count": 120, "source": "population"}, ...}
+    """
+    population = category_stats or {}
+    
+    statistics = {}
+    for category, default_average in INDUSTRY_AVERAGES.items():
+        stats = population.get(category)
+        if stats and stats["count"] >= MIN_POPULATION_FOR_AVERAGES:
+            statistics[category] = {
+                "mean": stats["mean"],
+                "std": stats["std"],
+                "count": stats["count"],
+                "source": "population"
+            }
+        else:
+            statistics[category] = {
+                "mean": default_average,
+                "std": None,
+                "count": stats["count"] if stats else 0,
+                "source": "default"
+            }
+    return statistics
+
+
+def percentile_from_counts(below: int, equal: int, total: int):
+    """
+    スコア未満・同点・全体の件数からパーセンタイル順位を計算（同点は半分を下位として数える）
+    
+    件数は DiagnosisDatabase.get_score_rank_counts の値を使う。
+    
+    Args:
+        below: スコア未満の件数
+        equal: 同点の件数
+        total: 全件数
+    
+    Returns:
+        0〜100のパーセンタイル（小数1桁）。母集団がない場合はNone
+        例: 37.5 → 「37パーセンタイル」
+    """
+    if total <= 0:
+        return None
+    
+    return round((below + equal / 2) / total * 100, 1)
+
+
+def get_industry_averages(category_stats: dict = None) -> dict:
+    """
+    業界平均値を取得（get_industry_statistics の平均だけを四捨五入して返す）
+    
+    Args:
+        category_stats: カテゴリー別の母集団統計（省略時は INDUSTRY_AVERAGES の固定値）
+    
+    Returns:
+        カテゴリー別の業界平均値
+        例: {"business": 65, "data": 55, ...}
+    """
+    return {
+        category: round(stats["mean"])
+        for category, stats in get_industry_statistics(category_stats).items()
+    }
+
+
+def compare_with_average(category_scores: dict, averages: dict = None) -> dict:
     """
     業界平均値との比較
     
     Args:
         category_scores: カテゴリー別スコア
                         例: {"business": 85, "data": 70, ...}
+        averages: 業界平均値（省略時は INDUSTRY_AVERAGES の固定値）
     
     Returns:
         業界平均との差分
         例: {"business": +20, "data": +15, ...}
     """
+    if averages is None:
+        averages = INDUSTRY_AVERAGES
+    
     comparison = {}
     for category, score in category_scores.items():
-        if category in INDUSTRY_AVERAGES:
-            diff = score - INDUSTRY_AVERAGES[category]
+        if category in averages:
+            diff = score - averages[category]
             comparison[category] = diff
     
     return comparison
@@ -155,6 +671,114 @@ def get_improvement_priorities(category_scores: dict) -> list:
     return sorted_categories
 
 
+def compute_question_gains(choices: np.ndarray, averages: dict = None) -> tuple:
+    """
+    質問ごとの改善効果（伸びしろ×業界平均との差による重み）をまとめて計算
+    
+    伸びしろは「最高点 - 現在の点」。カテゴリーが業界平均を下回っている場合は
+    重み 1 + (平均 - スコア) / カテゴリー最大点 を掛ける（平均以上なら重み1）。
+    
+    Args:
+        choices: answers_to_choice_matrix が返す (回答数, 質問数) の行列
+        averages: 業界平均値（省略時は INDUSTRY_AVERAGES の固定値）
+    
+    Returns:
+        (改善効果 (回答数, 質問数), 伸びしろ (回答数, 質問数), 重み (回答数, 質問数))
+    """
+    if averages is None:
+        averages = INDUSTRY_AVERAGES
+    
+    current = SCORE_MATRIX[np.arange(len(QUESTION_IDS)), choices]
+    headroom = QUESTION_MAX_SCORES - current
+    category_scores = current @ _CATEGORY_INDICATOR
+    
+    average_vector = np.array([averages.get(category, 0) for category in CATEGORY_KEYS], dtype=float)
+    max_vector = np.array([CATEGORY_MAX_SCORES[category] or 1 for category in CATEGORY_KEYS], dtype=float)
+    category_weights = 1.0 + np.clip(average_vector - category_scores, 0, None) / max_vector
+    weights = category_weights[:, _QUESTION_CATEGORY]
+    
+    return headroom * weights, headroom, weights
+
+
+def _question_gain_entry(row: int, choice: int, gain: float, headroom: int, weight: float) -> dict:
+    """改善効果ランキングの1件分の辞書"""
+    return {
+        "question_id": QUESTION_IDS[row],
+        "category": CATEGORY_KEYS[_QUESTION_CATEGORY[row]],
+        "current_choice": None if choice == UNANSWERED else int(choice),
+        "headroom": int(headroom),
+        "weight": round(float(weight), 3),
+        "gain": round(float(gain), 2)
+    }
+
+
+def get_top_question_gains(answers: dict, k: int = 3, averages: dict = None) -> list:
+    """
+    改善効果の大きい質問を上位k件取得
+    
+    Args:
+        answers: 質問IDをキー、選択肢インデックスを値とする辞書
+        k: 取得件数
+        averages: 業界平均値（省略時は INDUSTRY_AVERAGES の固定値）
+    
+    Returns:
+        改善効果の大きい順のリスト（伸びしろのない質問は含まない）
+        例: [{"question_id": "d1", "category": "data", "current_choice": 0,
+              "headroom": 20, "weight": 1.25, "gain": 25.0}, ...]
+    """
+    choices = answers_to_choice_matrix([answers_to_dict(answers)])
+    gains, headroom, weights = compute_question_gains(choices, averages)
+    gains, headroom, weights, choices = gains[0], headroom[0], weights[0], choices[0]
+    
+    # ヒープで上位k件を選ぶ（同点は質問の並び順）
+    top = heapq.nlargest(
+        k,
+        (row for row in range(len(QUESTION_IDS)) if headroom[row] > 0),
+        key=lambda row: (gains[row], -row)
+    )
+    return [
+        _question_gain_entry(row, choices[row], gains[row], headroom[row], weights[row])
+        for row in top
+    ]
+
+
+def get_top_question_gains_batch(answers_list: list, k: int = 3, averages: dict = None) -> list:
+    """
+    複数の診断について改善効果の大きい質問を上位k件ずつ取得
+    
+    全件の改善効果表を1回のベクトル演算で作り、行ごとの上位k件も
+    安定ソートでまとめて選ぶ（質問は30問なので行ごとのソートは軽い）。
+    
+    Args:
+        answers_list: 回答辞書のリスト
+        k: 1件あたりの取得件数
+        averages: 業界平均値（省略時は INDUSTRY_AVERAGES の固定値）
+    
+    Returns:
+        get_top_question_gains と同じ形式のリストのリスト（入力と同じ順序）
+    """
+    if not answers_list:
+        return []
+    
+    choices = answers_to_choice_matrix([answers_to_dict(answers) for answers in answers_list])
+    gains, headroom, weights = compute_question_gains(choices, averages)
+    
+    k = min(k, len(QUESTION_IDS))
+    if k <= 0:
+        return [[] for _ in answers_list]
+    
+    # 同点は質問の並び順（get_top_question_gains と同じ順序）
+    top_rows = np.argsort(-gains, axis=1, kind="stable")[:, :k]
+    results = []
+    for i, rows in enumerate(top_rows.tolist()):
+        results.append([
+            _question_gain_entry(row, choices[i, row], gains[i, row], headroom[i, row], weights[i, row])
+            for row in rows
+            if headroom[i, row] > 0
+        ])
+    return results
+
+
 def get_category_max_score(category: str) -> int:
     """
     カテゴリーの最大スコアを取得
@@ -165,15 +789,7 @@ def get_category_max_score(category: str) -> int:
     Returns:
         最大スコア
     """
-    if category not in QUESTIONS:
-        return 0
-    
-    max_score = 0
-    for question in QUESTIONS[category]:
-        max_choice_score = max(choice["score"] for choice in question["choices"])
-        max_score += max_choice_score
-    
-    return max_score
+    return CATEGORY_MAX_SCORES.get(category, 0)
 
 
 def get_category_percentage(category_score: int, category: str) -> float:
@@ -194,31 +810,62 @@ def get_category_percentage(category_score: int, category: str) -> float:
     return round((category_score / max_score * 100), 1)
 
 
-def get_score_summary(answers: dict) -> dict:
+def build_category_entry(category: str, score: int, diff) -> dict:
+    """
+    診断に保存するカテゴリー別データ1件を組み立てる
+    
+    Args:
+        category: カテゴリー名
+        score: カテゴリースコア
+        diff: 業界平均との差
+    
+    Returns:
+        {'name', 'score', 'percentage', 'diff', 'comment'} の辞書
+    """
+    max_score = CATEGORY_MAX_SCORES.get(category, 100)
+    return {
+        'name': category,
+        'score': score,
+        'percentage': (score / max_score) * 100 if max_score > 0 else 0,
+        'diff': diff,
+        'comment': f'{CATEGORIES.get(category, category)}のスコアは{score}点です。'
+    }
+
+
+def get_score_summary(answers: dict, category_stats: dict = None) -> dict:
     """
     スコアのサマリー情報を取得
     
     Args:
         answers: 診断結果の回答
+        category_stats: カテゴリー別の母集団統計（DiagnosisDatabase.get_category_stats の値。
+                       省略時は INDUSTRY_AVERAGES の固定値と比較する）
     
     Returns:
         スコアサマリー情報
     """
     scores = calculate_scores(answers)
     rank = get_readiness_rank(scores["total_score"])
-    comparison = compare_with_average(scores["category_scores"])
+    industry_statistics = get_industry_statistics(category_stats)
+    industry_averages = {
+        category: round(stats["mean"]) for category, stats in industry_statistics.items()
+    }
+    comparison = compare_with_average(scores["category_scores"], industry_averages)
     priorities = get_improvement_priorities(scores["category_scores"])
     
     # カテゴリー別のパーセンテージを計算
     category_percentages = {}
     for category, score in scores["category_scores"].items():
         category_percentages[category] = get_category_percentage(score, category)
+
     
     return {
         "scores": scores,
         "rank": rank,
         "rank_label": get_readiness_rank_label(rank),
         "comparison": comparison,
+        "industry_averages": industry_averages,
+        "industry_statistics": industry_statistics,
         "priorities": priorities,
         "category_percentages": category_percentages
     }
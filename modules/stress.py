@@ -0,0 +1,308 @@
+"""
+書き込み競合のストレステスト
+複数のプロセス（Streamlitのレプリカ相当）と各プロセス内の複数スレッドから、
+同じDBファイルに保存・一覧取得・削除を混ぜて実行し、スループット・レイテンシ・
+ロックエラー数を報告する。最後に保存した診断が1件も失われていないことを検証する。
+
+乱数の種を固定しているため、同じ引数なら毎回同じ操作列になる。--json で結果を保存し、
+ストレージ層を変更した後に --baseline で比較する。
+
+使い方:
+    python -m modules.stress --db /tmp/stress.db --processes 4 --threads 8 --ops 200
+    python -m modules.stress --db /tmp/stress.db --json before.json
+    python -m modules.stress --db /tmp/stress.db --baseline before.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from modules.answer_codec import QUESTION_BANK_IDS
+from modules.database import DiagnosisDatabase
+from modules.importer import build_diagnoses
+from modules.questions import QUESTIONS
+
+# 操作の種類と既定の比率
+OPERATIONS = ("save", "list", "delete")
+DEFAULT_MIX = {"save": 0.5, "list": 0.4, "delete": 0.1}
+
+# 質問ID -> 選択肢数
+_CHOICE_COUNTS = {
+    question["id"]: len(question["choices"])
+    for questions in QUESTIONS.values()
+    for question in questions
+}
+
+
+def _is_lock_error(error):
+    """SQLite のロック待ちタイムアウトによるエラーかどうか"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def _sample_diagnoses(rng, tag, count):
+    """保存に使う診断データを作る（session_id で今回の実行分を見分ける）"""
+    records = [
+        (
+            {"facility_name": f"ストレス施設{rng.randrange(50)}", "session_id": tag},
+            {question_id: rng.randrange(_CHOICE_COUNTS[question_id]) for question_id in QUESTION_BANK_IDS},
+            datetime.now()
+        )
+        for _ in range(count)
+    ]
+    return build_diagnoses(records, {})
+
+
+def _run_thread(db, seed, tag, ops, mix, use_async):
+    """
+    1スレッド分の操作を実行
+
+    Returns:
+        dict: 操作ごとのレイテンシ、保存・削除したID、ロックエラー数、その他のエラー
+    """
+    rng = random.Random(seed)
+    samples = _sample_diagnoses(rng, tag, 20)
+    operations = rng.choices(OPERATIONS, weights=[mix[op] for op in OPERATIONS], k=ops)
+
+    result = {
+        "latencies": {op: [] for op in OPERATIONS},
+        "saved": [],
+        "deleted": [],
+        "lock_errors": 0,
+        "errors": []
+    }
+    alive = []
+
+    for op in operations:
+        started = time.perf_counter()
+        try:
+            if op == "save":
+                diagnosis_data = rng.choice(samples)
+                if use_async:
+                    diagnosis_id = db.save_diagnosis_async(diagnosis_data).result()
+                else:
+                    diagnosis_id = db.save_diagnosis(diagnosis_data)
+                result["saved"].append(diagnosis_id)
+                alive.append(diagnosis_id)
+            elif op == "list":
+                db.list_diagnoses(limit=50, session_id=tag if rng.random() < 0.5 else None)
+            elif op == "delete":
+                if not alive:
+                    continue
+                diagnosis_id = alive.pop(rng.randrange(len(alive)))
+                if db.delete_diagnosis(diagnosis_id):
+                    result["deleted"].append(diagnosis_id)
+                else:
+                    result["errors"].append(f"delete: ID {diagnosis_id} が見つかりません")
+        except Exception as e:
+            if _is_lock_error(e):
+                result["lock_errors"] += 1
+            else:
+                result["errors"].append(f"{op}: {e!r}")
+            continue
+        result["latencies"][op].append(time.perf_counter() - started)
+
+    return result
+
+
+def _run_process(args):
+    """1プロセス分（threads 本のスレッド）の操作を実行し、結果をまとめて返す"""
+    db_path, process_index, threads, ops, mix, use_async, tag, seed = args
+    db = DiagnosisDatabase(db_path)
+
+    results = [None] * threads
+
+    def run(thread_index):
+        results[thread_index] = _run_thread(
+            db, f"{seed}-{process_index}-{thread_index}", tag, ops, mix, use_async
+        )
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    if use_async:
+        from modules.database import close_batch_writers
+        close_batch_writers()
+
+    merged = {"latencies": {op: [] for op in OPERATIONS}, "saved": [], "deleted": [],
+              "lock_errors": 0, "errors": []}
+    for result in results:
+        for op in OPERATIONS:
+            merged["latencies"][op].extend(result["latencies"][op])
+        merged["saved"].extend(result["saved"])
+        merged["deleted"].extend(result["deleted"])
+        merged["lock_errors"] += result["lock_errors"]
+        merged["errors"].extend(result["errors"])
+    return merged
+
+
+def _percentile(sorted_values, fraction):
+    """ソート済みリストのパーセンタイル（空ならNone）"""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def _histogram_total(db_path):
+    """score_histogram の総合スコアの件数の合計（集計テーブルの整合性確認用）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(
+            "SELECT COALESCE(SUM(count), 0) FROM score_histogram WHERE metric = 'total'"
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def run_stress(db_path, processes=4, threads=8, ops=200, mix=None, use_async=False, seed=0):
+    """
+    ストレステストを実行
+
+    Args:
+        db_path (str): 対象DBファイルのパス
+        processes (int): プロセス数
+        threads (int): 1プロセスあたりのスレッド数
+        ops (int): 1スレッドあたりの操作数
+        mix (dict): 操作ごとの比率（省略時は DEFAULT_MIX）
+        use_async (bool): 保存に save_diagnosis_async を使うかどうか
+        seed (int): 乱数の種
+
+    Returns:
+        dict: 集計結果（throughput, operations, lock_errors, errors, lost_writes, ...）
+    """
+    mix = mix or DEFAULT_MIX
+    tag = f"stress-{uuid.uuid4().hex[:8]}"
+
+    # スキーマ作成を先に済ませ、全プロセスが同じ条件で始まるようにする
+    DiagnosisDatabase(db_path)
+    histogram_before = _histogram_total(db_path)
+
+    context = multiprocessing.get_context("spawn")
+    started = time.perf_counter()
+    with context.Pool(processes) as pool:
+        results = pool.map(_run_process, [
+            (db_path, i, threads, ops, mix, use_async, tag, seed) for i in range(processes)
+        ])
+    elapsed = time.perf_counter() - started
+
+    latencies = {op: sorted(v for r in results for v in r["latencies"][op]) for op in OPERATIONS}
+    saved = {i for r in results for i in r["saved"]}
+    deleted = {i for r in results for i in r["deleted"]}
+
+    # 失われた書き込みの検証: 今回保存して削除していない診断が全て残っているか
+    conn = sqlite3.connect(db_path)
+    try:
+        remaining = {row[0] for row in conn.execute(
+            "SELECT id FROM diagnoses WHERE session_id = ?", (tag,)
+        )}
+    finally:
+        conn.close()
+    expected = saved - deleted
+    histogram_after = _histogram_total(db_path)
+
+    completed = sum(len(v) for v in latencies.values())
+    return {
+        "processes": processes,
+        "threads": threads,
+        "ops": ops,
+        "async": use_async,
+        "elapsed": elapsed,
+        "throughput": completed / elapsed if elapsed > 0 else 0.0,
+        "operations": {
+            op: {
+                "count": len(latencies[op]),
+                "p50_ms": _ms(_percentile(latencies[op], 0.50)),
+                "p99_ms": _ms(_percentile(latencies[op], 0.99))
+            }
+            for op in OPERATIONS
+        },
+        "lock_errors": sum(r["lock_errors"] for r in results),
+        "errors": [e for r in results for e in r["errors"]],
+        "duplicate_ids": sum(len(r["saved"]) for r in results) - len(saved),
+        "lost_writes": len(expected - remaining),
+        "unexpected_rows": len(remaining - expected),
+        "histogram_drift": (histogram_after - histogram_before) - len(expected)
+    }
+
+
+def _ms(seconds):
+    """秒をミリ秒に（Noneはそのまま）"""
+    return None if seconds is None else seconds * 1000
+
+
+def _format_ms(value):
+    return "-" if value is None else f"{value:.1f}ms"
+
+
+def print_report(report, baseline=None):
+    """結果を表形式で表示（baseline があれば比較も表示）"""
+    print(f"プロセス {report['processes']} × スレッド {report['threads']} × 操作 {report['ops']}"
+          f"（{'非同期保存' if report['async'] else '同期保存'}）")
+    print(f"経過時間 {report['elapsed']:.2f}秒  スループット {report['throughput']:.0f} 操作/秒"
+          + (f"（基準 {baseline['throughput']:.0f}）" if baseline else ""))
+    print(f"{'操作':<8}{'件数':>8}{'p50':>12}{'p99':>12}")
+    for op in OPERATIONS:
+        stats = report["operations"][op]
+        line = f"{op:<8}{stats['count']:>8}{_format_ms(stats['p50_ms']):>12}{_format_ms(stats['p99_ms']):>12}"
+        if baseline:
+            base = baseline["operations"][op]
+            line += f"   基準 p50 {_format_ms(base['p50_ms'])} / p99 {_format_ms(base['p99_ms'])}"
+        print(line)
+    print(f"ロックエラー {report['lock_errors']}件"
+          + (f"（基準 {baseline['lock_errors']}件）" if baseline else ""))
+    for error in report["errors"][:10]:
+        print(f"  エラー: {error}")
+    print(f"失われた書き込み {report['lost_writes']}件, 余分な行 {report['unexpected_rows']}件, "
+          f"重複ID {report['duplicate_ids']}件, 集計テーブルのずれ {report['histogram_drift']}件")
+
+
+def main(argv=None):
+    """コマンドラインからストレステストを実行"""
+    parser = argparse.ArgumentParser(description="DiagnosisDatabase の書き込み競合ストレステスト")
+    parser.add_argument("--db", default="data/stress.db", help="対象DBファイルのパス（本番DBは指定しないこと）")
+    parser.add_argument("--processes", type=int, default=4, help="プロセス数")
+    parser.add_argument("--threads", type=int, default=8, help="1プロセスあたりのスレッド数")
+    parser.add_argument("--ops", type=int, default=200, help="1スレッドあたりの操作数")
+    parser.add_argument("--mix", default="save=0.5,list=0.4,delete=0.1", help="操作の比率")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="save_diagnosis_async で保存する")
+    parser.add_argument("--seed", type=int, default=0, help="乱数の種")
+    parser.add_argument("--json", help="結果をJSONで保存するファイル")
+    parser.add_argument("--baseline", help="比較する以前の結果（--json で保存したもの）")
+    args = parser.parse_args(argv)
+
+    mix = {op: 0.0 for op in OPERATIONS}
+    for item in args.mix.split(","):
+        op, _, weight = item.partition("=")
+        if op.strip() not in mix:
+            parser.error(f"未知の操作です: {op}")
+        mix[op.strip()] = float(weight)
+
+    report = run_stress(args.db, args.processes, args.threads, args.ops, mix, args.use_async, args.seed)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    # 書き込みが失われた・集計がずれた場合は失敗として終了コードで知らせる
+    if report["lost_writes"] or report["unexpected_rows"] or report["duplicate_ids"] or report["histogram_drift"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
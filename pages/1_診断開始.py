@@ -1,5 +1,12 @@
 import streamlit as st
 from modules.questions import QUESTIONS, CATEGORIES
+from modules.scoring import (
+    CATEGORY_MAX_SCORES,
+    get_readiness_rank,
+    get_readiness_rank_label,
+    init_live_scores,
+    update_live_scores
+)
 
 # ページ設定
 st.set_page_config(
@@ -205,12 +212,31 @@ if "answers" in st.session_state and len(st.session_state.answers) > 0:
                 del st.session_state[key]
             # 前回の値もクリア
             st.session_state.radio_previous_values = {}
+            # 途中経過のスコアもクリア
+            st.session_state.live_scores = init_live_scores({})
+            # 前の診断の保存結果もクリア
+            st.session_state.pop('save_request', None)
             st.rerun()
 
 # セッション状態の初期化（診断をやり直すボタンが押されていない場合）
 if "answers" not in st.session_state:
     st.session_state.answers = {}
 
+# 途中経過のスコア（回答変更のたびに差分で更新する）
+if "live_scores" not in st.session_state:
+    st.session_state.live_scores = init_live_scores(st.session_state.answers)
+
+
+def set_answer(q_id, answer_index):
+    """回答を保存し、途中経過のスコアを差分で更新（answer_indexがNoneなら未回答に戻す）"""
+    if st.session_state.answers.get(q_id) == answer_index:
+        return
+    if answer_index is None:
+        st.session_state.answers.pop(q_id, None)
+    else:
+        st.session_state.answers[q_id] = answer_index
+    update_live_scores(st.session_state.live_scores, q_id, answer_index)
+
 # 初回表示時、ラジオボタンのセッション状態をクリア
 if "diagnosis_initialized" not in st.session_state:
     st.session_state.diagnosis_initialized = True
@@ -272,6 +298,17 @@ with c1:
     st.progress(progress_top)
 with c2:
     st.markdown(f"**回答済み: {answered_top}/{total_questions}問**")
+
+# 途中経過のスコアと暫定ランク
+live_scores = st.session_state.live_scores
+live_rank = get_readiness_rank(live_scores["total_score"])
+st.caption(
+    f"暫定スコア **{live_scores['total_score']}点**（ランク {live_rank}: {get_readiness_rank_label(live_rank)}） ｜ "
+    + " ／ ".join(
+        f"{category_name} {live_scores['category_scores'][category]}/{CATEGORY_MAX_SCORES[category]}"
+        for category, category_name in CATEGORIES.items()
+    )
+)
 st.markdown("</div>", unsafe_allow_html=True)
 
 # 各カテゴリーの質問を表示
@@ -305,11 +342,10 @@ for category, category_name in CATEGORIES.items():
                 if isinstance(current_value, int) and current_value > 0:
                     # プレースホルダー(0)以外を回答として保存
                     answer_index = current_value - 1  # プレースホルダー分を補正
-                    st.session_state.answers[q_id] = answer_index
+                    set_answer(q_id, answer_index)
                 else:
                     # プレースホルダーの場合は未回答扱いにする
-                    if q_id in st.session_state.answers:
-                        del st.session_state.answers[q_id]
+                    set_answer(q_id, None)
             return save_answer
         
         save_answer_callback = make_save_answer_callback(question_id, radio_key)
@@ -327,11 +363,10 @@ for category, category_name in CATEGORIES.items():
         # 保存ロジック：プレースホルダー(0)以外を回答として保存
         if selected_index_with_placeholder > 0:
             answer_index = selected_index_with_placeholder - 1  # プレースホルダー分を補正
-            st.session_state.answers[question_id] = answer_index
+            set_answer(question_id, answer_index)
         else:
             # プレースホルダーの場合は未回答扱いにする
-            if question_id in st.session_state.answers:
-                del st.session_state.answers[question_id]
+            set_answer(question_id, None)
         
         # 質問間のスペース
         st.markdown("")
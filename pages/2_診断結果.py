@@ -1,3 +1,5 @@
+import sqlite3
+
 import streamlit as st
 import plotly.graph_objects as go
 from modules.scoring import (
@@ -8,9 +10,15 @@ from modules.scoring import (
     get_improvement_priorities,
     get_score_summary,
     get_category_max_score,
-    INDUSTRY_AVERAGES
+    build_category_entry,
+    find_minimum_upgrades,
+    get_top_question_gains,
+    init_live_scores,
+    update_live_scores
 )
-from modules.questions import CATEGORIES, QUESTIONS
+from modules.questions import CATEGORIES, QUESTIONS, get_question_by_id
+from modules.distribution import probability_at_least, expected_gain
+from modules.database import MigrationPendingError, get_database
 
 # ページ設定
 st.set_page_config(
@@ -26,6 +34,13 @@ if "answers" not in st.session_state or len(st.session_state.answers) == 0:
         st.switch_page("pages/1_診断開始.py")
     st.stop()
 
+# 保存済み診断の集計（読めない・集計し直しの途中の場合は固定の業界平均と理論分布で表示する）
+db = get_database()
+try:
+    category_stats = db.get_category_stats()
+except (sqlite3.Error, MigrationPendingError):
+    category_stats = {}
+
 # スコア計算
 try:
     # デバッグ: 回答データを確認
@@ -37,7 +52,7 @@ try:
             if not isinstance(answer, int):
                 st.warning(f"質問 {q_id} の回答が整数ではありません: {type(answer)} = {answer}")
     
-    summary = get_score_summary(st.session_state.answers)
+    summary = get_score_summary(st.session_state.answers, category_stats)
 except Exception as e:
     st.error(f"スコア計算中にエラーが発生しました: {str(e)}")
     import traceback
@@ -72,6 +87,17 @@ with col3:
         st.error(f"**準備度ランク: {rank}**")
     st.caption(rank_label)
 
+try:
+    population_percentiles = db.get_population_percentiles(summary['scores'])
+except (sqlite3.Error, MigrationPendingError):
+    population_percentiles = dict.fromkeys(['total', *summary['scores']['category_scores']])
+if population_percentiles['total'] is not None:
+    st.caption(f"📊 総合スコアは、これまでに保存された診断の中で {population_percentiles['total']:.0f} パーセンタイルです。")
+else:
+    # 保存済みの診断がない場合は理論分布（全選択肢が等確率）と比較
+    total_probability = probability_at_least('total', summary['scores']['total_score'])
+    st.caption(f"📊 全選択肢を等確率で選んだ場合の理論分布では、この点数以上になる確率は {total_probability * 100:.1f}% です。")
+
 st.markdown("---")
 
 # レーダーチャート
@@ -81,8 +107,10 @@ categories = list(CATEGORIES.values())
 category_keys = list(CATEGORIES.keys())
 category_scores_list = [summary['scores']['category_scores'][cat] for cat in category_keys]
 
-# 業界平均値を取得
-average_scores = [INDUSTRY_AVERAGES[cat] for cat in category_keys]
+# 業界平均値を取得（保存済み診断の集計値、件数が少ない間は固定値）
+industry_averages = summary['industry_averages']
+industry_statistics = summary['industry_statistics']
+average_scores = [industry_averages[cat] for cat in category_keys]
 
 fig = go.Figure()
 
@@ -160,6 +188,16 @@ for category, category_name in CATEGORIES.items():
             else:
                 st.info("業界平均と同等")
         
+        category_percentile = population_percentiles.get(category)
+        if category_percentile is not None:
+            st.caption(f"{category_name}は {category_percentile:.0f} パーセンタイルです（保存済み診断との比較）")
+        else:
+            st.caption(f"理論分布でこの点数以上になる確率: {probability_at_least(category, score) * 100:.1f}%")
+        
+        stats = industry_statistics[category]
+        if stats['source'] == 'population':
+            st.caption(f"業界平均 {stats['mean']:.1f}点（標準偏差 {stats['std']:.1f}, {stats['count']}施設）")
+        
         # プログレスバー
         progress_value = score / max_score if max_score > 0 else 0
         st.progress(progress_value)
@@ -205,6 +243,140 @@ for i, (category, score) in enumerate(top3, 1):
         st.info(f"💡 **改善提案**: {suggestions.get(category, '専門家に相談することをお勧めします。')}")
         st.markdown("")
 
+# 質問別の改善優先度（伸びしろ×業界平均との差）
+question_priorities = get_top_question_gains(
+    st.session_state.answers, k=5, averages=summary['industry_averages']
+)
+
+
+def _choice_probabilities(question):
+    """保存済み診断の回答比率（読めない・回答がない場合は None で一様分布）"""
+    try:
+        counts = db.get_answer_counts(question['id'])
+    except (sqlite3.Error, MigrationPendingError):
+        return None
+    if not counts:
+        return None
+    return [counts.get(index, 0) for index in range(len(question['choices']))]
+
+
+st.subheader("📌 質問別の改善優先度 TOP5")
+for i, priority in enumerate(question_priorities, 1):
+    question = get_question_by_id(priority['question_id'])
+    gain = expected_gain(priority['question_id'], priority['current_choice'], _choice_probabilities(question))
+    current_text = (
+        question['choices'][priority['current_choice']]['text']
+        if priority['current_choice'] is not None else '未回答'
+    )
+    st.markdown(
+        f"{i}. **{question['text']}**（{CATEGORIES[priority['category']]}）  \n"
+        f"　現在: {current_text} ／ 伸びしろ +{priority['headroom']}点"
+        f"（1段階以上の改善で平均 +{gain:.1f}点）"
+    )
+
+# 次のランクに届くための最小の回答改善
+next_rank_plan = find_minimum_upgrades(st.session_state.answers)
+
+st.subheader("🪜 次のランクへの最短ステップ")
+if next_rank_plan['target_rank'] is None:
+    st.success("最高ランクに到達しています。現在の取り組みを継続しましょう。")
+elif not next_rank_plan['reachable']:
+    st.info(f"ランク{next_rank_plan['target_rank']}への到達は、現在の回答からは困難です。")
+else:
+    st.write(
+        f"ランク**{next_rank_plan['target_rank']}**（{next_rank_plan['target_score']}点以上）まで、"
+        f"あと**{len(next_rank_plan['changes'])}問**の改善で到達できます。"
+    )
+    for step, change in enumerate(next_rank_plan['changes'], 1):
+        question = get_question_by_id(change['question_id'])
+        current_text = (
+            question['choices'][change['current_choice']]['text']
+            if change['current_choice'] is not None else '未回答'
+        )
+        new_text = question['choices'][change['new_choice']]['text']
+        st.markdown(
+            f"{step}. **{question['text']}**（{CATEGORIES[change['category']]}）  \n"
+            f"　{current_text} → **{new_text}**（+{change['gain']}点）"
+        )
+
+st.markdown("---")
+
+# ======================================
+# What-if シミュレーター
+# ======================================
+@st.fragment
+def render_what_if_panel(answers, average_scores):
+    """回答を仮に変更したときのスコア・ランクを表示（このパネルだけ再実行される）"""
+    st.subheader("🧪 What-if シミュレーター")
+    st.caption("質問の回答を仮に変更すると、スコアとランクがどう変わるかをすぐに確認できます。")
+    
+    # 実際の回答のスコア状態をもとに、変更した質問の分だけ差分で再計算
+    base_state = init_live_scores(answers)
+    what_if_state = init_live_scores(answers)
+    
+    question_options = [q['id'] for category_key in CATEGORIES for q in QUESTIONS[category_key]]
+    changed_ids = st.multiselect(
+        "変更する質問を選択",
+        options=question_options,
+        format_func=lambda q_id: f"{q_id}: {get_question_by_id(q_id)['text']}",
+        key="whatif_questions"
+    )
+    
+    for q_id in changed_ids:
+        question = get_question_by_id(q_id)
+        current_choice = answers.get(q_id)
+        choice_indices = list(range(len(question['choices'])))
+        new_choice = st.selectbox(
+            question['text'],
+            options=choice_indices,
+            index=current_choice if current_choice in choice_indices else 0,
+            format_func=lambda i, q=question: f"{q['choices'][i]['text']}（{q['choices'][i]['score']}点）",
+            key=f"whatif_choice_{q_id}"
+        )
+        update_live_scores(what_if_state, q_id, new_choice)
+    
+    base_total = base_state['total_score']
+    what_if_total = what_if_state['total_score']
+    what_if_rank = get_readiness_rank(what_if_total)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("総合スコア（仮）", f"{what_if_total}点", delta=what_if_total - base_total)
+    with col2:
+        st.metric("準備度ランク（仮）", f"{what_if_rank}（{get_readiness_rank_label(what_if_rank)}）")
+    
+    what_if_fig = go.Figure()
+    what_if_fig.add_trace(go.Scatterpolar(
+        r=[base_state['category_scores'][cat] for cat in CATEGORIES],
+        theta=list(CATEGORIES.values()),
+        fill='toself',
+        name='現在',
+        line=dict(color='#1f77b4', width=2),
+        opacity=0.5
+    ))
+    what_if_fig.add_trace(go.Scatterpolar(
+        r=[what_if_state['category_scores'][cat] for cat in CATEGORIES],
+        theta=list(CATEGORIES.values()),
+        fill='toself',
+        name='変更後',
+        line=dict(color='#10b981', width=3)
+    ))
+    what_if_fig.add_trace(go.Scatterpolar(
+        r=average_scores,
+        theta=list(CATEGORIES.values()),
+        name='業界平均',
+        line=dict(color='#ff7f0e', dash='dash', width=2)
+    ))
+    what_if_fig.update_layout(
+        polar=dict(radialaxis=dict(visible=True, range=[0, max_max_score])),
+        showlegend=True,
+        height=450
+    )
+    st.plotly_chart(what_if_fig, use_container_width=True)
+
+
+render_what_if_panel(st.session_state.answers, average_scores)
+
 st.markdown("---")
 
 # 次のアクション
@@ -234,6 +406,8 @@ with col1:
     if st.button("🔄 診断をやり直す", use_container_width=True):
         # セッション状態をクリア
         st.session_state.answers = {}
+        st.session_state.pop('live_scores', None)
+        st.session_state.pop('save_request', None)
         # ラジオボタンのセッション状態もクリア
         keys_to_delete = [key for key in st.session_state.keys() if key.startswith("radio_")]
         for key in keys_to_delete:
@@ -252,7 +426,6 @@ with col3:
 # ======================================
 # データベース保存とエクスポート機能
 # ======================================
-from modules.database import DiagnosisDatabase
 from modules.pdf_generator import DiagnosticPDFGenerator
 from modules.report_exporter import ReportExporter
 from datetime import datetime
@@ -260,9 +433,6 @@ from datetime import datetime
 st.markdown("---")
 st.header("📤 結果の保存とエクスポート")
 
-# データベース初期化
-db = DiagnosisDatabase()
-
 # 必要な変数をsummaryから取得
 total_score = summary['scores']['total_score']
 max_score = summary['scores']['max_score']
@@ -290,13 +460,7 @@ diagnosis_data = {
     'percentage': percentage,
     'rank': rank,
     'categories': [
-        {
-            'name': category,
-            'score': score,
-            'percentage': (score / max_scores.get(category, 100)) * 100 if max_scores.get(category, 100) > 0 else 0,
-            'diff': score - comparison.get(category, 0),
-            'comment': f'{CATEGORIES.get(category, category)}のスコアは{score}点です。'
-        }
+        build_category_entry(category, score, comparison.get(category, 0))
         for category, score in category_scores.items()
     ],
     'answers': [
@@ -332,6 +496,10 @@ top3_improvements = [
 ]
 
 diagnosis_data['top3_improvements'] = top3_improvements
+diagnosis_data['next_rank_plan'] = next_rank_plan
+diagnosis_data['question_priorities'] = question_priorities
+diagnosis_data['industry_averages'] = industry_averages
+diagnosis_data['population_percentiles'] = population_percentiles
 
 # エクスポートボタン
 col1, col2, col3, col4 = st.columns(4)
@@ -339,13 +507,54 @@ col1, col2, col3, col4 = st.columns(4)
 exporter = ReportExporter()
 pdf_gen = DiagnosticPDFGenerator()
 
+
+# 保存依頼はこの回答の組み合わせに対するものとして記録する（別の診断には結果を表示しない）
+answers_key = tuple(sorted(st.session_state.answers.items()))
+save_request = st.session_state.get('save_request')
+if save_request is not None and save_request['answers_key'] != answers_key:
+    save_request = None
+    del st.session_state['save_request']
+
+
+def render_save_status():
+    """保存依頼の結果を表示（書き込み中はこの部分だけ再実行して完了を待つ）"""
+    request = st.session_state.get('save_request')
+    if request is None:
+        return
+    future = request['future']
+    if not future.done():
+        st.info("💾 保存しています...")
+        return
+    if request['polling']:
+        # 定期実行を止めるため、完了したらページ全体を再実行して表示し直す
+        request['polling'] = False
+        st.rerun()
+    try:
+        st.success(f"✅ 診断結果を保存しました（ID: {future.result()}）")
+    except Exception as e:
+        st.error(f"❌ 保存エラー: {e}")
+
+
 with col1:
     if st.button("💾 履歴に保存", type="primary", use_container_width=True):
         try:
-            diagnosis_id = db.save_diagnosis(diagnosis_data)
-            st.success(f"✅ 診断結果を保存しました（ID: {diagnosis_id}）")
+            # 書き込みスレッドが他のセッションの保存とまとめて書き込む。
+            # 書き込みの完了は待たず、結果は render_save_status が表示する
+            save_request = {
+                'answers_key': answers_key,
+                'future': db.save_diagnosis_async(diagnosis_data, timeout=10),
+                'polling': False
+            }
+            st.session_state.save_request = save_request
         except Exception as e:
             st.error(f"❌ 保存エラー: {e}")
+    
+    if save_request is not None:
+        save_request['polling'] = not save_request['future'].done()
+    st.fragment(
+        render_save_status,
+        run_every=0.5 if save_request is not None and save_request['polling'] else None
+    )()
 
 with col2:
     # JSON ダウンロード
@@ -5,9 +5,13 @@
 
 import streamlit as st
 import pandas as pd
+import tempfile
 from datetime import datetime
 import plotly.graph_objects as go
-from modules.database import DiagnosisDatabase
+from modules.bulk_export import EXPORT_FORMATS, write_export
+from modules.columnar_export import format_summary_table, summaries_to_table
+from modules.database import get_database
+from modules.scoring import MAX_SCORE, READINESS_RANKS
 from modules.pdf_generator import DiagnosticPDFGenerator
 from modules.report_exporter import ReportExporter
 
@@ -19,7 +23,7 @@ st.set_page_config(
 )
 
 # データベース初期化
-db = DiagnosisDatabase()
+db = get_database()
 
 # タイトル
 st.title("📚 診断履歴")
@@ -34,45 +38,176 @@ st.sidebar.header("🔍 フィルター")
 filter_session = st.sidebar.checkbox("現在のセッションのみ表示", value=False)
 session_id = st.session_state.get('session_id', None) if filter_session else None
 
-# 診断履歴を取得
-if filter_session and session_id:
-    diagnoses = db.get_recent_diagnoses(limit=100, session_id=session_id)
-else:
-    diagnoses = db.get_all_diagnoses()
+# 診断日フィルター
+date_range = st.sidebar.date_input("診断日", value=(), help="開始日と終了日を選択してください")
+date_from = date_range[0] if len(date_range) >= 1 else None
+date_to = date_range[1] if len(date_range) >= 2 else date_from
+
+# ランクフィルター
+ranks = st.sidebar.multiselect(
+    "ランク",
+    options=list(READINESS_RANKS),
+    format_func=lambda r: f"{r}（{READINESS_RANKS[r]['label']}）"
+)
+
+# 総合スコア・達成率フィルター
+score_range = st.sidebar.slider("総合スコア", 0, MAX_SCORE, (0, MAX_SCORE), step=5)
+percentage_range = st.sidebar.slider("達成率（%）", 0, 100, (0, 100))
+
+# 施設名フィルター（部分一致で候補を検索して選ぶ）
+facility_query = st.sidebar.text_input("施設名を検索", placeholder="施設名の一部を入力")
+facility_name = ''
+if facility_query.strip():
+    facility_matches = db.search_facilities(facility_query, limit=20)
+    if facility_matches:
+        facility_name = st.sidebar.selectbox(
+            "施設",
+            options=[match['name'] for match in facility_matches],
+            format_func=lambda name: f"{name}（{next(m['diagnosis_count'] for m in facility_matches if m['name'] == name)}件）"
+        )
+    else:
+        st.sidebar.caption("該当する施設がありません")
+
+# ユーザーIDフィルター（完全一致）
+user_id = st.sidebar.text_input("ユーザーID").strip()
+
+filters = {
+    'session_id': session_id,
+    'user_id': user_id or None,
+    'facility_name': facility_name or None,
+    'date_from': date_from,
+    'date_to': date_to,
+    'ranks': ranks or None,
+    'min_score': score_range[0] if score_range[0] > 0 else None,
+    'max_score': score_range[1] if score_range[1] < MAX_SCORE else None,
+    'min_percentage': percentage_range[0] if percentage_range[0] > 0 else None,
+    'max_percentage': percentage_range[1] if percentage_range[1] < 100 else None,
+}
+
+# 1ページの表示件数
+page_size = st.sidebar.selectbox("1ページの表示件数", options=[20, 50, 100], index=1)
+
+# ページ位置（各ページ先頭のカーソル）をフィルター条件ごとに保持
+page_key = (tuple(sorted((k, str(v)) for k, v in filters.items())), page_size)
+if st.session_state.get('history_page_key') != page_key:
+    st.session_state.history_page_key = page_key
+    st.session_state.history_cursors = [None]
+
+# 診断履歴を取得（一覧に必要な列だけを1ページ分、絞り込みはDB側で行う）
+diagnoses, next_cursor = db.list_diagnoses(
+    after=st.session_state.history_cursors[-1],
+    limit=page_size,
+    **filters
+)
+filtered = any(value is not None for value in filters.values())
+page_number = len(st.session_state.history_cursors)
+diagnosis_labels = {
+    d.id: f"ID: {d.id} - {d.diagnosis_date.strftime('%Y-%m-%d %H:%M')}"
+    for d in diagnoses
+}
 
 # ======================================
 # メインコンテンツ
 # ======================================
 
-if not diagnoses:
+if not diagnoses and page_number == 1 and filtered:
+    st.info("🔍 条件に合う診断履歴がありません。フィルターを変更してください。")
+    st.stop()
+
+if not diagnoses and page_number == 1:
     st.info("📭 診断履歴がありません。まずは診断を実施してください。")
     if st.button("🏥 診断を開始する"):
         st.switch_page("pages/1_🏥_診断開始.py")
     st.stop()
 
-st.success(f"✅ {len(diagnoses)}件の診断履歴が見つかりました")
+st.success(f"✅ {page_number}ページ目: {len(diagnoses)}件の診断履歴を表示しています")
 
 # ======================================
 # 診断履歴一覧
 # ======================================
 st.header("📋 診断履歴一覧")
 
-# データフレーム作成
-df = pd.DataFrame([
-    {
-        'ID': d['id'],
-        '診断日時': d['diagnosis_date'].strftime('%Y-%m-%d %H:%M'),
-        '施設名': d['facility_name'] if d['facility_name'] else '（未入力）',
-        '総合スコア': f"{d['total_score']}/{d['max_score']}",
-        '達成率': f"{d['percentage']:.1f}%",
-        'ランク': d['rank']
-    }
-    for d in diagnoses
-])
+# データフレーム作成（Arrow のテーブルを経由して列ごとに作る）
+df = format_summary_table(summaries_to_table(diagnoses))
 
 # 表示
 st.dataframe(df, use_container_width=True, hide_index=True)
 
+# ページ送り
+col1, col2, col3 = st.columns([1, 2, 1])
+
+with col1:
+    if st.button("◀ 前のページ", disabled=page_number == 1, use_container_width=True):
+        st.session_state.history_cursors.pop()
+        st.rerun()
+
+with col3:
+    if st.button("次のページ ▶", disabled=next_cursor is None, use_container_width=True):
+        st.session_state.history_cursors.append(next_cursor)
+        st.rerun()
+
+# 全件エクスポート（クリックされたときに一時ファイルへ1行ずつ書き出す）
+def export_all(export_format):
+    def build():
+        fp = tempfile.TemporaryFile()
+        write_export(db, fp, export_format)
+        fp.seek(0)
+        return fp
+    return build
+
+with st.expander("📦 全ての診断をエクスポート"):
+    st.caption("アーカイブ済みを含む全ての診断を書き出します（フィルターは適用されません）")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="📄 NDJSON",
+            data=export_all('ndjson'),
+            file_name=f"診断履歴_{datetime.now().strftime('%Y%m%d')}.ndjson",
+            mime=EXPORT_FORMATS['ndjson'],
+            on_click="ignore",
+            use_container_width=True
+        )
+    with col2:
+        st.download_button(
+            label="📊 CSV",
+            data=export_all('csv'),
+            file_name=f"診断履歴_{datetime.now().strftime('%Y%m%d')}.csv",
+            mime=EXPORT_FORMATS['csv'],
+            on_click="ignore",
+            use_container_width=True
+        )
+
+if not diagnoses:
+    st.stop()
+
+# ======================================
+# 全体の傾向（集計テーブルから取得）
+# ======================================
+with st.expander("📊 全体の傾向"):
+    daily_summary = db.get_daily_summary(date_from=date_from, date_to=date_to)
+    rank_distribution = db.get_rank_distribution(date_from=date_from, date_to=date_to)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        fig_daily = go.Figure(go.Bar(
+            x=[row['day'] for row in daily_summary],
+            y=[row['count'] for row in daily_summary],
+            name="診断件数"
+        ))
+        fig_daily.update_layout(title="日別の診断件数", xaxis_title="診断日", yaxis_title="件数", height=350)
+        st.plotly_chart(fig_daily, use_container_width=True)
+
+    with col2:
+        fig_ranks = go.Figure(go.Bar(
+            x=[f"{rank}（{READINESS_RANKS[rank]['label']}）" if rank in READINESS_RANKS else rank
+               for rank in rank_distribution],
+            y=list(rank_distribution.values()),
+            name="件数"
+        ))
+        fig_ranks.update_layout(title="ランク分布", xaxis_title="ランク", yaxis_title="件数", height=350)
+        st.plotly_chart(fig_ranks, use_container_width=True)
+
 # ======================================
 # 詳細表示・エクスポート機能
 # ======================================
@@ -80,8 +215,8 @@ st.header("🔍 診断結果の詳細")
 
 selected_id = st.selectbox(
     "表示する診断を選択してください",
-    options=[d['id'] for d in diagnoses],
-    format_func=lambda x: f"ID: {x} - {next((d['diagnosis_date'].strftime('%Y-%m-%d %H:%M') for d in diagnoses if d['id'] == x), '')}"
+    options=list(diagnosis_labels),
+    format_func=lambda x: diagnosis_labels.get(x, f"ID: {x}")
 )
 
 if selected_id:
@@ -179,8 +314,8 @@ if len(diagnoses) >= 2:
     # 比較する診断を選択
     compare_ids = st.multiselect(
         "比較する診断を選択してください（2〜5件）",
-        options=[d['id'] for d in diagnoses],
-        format_func=lambda x: f"ID: {x} - {next((d['diagnosis_date'].strftime('%Y-%m-%d %H:%M') for d in diagnoses if d['id'] == x), '')}",
+        options=list(diagnosis_labels),
+        format_func=lambda x: diagnosis_labels.get(x, f"ID: {x}"),
         max_selections=5
     )
     
@@ -250,22 +385,33 @@ else:
 st.markdown("---")
 st.header("🗑️ 診断履歴の削除")
 
+# 削除後の再実行で結果を表示する
+delete_message = st.session_state.pop('delete_message', None)
+if delete_message:
+    st.success(delete_message)
+
 with st.expander("⚠️ 診断を削除する"):
-    st.warning("削除した診断は復元できません。慎重に操作してください。")
+    st.warning("削除した診断は一覧や集計からすぐに除かれ、データもバックグラウンドで完全に削除されます。慎重に操作してください。")
     
-    delete_id = st.selectbox(
+    # アーカイブ済みの診断は削除の対象外
+    deletable_ids = set(db.get_deletable_ids(list(diagnosis_labels)))
+    delete_ids = st.multiselect(
         "削除する診断を選択",
-        options=[d['id'] for d in diagnoses],
-        format_func=lambda x: f"ID: {x} - {next((d['diagnosis_date'].strftime('%Y-%m-%d %H:%M') for d in diagnoses if d['id'] == x), '')}",
+        options=[diagnosis_id for diagnosis_id in diagnosis_labels if diagnosis_id in deletable_ids],
+        format_func=lambda x: diagnosis_labels.get(x, f"ID: {x}"),
         key="delete_select"
     )
+    archived_count = len(diagnosis_labels) - len(deletable_ids)
+    if archived_count:
+        st.caption(f"アーカイブ済みの診断（このページの{archived_count}件）は削除できません")
     
     col1, col2 = st.columns([3, 1])
     
     with col2:
-        if st.button("🗑️ 削除実行", type="secondary", use_container_width=True):
-            if db.delete_diagnosis(delete_id):
-                st.success(f"✅ ID: {delete_id} の診断を削除しました")
+        if st.button("🗑️ 削除実行", type="secondary", use_container_width=True, disabled=not delete_ids):
+            deleted_count = db.delete_diagnoses(delete_ids, soft=True)
+            if deleted_count:
+                st.session_state.delete_message = f"✅ {deleted_count}件の診断を削除しました"
                 st.rerun()
             else:
                 st.error("❌ 削除に失敗しました")
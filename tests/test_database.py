@@ -0,0 +1,168 @@
+"""
+診断履歴データベースの移行のテスト
+"""
+
+import json
+from datetime import datetime
+
+import pytest
+
+from modules import database
+from modules.answer_codec import rehydrate_answers
+from modules.database import DiagnosisDatabase, MigrationPendingError
+from modules.importer import build_diagnoses
+from modules.query_plans import generate_diagnoses
+from modules.scoring import QUESTION_IDS
+
+
+# 2件目は現在の質問バンクにない質問への回答を含む
+EXTRA_ANSWERS = [[], [{"question_id": "retired_q", "answer": 1}]]
+
+
+def _save_legacy(db, answers_list):
+    """回答JSONだけを持つ（回答バイト列導入前の形式の）診断を保存"""
+    ids = db.save_diagnoses(build_diagnoses(
+        [({"facility_name": "テスト施設"}, answers, datetime.now()) for answers in answers_list], {}
+    ))
+    with db._connection(write=True) as conn:
+        conn.executemany('''
+            UPDATE diagnoses SET answers_json = ?, answers_blob = NULL, question_bank_version = NULL
+            WHERE id = ?
+        ''', [
+            (json.dumps(rehydrate_answers(answers) + extra, ensure_ascii=False), diagnosis_id)
+            for diagnosis_id, answers, extra in zip(ids, answers_list, EXTRA_ANSWERS)
+        ])
+    return ids
+
+
+def _stored(db, ids):
+    with db._connection() as conn:
+        return {
+            diagnosis_id: (answers_json, answers_blob)
+            for diagnosis_id, answers_json, answers_blob in conn.execute(
+                'SELECT id, answers_json, answers_blob FROM diagnoses ORDER BY id'
+            )
+            if diagnosis_id in ids
+        }
+
+
+def test_compaction_is_opt_in_and_keeps_unencodable_answers(tmp_path):
+    path = tmp_path / "diagnoses.db"
+    answers = {question_id: index % 3 for index, question_id in enumerate(QUESTION_IDS)}
+    ids = _save_legacy(DiagnosisDatabase(str(path)), [answers, answers])
+
+    # 別プロセスでの起動と同じく初期化からやり直しても、回答JSONは消えない
+    database._INITIALIZED_PATHS.discard(str(path.resolve()))
+    db = DiagnosisDatabase(str(path))
+    assert all(answers_json and blob is None for answers_json, blob in _stored(db, ids).values())
+
+    assert db.compact_answers() == 1
+    stored = _stored(db, ids)
+    assert stored[ids[0]][0] == "" and stored[ids[0]][1] is not None
+    assert "retired_q" in stored[ids[1]][0] and stored[ids[1]][1] is None
+
+    for diagnosis_id in ids:
+        record = db.get_diagnosis_by_id(diagnosis_id)
+        assert {a["question_id"]: a["answer"] for a in record["answers"]
+                if a["question_id"] in answers} == answers
+
+
+def _population_from_rows(db):
+    """集計テーブルと同じ値を論理削除されていない診断から数え直す"""
+    stats, histogram = {}, {}
+    with db._connection() as conn:
+        for categories_json, total_score in conn.execute(
+            'SELECT categories_json, total_score FROM diagnoses WHERE deleted_at IS NULL'
+        ):
+            for cat in json.loads(categories_json):
+                values = stats.setdefault(cat['name'], [0, 0, 0])
+                values[0] += 1
+                values[1] += cat['score']
+                values[2] += cat['score'] ** 2
+                histogram[(cat['name'], cat['score'])] = histogram.get((cat['name'], cat['score']), 0) + 1
+            histogram[('total', total_score)] = histogram.get(('total', total_score), 0) + 1
+    return stats, histogram
+
+
+def _population_tables(db):
+    with db._connection() as conn:
+        stats = {
+            category: [count, score_sum, score_sum_sq]
+            for category, count, score_sum, score_sum_sq in conn.execute('SELECT * FROM category_stats')
+            if count
+        }
+        histogram = {
+            (metric, score): count
+            for metric, score, count in conn.execute('SELECT * FROM score_histogram')
+            if count
+        }
+    return stats, histogram
+
+
+def test_population_backfill_runs_in_chunks_alongside_writes(tmp_path, monkeypatch):
+    path = tmp_path / "diagnoses.db"
+    db = DiagnosisDatabase(str(path))
+    generate_diagnoses(db, 60)
+
+    # 集計テーブルより前のDBを再現し、起動時には集計し直さないようにする
+    with db._connection(write=True) as conn:
+        conn.execute('DELETE FROM category_stats')
+        conn.execute('DELETE FROM score_histogram')
+        conn.execute("DELETE FROM migration_state WHERE name = 'population_aggregates'")
+    monkeypatch.setattr(database, "INLINE_BACKFILL_LIMIT", 0)
+    database._INITIALIZED_PATHS.discard(str(path.resolve()))
+    db = DiagnosisDatabase(str(path))
+
+    with pytest.raises(MigrationPendingError):
+        db.get_category_stats()
+
+    def write_between_chunks(done):
+        # 集計済みの診断・まだの診断の両方に、保存・削除・再採点が入る
+        if done == 20:
+            generate_diagnoses(db, 5, seed=1)
+            db.delete_diagnoses([3, 45])
+            db.delete_diagnoses([4, 50], soft=True)
+            with db._connection() as conn:
+                rows = conn.execute(
+                    'SELECT id, total_score, max_score, categories_json FROM diagnoses WHERE id IN (5, 55)'
+                ).fetchall()
+            score_rows = []
+            for diagnosis_id, total_score, max_score, categories_json in rows:
+                categories = json.loads(categories_json)
+                categories[0]['score'] += 1
+                score_rows.append((total_score + 1, max_score, 0.0, 'E',
+                                   json.dumps(categories), 'test', diagnosis_id))
+            db.update_scores(score_rows)
+
+    db.backfill_population(chunk_size=10, progress=write_between_chunks)
+
+    assert _population_tables(db) == _population_from_rows(db)
+    assert db.get_category_stats()
+
+
+def test_hard_delete_counts_only_live_diagnoses(tmp_path):
+    db = DiagnosisDatabase(str(tmp_path / "diagnoses.db"))
+    generate_diagnoses(db, 4)
+
+    assert db.delete_diagnoses([1, 2], soft=True) == 2
+    assert db.delete_diagnoses([1, 2, 3]) == 1
+    assert db.delete_diagnoses([1, 2, 3]) == 0
+
+
+def test_record_categories_round_trip_through_compact_form(tmp_path):
+    db = DiagnosisDatabase(str(tmp_path / "diagnoses.db"))
+    generate_diagnoses(db, 2)
+    ids = [1, 2]
+    edited = [{"name": "business", "score": 10, "percentage": 10.0, "diff": 2.5, "comment": "手で編集"}]
+    with db._connection(write=True) as conn:
+        conn.execute('UPDATE diagnoses SET categories_json = ? WHERE id = ?', (json.dumps(edited), ids[1]))
+        stored = {
+            diagnosis_id: json.loads(categories_json)
+            for diagnosis_id, categories_json in conn.execute('SELECT id, categories_json FROM diagnoses')
+        }
+
+    for diagnosis_id in ids:
+        record = db.get_diagnosis_by_id(diagnosis_id)
+        assert record["categories"] == stored[diagnosis_id]
+        assert record.category_scores == {cat["name"]: cat["score"] for cat in stored[diagnosis_id]}
+    assert type(db.get_diagnosis_by_id(ids[0])._categories) is tuple
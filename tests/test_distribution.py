@@ -0,0 +1,31 @@
+"""
+理論スコア分布の改善時の増加点のテスト
+"""
+
+import numpy as np
+import pytest
+
+from modules.distribution import expected_gain
+from modules.questions import QUESTIONS
+
+QUESTION = QUESTIONS["business"][0]
+SCORES = [choice["score"] for choice in QUESTION["choices"]]
+LOWEST = SCORES.index(min(SCORES))
+
+
+def test_uniform_gain_is_mean_over_better_choices():
+    upgrades = [score - SCORES[LOWEST] for score in SCORES if score > SCORES[LOWEST]]
+
+    assert expected_gain(QUESTION["id"], LOWEST) == pytest.approx(sum(upgrades) / len(upgrades))
+    assert expected_gain(QUESTION["id"], np.int64(LOWEST)) == expected_gain(QUESTION["id"], LOWEST)
+
+
+def test_gain_is_weighted_by_choice_probabilities():
+    best = SCORES.index(max(SCORES))
+    only_best = [1 if index == best else 0 for index in range(len(SCORES))]
+
+    assert expected_gain(QUESTION["id"], LOWEST, only_best) == max(SCORES) - SCORES[LOWEST]
+    assert expected_gain(QUESTION["id"], LOWEST, [1] * len(SCORES)) == expected_gain(QUESTION["id"], LOWEST)
+    # 改善先が誰にも選ばれていない場合は等確率
+    assert expected_gain(QUESTION["id"], LOWEST, [1 if index == LOWEST else 0 for index in range(len(SCORES))]) \
+        == expected_gain(QUESTION["id"], LOWEST)
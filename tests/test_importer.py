@@ -0,0 +1,33 @@
+"""
+一括取り込みの JSON 読み込みのテスト
+"""
+
+import io
+import json
+
+from modules.importer import ImportRecordError, iter_json_records
+
+
+def _read(text):
+    return [
+        "error" if isinstance(record, ImportRecordError) else record["n"]
+        for record in iter_json_records(io.StringIO(text), read_size=16)
+    ]
+
+
+def test_ndjson_skips_malformed_records_and_continues():
+    lines = [json.dumps({"n": n, "answers": [{"a": 1}]}) for n in (1, 3, 4)]
+    text = "\n".join([lines[0], '{"n": 2, "answers": [', lines[1], "garbage", lines[2]])
+
+    assert _read(text) == [1, "error", 3, "error", 4]
+
+
+def test_pretty_printed_array_resyncs_at_next_record():
+    text = json.dumps([{"n": 1, "answers": [{"a": 1}]}, {"n": 2}, {"n": 3}], indent=2)
+
+    assert _read(text) == [1, 2, 3]
+    assert _read(text.replace('"n": 2', '"n": 2,,')) == [1, "error", 3]
+
+
+def test_truncated_last_record_is_reported():
+    assert _read(json.dumps({"n": 1}, indent=2) + '\n{"n": 2, "answ') == [1, "error"]
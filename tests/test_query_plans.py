@@ -0,0 +1,20 @@
+"""
+履歴一覧の実行計画の確認のテスト
+"""
+
+from modules.database import DiagnosisDatabase
+from modules.query_plans import check_plans, generate_diagnoses, plan_cases
+from modules.scoring import READINESS_RANKS
+
+
+def test_plan_cases_filter_on_values_in_the_database(tmp_path):
+    db = DiagnosisDatabase(str(tmp_path / "diagnoses.db"))
+    generate_diagnoses(db, 300)
+
+    cases = {name: filters for name, filters, _ in plan_cases(db)}
+    assert cases["ランク（最も少ないもの）"]["ranks"][0] in READINESS_RANKS
+
+    results = {result["name"]: result for result in check_plans(db, repeat=1)}
+    assert all(not result["problems"] for result in results.values())
+    assert results["ランク（最も少ないもの）"]["rows"] > 0
+    assert results["総合スコア（最高点のみ）"]["rows"] > 0
@@ -0,0 +1,69 @@
+"""
+スコアリングの回答値の扱いのテスト
+"""
+
+import numpy as np
+import pytest
+
+from modules.answer_codec import decode_answers, encode_answers
+from modules.importer import ImportRecordError, _parse_choice
+from modules.scoring import (
+    INDUSTRY_AVERAGES,
+    QUESTION_IDS,
+    answers_to_choice_matrix,
+    calculate_scores,
+    calculate_scores_batch,
+    get_score_summary,
+    init_live_scores,
+    percentile_from_counts
+)
+
+
+def _full_answers(choice):
+    return {question_id: choice for question_id in QUESTION_IDS}
+
+
+@pytest.mark.parametrize("choice", [np.int64(2), np.int32(2), np.uint8(2)])
+def test_numpy_ints_score_like_int(choice):
+    expected = calculate_scores(_full_answers(2))
+    answers = _full_answers(choice)
+
+    assert expected["total_score"] > 0
+    assert calculate_scores(answers) == expected
+    assert calculate_scores_batch([answers]) == [expected]
+    assert init_live_scores(answers)["total_score"] == expected["total_score"]
+    assert decode_answers(encode_answers(answers)) == _full_answers(2)
+
+
+@pytest.mark.parametrize("choice", [True, 2.0, 1.7, "2", None])
+def test_non_integer_answers_are_unanswered(choice):
+    answers = _full_answers(choice)
+
+    assert calculate_scores(answers)["total_score"] == 0
+    assert calculate_scores_batch([answers])[0]["total_score"] == 0
+    assert (answers_to_choice_matrix([answers]) == answers_to_choice_matrix([{}])).all()
+    assert decode_answers(encode_answers(answers)) == {}
+
+
+def test_import_accepts_integral_values_only():
+    assert _parse_choice("b1", " 1 ") == 1
+    assert _parse_choice("b1", 2.0) == 2
+    assert _parse_choice("b1", np.int64(2)) == 2
+    assert _parse_choice("b1", "") is None
+    for value in (True, 1.7, "1.5"):
+        with pytest.raises(ImportRecordError):
+            _parse_choice("b1", value)
+
+
+def test_score_summary_uses_given_population_without_database():
+    answers = _full_answers(2)
+    category_stats = {"business": {"count": 50, "mean": 40.0, "std": 5.0}}
+
+    fixed = get_score_summary(answers)
+    population = get_score_summary(answers, category_stats)
+
+    assert fixed["industry_averages"] == INDUSTRY_AVERAGES
+    assert population["industry_statistics"]["business"]["source"] == "population"
+    assert population["comparison"]["business"] == calculate_scores(answers)["category_scores"]["business"] - 40
+    assert percentile_from_counts(1, 2, 4) == 50.0
+    assert percentile_from_counts(0, 0, 0) is None